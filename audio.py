@@ -0,0 +1,89 @@
+# Sound event manager for Pickle Ball
+#
+# Game code asks for a sound with play(name) wherever it happens, physics
+# included; nothing reaches the mixer until update() drains the queue once
+# per frame. Requests for the same sound in one frame merge into one play,
+# a sound never restarts sooner than its minimum retrigger interval, and
+# each category of sounds plays on its own reserved mixer channels, so a
+# ball running along a wall cannot take every channel.
+#
+# NullAudio has the same interface and drops everything, for headless
+# simulation and whenever the mixer is unavailable.
+
+import time
+
+import pygame
+
+
+class NullAudio:
+    def play(self, name):
+        pass
+
+    def update(self):
+        pass
+
+    def stop(self):
+        pass
+
+
+class AudioManager:
+    def __init__(self, sounds, categories, channels, min_interval):
+        # sounds maps names to pygame Sounds, categories names to category,
+        # channels category to the number of mixer channels reserved for
+        # it, and min_interval names to seconds between plays
+        self.sounds = sounds
+        self.categories = categories
+        self.min_interval = min_interval
+
+        # Reserve the pools at the front of the mixer's channels, so
+        # Sound.play() elsewhere cannot take them
+        total = sum(channels.values())
+        if pygame.mixer.get_num_channels() < total:
+            pygame.mixer.set_num_channels(total)
+        pygame.mixer.set_reserved(total)
+        self.pools = {}
+        first = 0
+        for category, count in channels.items():
+            self.pools[category] = [pygame.mixer.Channel(number) for number in range(first, first + count)]
+            first += count
+
+        # Sounds requested this frame, in order, with duplicates merged
+        self.pending = {}
+        self.last_played = dict.fromkeys(sounds, -float('inf'))
+        # When each channel started its current sound, to pick the oldest
+        # to cut off when a pool is full
+        self.started = {}
+        self.merged = self.throttled = self.stolen = 0
+
+    def play(self, name):
+        if name in self.pending:
+            self.merged += 1
+        else:
+            self.pending[name] = True
+
+    def update(self):
+        if not self.pending:
+            return
+        now = time.perf_counter()
+        for name in self.pending:
+            if now - self.last_played[name] < self.min_interval.get(name, 0):
+                self.throttled += 1
+                continue
+            channel = self.free_channel(self.pools[self.categories[name]])
+            channel.play(self.sounds[name])
+            self.started[channel] = now
+            self.last_played[name] = now
+        self.pending.clear()
+
+    def free_channel(self, pool):
+        for channel in pool:
+            if not channel.get_busy():
+                return channel
+        self.stolen += 1
+        return min(pool, key=lambda channel: self.started.get(channel, 0))
+
+    def stop(self):
+        self.pending.clear()
+        for pool in self.pools.values():
+            for channel in pool:
+                channel.stop()
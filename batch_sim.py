@@ -0,0 +1,437 @@
+# Headless batch simulator for Pickle Ball
+#
+# Steps thousands of matches at once with NumPy arrays instead of one
+# pygame.Rect per object. The rules mirror Paddle, Ball and main() in
+# pickle_ball.py tick for tick: swept wall and paddle collisions, 45 degree
+# paddle bounce angle, 1.05 speed-up capped at 15, scoring and the serve
+# logic of Ball.reset. checks.py holds it to that.
+#
+# The only opponent modelled is the chasing AI, GameState(...,
+# predictive_ai=False): not the predictive AI the game plays by default
+# (PREDICTIVE_AI), nor the hard AI. Numbers tuned here describe the chasing
+# AI; tournament.py measures the opponent players actually meet.
+# Importing pickle_ball for its constants opens no window and no mixer.
+#
+# Usage: python batch_sim.py [matches] [ticks]
+
+import sys
+import time
+import numpy as np
+
+from pickle_ball import WIDTH, HEIGHT, PADDLE_WIDTH, PADDLE_HEIGHT, BALL_SIZE, PADDLE_SPEED, BALL_SPEED, MAX_SCORE
+
+# Ball.collide rules, kept in sync with pickle_ball.py
+MAX_BALL_SPEED = 15
+SPEED_UP = 1.05
+
+# Fixed paddle columns used by main()
+PLAYER_X = 20
+AI_X = WIDTH - 20 - PADDLE_WIDTH
+
+# What a ball runs into, indexed by its direction (1 heading right or
+# down): the paddle column ahead, the ball's x as it touches that paddle's
+# face and as it leaves past its far side, the goal line and the wall
+PADDLE_COLUMNS = np.array([PLAYER_X, AI_X])
+NEAR_FACE = np.array([PLAYER_X + PADDLE_WIDTH, AI_X - BALL_SIZE], dtype=np.float64)
+FAR_FACE = np.array([PLAYER_X - BALL_SIZE, AI_X + PADDLE_WIDTH], dtype=np.float64)
+GOAL_LINE = np.array([0, WIDTH - BALL_SIZE], dtype=np.float64)
+WALL_LINE = np.array([0, HEIGHT - BALL_SIZE], dtype=np.float64)
+
+# Values for last_scorer
+NO_SCORER, AI_SCORER, PLAYER_SCORER = 0, 1, 2
+
+SERVE_Y_FACTORS = np.array([-0.7, -0.3, 0.3, 0.7])
+
+# Balls ending a tick at least this far from the walls and the paddle
+# columns cannot have hit anything on the way and skip the event loop
+CLEARANCE = 1e-6
+
+
+def rect_round(values, out, scratch):
+    # pygame.Rect rounds float coordinates half away from zero. Ball
+    # positions never go below -0.5, where that is truncating value + 0.5.
+    np.add(values, 0.5, out=scratch)
+    np.copyto(out, scratch, casting='unsafe')
+    return out
+
+
+def lattice_bounds(start, speed, limit):
+    # Paddle.move only checks the edge before stepping, so a paddle starting
+    # at `start` can overshoot to one lattice point past 0 and `limit`. With
+    # one direction per tick its motion is exactly a clip to these bounds.
+    low = start % speed - speed if start % speed else 0
+    high = limit - (limit - start) % speed + speed if (limit - start) % speed else limit
+    return low, high
+
+
+class BatchSimulator:
+    # Matches against the chasing AI only, like GameState(...,
+    # predictive_ai=False, hard_ai=False); see the top of this file
+    def __init__(self, matches, difficulty=1, player_difficulty=None, seed=None):
+        self.n = matches
+        self.rng = np.random.default_rng(seed)
+
+        # Difficulty can be one level for every match or one per match.
+        # Row 0 of the paddle arrays is the player, row 1 the AI.
+        if player_difficulty is None:
+            player_difficulty = difficulty
+        self.difficulty = np.empty((2, matches), dtype=np.int64)
+        self.difficulty[0] = player_difficulty
+        self.difficulty[1] = difficulty
+        self.chase_threshold, self.chase_scale, self.chase_offset = self.chase_tables(self.difficulty)
+
+        # Per-match xorshift32 streams: each 32-bit draw splits into one
+        # 16-bit draw per paddle
+        self.rng_state = self.rng.integers(1, 2 ** 32, matches, dtype=np.uint32)
+
+        # Paddles start centered and stay on a lattice of PADDLE_SPEED steps
+        start_y = HEIGHT // 2 - PADDLE_HEIGHT // 2
+        self.paddle_bounds = lattice_bounds(start_y, PADDLE_SPEED, HEIGHT - PADDLE_HEIGHT)
+        self.paddle_y = np.full((2, matches), start_y, dtype=np.int16)
+        self.player_y = self.paddle_y[0]
+        self.ai_y = self.paddle_y[1]
+        self.incoming = np.empty((2, matches), dtype=bool)
+        self.draws = np.empty((2, matches), dtype=np.uint32)
+        # chase() works in these instead of allocating every tick
+        self.jitter = np.empty((2, matches), dtype=np.uint32)
+        self.target_y = np.empty((2, matches), dtype=np.int16)
+        self.toward = np.empty((2, matches), dtype=np.int8)
+        self.recenter = np.empty((2, matches), dtype=np.int8)
+        self.react = np.empty((2, matches), dtype=bool)
+        self.above = np.empty((2, matches), dtype=bool)
+        self.below = np.empty((2, matches), dtype=bool)
+
+        # Ball state; ball_x/ball_y are exact positions and rect_y the rounded
+        # top edge the AI reads from Ball.rect
+        self.ball_x = np.full(matches, WIDTH // 2 - BALL_SIZE // 2, dtype=np.float64)
+        self.ball_y = np.full(matches, HEIGHT // 2 - BALL_SIZE // 2, dtype=np.float64)
+        self.speed_x = np.full(matches, BALL_SPEED, dtype=np.float64)
+        self.speed_y = np.full(matches, BALL_SPEED, dtype=np.float64)
+        self.rect_y = np.empty(matches, dtype=np.int16)
+        self.z_position = np.zeros(matches)
+        self.z_speed = np.full(matches, 0.2)
+        self.max_z = 10
+        self.scratch = np.empty(matches)
+        # Buffers step() reuses every tick instead of allocating: the ball's
+        # end position, which becomes its position, and the collision masks
+        self.end_x = np.empty(matches)
+        self.end_y = np.empty(matches)
+        self.blocked = np.empty(matches, dtype=bool)
+        self.mask = np.empty(matches, dtype=bool)
+
+        # Scores and match progress
+        self.player_score = np.zeros(matches, dtype=np.int32)
+        self.ai_score = np.zeros(matches, dtype=np.int32)
+        self.last_scorer = np.full(matches, NO_SCORER, dtype=np.int8)
+        self.done = np.zeros(matches, dtype=bool)
+        self.tick = 0
+        self.finish_tick = np.zeros(matches, dtype=np.int64)
+
+        # First serve of every match
+        self.reset(np.arange(matches))
+
+    def chase_tables(self, difficulty):
+        # Integer forms of the ai_move odds for 16-bit random draws:
+        # react when draw < threshold, then reuse the draw for the
+        # randint(-random_factor, random_factor) error term
+        random_factor = 40 - difficulty * 3
+        span = 2 * random_factor + 1
+        threshold = (difficulty * 65536 + 9) // 10
+        scale = span * 65536 // np.maximum(threshold, 1)
+        offset = PADDLE_HEIGHT // 2 + random_factor
+        return threshold.astype(np.uint32), scale.astype(np.uint32), offset.astype(np.int16)
+
+    def reset(self, index):
+        # Vectorized Ball.reset for the matches in index
+        count = len(index)
+        if count == 0:
+            return
+        scorer = self.last_scorer[index]
+
+        # First serve of the game picks a random side
+        from_ai = scorer == AI_SCORER
+        first_serve = scorer == NO_SCORER
+        from_ai[first_serve] = self.rng.random(int(first_serve.sum())) < 0.5
+
+        self.ball_x[index] = np.where(from_ai, WIDTH - 100 - BALL_SIZE // 2, 100 - BALL_SIZE // 2)
+        self.ball_y[index] = HEIGHT // 2 - BALL_SIZE // 2
+        self.speed_x[index] = np.where(from_ai, -BALL_SPEED, BALL_SPEED)
+
+        # Randomize y direction
+        self.speed_y[index] = BALL_SPEED * SERVE_Y_FACTORS[self.rng.integers(0, 4, count)]
+        self.z_position[index] = 0
+        self.rect_y[index] = self.ball_y[index]
+
+    def restart(self, index):
+        # Start new matches in place of the ones in index, as used by
+        # rl_env.VectorEnv to reset finished environments
+        self.paddle_y[:, index] = HEIGHT // 2 - PADDLE_HEIGHT // 2
+        self.player_score[index] = 0
+        self.ai_score[index] = 0
+        self.last_scorer[index] = NO_SCORER
+        self.done[index] = False
+        self.finish_tick[index] = 0
+        self.z_speed[index] = 0.2
+        self.reset(index)
+
+    def next_random(self):
+        # Advance every match's xorshift32 stream
+        state = self.rng_state
+        state ^= state << np.uint32(13)
+        state ^= state >> np.uint32(17)
+        state ^= state << np.uint32(5)
+        return state
+
+    def chase(self, ball_y, draws):
+        # Paddle.ai_move for both paddles of every match, as a -1/0/1
+        # direction per paddle. self.incoming marks balls heading their way.
+        paddle_y = self.paddle_y
+        react, above, below = self.react, self.above, self.below
+        jitter, target_y, toward, recenter = self.jitter, self.target_y, self.toward, self.recenter
+        np.less(draws, self.chase_threshold, out=react)
+        np.multiply(draws, self.chase_scale, out=jitter)
+        jitter >>= np.uint32(16)
+        np.copyto(target_y, jitter, casting='unsafe')
+        target_y += ball_y
+        target_y -= self.chase_offset
+        np.greater(target_y, paddle_y, out=above)
+        np.less(target_y, paddle_y, out=below)
+        np.subtract(above.view(np.int8), below.view(np.int8), out=toward)
+        toward *= react.view(np.int8)
+
+        # Ball moving away: drift back to the center
+        center_gap = np.subtract(HEIGHT // 2 - PADDLE_HEIGHT // 2, paddle_y, out=target_y)
+        np.greater(center_gap, PADDLE_SPEED, out=above)
+        np.less(center_gap, -PADDLE_SPEED, out=below)
+        np.subtract(above.view(np.int8), below.view(np.int8), out=recenter)
+
+        # Pick the chase or recenter direction without a masked select
+        toward -= recenter
+        toward *= self.incoming.view(np.int8)
+        toward += recenter
+        return toward
+
+    def move_paddle(self, y, up, down):
+        # Paddle.move with explicit inputs; both keys may apply in the same tick
+        y = y - PADDLE_SPEED * (up & (y > 0))
+        return (y + PADDLE_SPEED * (down & (y + PADDLE_HEIGHT < HEIGHT))).astype(np.int16)
+
+    def collide(self, index, paddle_x, paddle_y):
+        # Ball.collide for the matches in index, whose balls have just
+        # touched the paddle at paddle_x/paddle_y
+        ball_y = self.ball_y[index]
+
+        # Bounce angle based on where the ball hits the paddle, max 45 degrees
+        relative_intersect_y = (paddle_y + PADDLE_HEIGHT / 2) - (ball_y + BALL_SIZE / 2)
+        bounce_angle = relative_intersect_y / (PADDLE_HEIGHT / 2) * (np.pi / 4)
+
+        speed_x = np.abs(self.speed_x[index])
+        speed_x[paddle_x >= WIDTH // 2] *= -1
+        self.speed_x[index] = np.clip(speed_x * SPEED_UP, -MAX_BALL_SPEED, MAX_BALL_SPEED)
+        self.speed_y[index] = -BALL_SPEED * np.sin(bounce_angle)
+        self.z_speed[index] *= -1
+
+    def sweep(self, index, x, y):
+        # Ball.move's event loop for the matches in index, starting from
+        # x/y: every wall bounce, paddle hit and goal at its exact time, in
+        # order, with the same arithmetic as the scalar code
+        remaining = np.ones(len(index))
+        scored = []
+        while len(index):
+            speed_x, speed_y = self.speed_x[index], self.speed_y[index]
+            heading_right = speed_x > 0
+            heading_down = speed_y > 0
+            side = heading_right.view(np.int8)
+            paddle_x = PADDLE_COLUMNS[side]
+            paddle_y = self.paddle_y[side, index].astype(np.float64)
+
+            with np.errstate(divide='ignore', invalid='ignore'):
+                # Top and bottom walls
+                wall_time = (WALL_LINE[heading_down.view(np.int8)] - y) / speed_y
+
+                # Ball.time_of_impact against the paddle ahead
+                near_x = (NEAR_FACE[side] - x) / speed_x
+                far_x = (FAR_FACE[side] - x) / speed_x
+                top_y = (paddle_y - BALL_SIZE - y) / speed_y
+                bottom_y = (paddle_y + PADDLE_HEIGHT - y) / speed_y
+                entry_y = np.where(heading_down, top_y, bottom_y)
+                exit_y = np.where(heading_down, bottom_y, top_y)
+
+                # A ball flying level meets no wall, and is level with the
+                # paddle for the whole tick or never
+                level = speed_y == 0
+                if level.any():
+                    wall_time[level] = np.inf
+                    beside = (paddle_y[level] - BALL_SIZE < y[level]) & (y[level] < paddle_y[level] + PADDLE_HEIGHT)
+                    entry_y[level] = np.where(beside, -np.inf, np.inf)
+                    exit_y[level] = np.inf
+
+                entry_time = np.maximum(near_x, entry_y)
+                exit_time = np.minimum(far_x, exit_y)
+                paddle_time = np.where((entry_time < exit_time) & (exit_time > 0), np.maximum(entry_time, 0.0), np.inf)
+
+                # Left and right edges
+                goal_time = (GOAL_LINE[side] - x) / speed_x
+
+            event_time = remaining.copy()
+            event = np.zeros(len(index), dtype=np.int8)
+            wall = wall_time <= event_time
+            event_time[wall], event[wall] = wall_time[wall], 1
+            hit = paddle_time < event_time
+            event_time[hit], event[hit] = paddle_time[hit], 2
+            goal = goal_time < event_time
+            event_time[goal], event[goal] = goal_time[goal], 3
+
+            x += speed_x * event_time
+            y += speed_y * event_time
+            remaining -= event_time
+            self.ball_x[index] = x
+            self.ball_y[index] = y
+
+            # Bounce off top and bottom
+            wall = event == 1
+            self.ball_y[index[wall]] = WALL_LINE[heading_down[wall].view(np.int8)]
+            self.speed_y[index[wall]] *= -1
+
+            hit = event == 2
+            self.collide(index[hit], paddle_x[hit], paddle_y[hit])
+
+            # Score points and reset if ball goes out of bounds
+            goal = event == 3
+            if goal.any():
+                self.score(index[goal & ~heading_right], index[goal & heading_right])
+                scored.append(index[goal])
+                # The serve waits out the rest of the tick it was made in
+                np.floor(remaining, out=remaining, where=goal)
+
+            more = (event != 0) & (remaining > 0)
+            index, remaining = index[more], remaining[more]
+            x, y = self.ball_x[index], self.ball_y[index]
+        return np.concatenate(scored) if scored else np.empty(0, dtype=np.intp)
+
+    def score(self, ai_point, player_point):
+        # Points for the matches in ai_point/player_point, then serve
+        scored = np.concatenate([ai_point, player_point])
+        active_ai = ai_point[~self.done[ai_point]]
+        active_player = player_point[~self.done[player_point]]
+        self.ai_score[active_ai] += 1
+        self.player_score[active_player] += 1
+        self.last_scorer[ai_point] = AI_SCORER
+        self.last_scorer[player_point] = PLAYER_SCORER
+        self.reset(scored)
+
+        # Record when matches reach MAX_SCORE
+        active = np.concatenate([active_ai, active_player])
+        finished = active[(self.player_score[active] >= MAX_SCORE) | (self.ai_score[active] >= MAX_SCORE)]
+        self.finish_tick[finished] = self.tick
+        self.done[finished] = True
+
+    def step(self, player_up=None, player_down=None):
+        # Advance every match by one frame, in main() loop order, and return
+        # the indices of matches where a point was scored. Finished
+        # matches keep moving but their scores and finish tick are frozen.
+        # Without explicit inputs the player paddle is driven by the same
+        # chaser AI as the opponent, mirrored to the left side.
+        state = self.next_random()
+        draws = self.draws
+        np.bitwise_and(state, np.uint32(0xFFFF), out=draws[0])
+        np.right_shift(state, np.uint32(16), out=draws[1])
+        np.less(self.speed_x, 0, out=self.incoming[0])
+        np.logical_not(self.incoming[0], out=self.incoming[1])
+
+        explicit = player_up is not None and player_down is not None
+        if explicit:
+            player_y = self.player_y.copy()
+        toward = self.chase(self.rect_y, draws)
+        toward *= PADDLE_SPEED
+        self.paddle_y += toward
+        low, high = self.paddle_bounds
+        np.maximum(self.paddle_y, low, out=self.paddle_y)
+        np.minimum(self.paddle_y, high, out=self.paddle_y)
+        if explicit:
+            self.player_y[:] = self.move_paddle(player_y, np.asarray(player_up, dtype=bool), np.asarray(player_down, dtype=bool))
+
+        self.z_position += self.z_speed
+        flip_z = np.greater(self.z_position, self.max_z, out=self.blocked)
+        flip_z |= np.less(self.z_position, 0, out=self.mask)
+        np.negative(self.z_speed, out=self.z_speed, where=flip_z)
+
+        # Ball.move: balls that end the tick clear of the walls and of both
+        # paddle columns fly straight, the rest go through the sweep. The
+        # sweep moves a ball with the same arithmetic, so sweeping one that
+        # had nothing to hit (one behind a paddle, heading away) is exact.
+        self.tick += 1
+        end_x, end_y, blocked, mask = self.end_x, self.end_y, self.blocked, self.mask
+        np.add(self.ball_x, self.speed_x, out=end_x)
+        np.add(self.ball_y, self.speed_y, out=end_y)
+        np.greater(end_x, AI_X - BALL_SIZE - CLEARANCE, out=blocked)
+        blocked |= np.less(end_x, PLAYER_X + PADDLE_WIDTH + CLEARANCE, out=mask)
+        blocked |= np.less(end_y, CLEARANCE, out=mask)
+        blocked |= np.greater(end_y, HEIGHT - BALL_SIZE - CLEARANCE, out=mask)
+        index = np.flatnonzero(blocked)
+        x, y = self.ball_x[index], self.ball_y[index]
+        # The old position arrays become next tick's end buffers
+        self.ball_x, self.end_x = end_x, self.ball_x
+        self.ball_y, self.end_y = end_y, self.ball_y
+        scored = self.sweep(index, x, y)
+
+        # Ball.rect for the AI on the next tick
+        rect_round(self.ball_y, self.rect_y, self.scratch)
+        return scored
+
+    def run(self, max_ticks):
+        # Step until every match has finished or max_ticks have passed
+        for _ in range(max_ticks):
+            if self.done.all():
+                break
+            self.step()
+        return self.done.all()
+
+    def results(self):
+        return {
+            'player_score': self.player_score.copy(),
+            'ai_score': self.ai_score.copy(),
+            'player_won': self.player_score >= MAX_SCORE,
+            'ticks': np.where(self.done, self.finish_tick, self.tick),
+            'done': self.done.copy(),
+        }
+
+
+def benchmark(matches=10000, ticks=600, loop_sample=200, repeats=3):
+    # Compare the batch engine with looping the pygame classes match by match.
+    # Each side reports its best of `repeats` runs.
+    import pickle_ball as game
+
+    def run_batch():
+        sim = BatchSimulator(matches, difficulty=5, seed=0)
+        start = time.perf_counter()
+        for _ in range(ticks):
+            sim.step()
+        return time.perf_counter() - start
+
+    def run_loop():
+        # Measured on a sample and scaled to the same match count
+        start = time.perf_counter()
+        for _ in range(loop_sample):
+            player = game.Paddle(PLAYER_X, HEIGHT // 2 - PADDLE_HEIGHT // 2, PADDLE_WIDTH, PADDLE_HEIGHT, game.BLUE, PADDLE_SPEED)
+            ai = game.Paddle(AI_X, HEIGHT // 2 - PADDLE_HEIGHT // 2, PADDLE_WIDTH, PADDLE_HEIGHT, game.RED, PADDLE_SPEED, is_ai=True, predictive=False)
+            ball = game.Ball(WIDTH // 2 - BALL_SIZE // 2, HEIGHT // 2 - BALL_SIZE // 2, BALL_SIZE, game.GREEN, BALL_SPEED)
+            for _ in range(ticks):
+                player.move(up=ball.rect.centery < player.rect.centery, down=ball.rect.centery > player.rect.centery)
+                ai.ai_move(ball, 5)
+                ball.move(player, ai)
+        return (time.perf_counter() - start) * matches / loop_sample
+
+    batch_time = min(run_batch() for _ in range(repeats))
+    loop_time = min(run_loop() for _ in range(repeats))
+
+    print(f"{matches} matches x {ticks} ticks")
+    print(f"  batch: {batch_time:.3f}s ({matches * ticks / batch_time:,.0f} match-ticks/s)")
+    print(f"  loop (estimated): {loop_time:.3f}s ({matches * ticks / loop_time:,.0f} match-ticks/s)")
+    print(f"  speed-up: {loop_time / batch_time:.0f}x")
+
+
+if __name__ == "__main__":
+    matches = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    ticks = int(sys.argv[2]) if len(sys.argv) > 2 else 600
+    benchmark(matches, ticks)
@@ -0,0 +1,307 @@
+# Benchmark suite for Pickle Ball's hot paths
+#
+# Runs headless under the SDL dummy video and audio drivers. Each case is
+# timed with timeit: the call count is calibrated to fill about 0.2 s, and
+# the best of --repeat runs is reported as the time per call. --save writes
+# the results as a baseline file; later runs compare against it and exit
+# with status 1 when any case is slower than its baseline by more than its
+# threshold (--threshold, or a per-case value in the baseline's
+# "thresholds" table). Timings are noisy, tiny cases most of all, so the
+# baseline also keeps each case's spread (how much slower the median run
+# was than the best) and a case's limit is widened to SPREAD_FACTOR times
+# it; a case over its limit is measured again, up to RETRIES times, and
+# fails only if its best time stays over. Baselines are machine specific,
+# so save one on the machine that will run the comparison.
+#
+# Usage: python benchmark.py [--save] [--baseline PATH] [--threshold 0.25] [NAME ...]
+
+import os
+import sys
+import copy
+import json
+import timeit
+import platform
+import argparse
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+import pygame
+import pickle_ball as game
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+
+# Slowdown allowed before a case counts as a regression
+THRESHOLD = 0.25
+# A case's limit is at least this many times the spread of its baseline run
+SPREAD_FACTOR = 3
+# Extra measurements of a case over its limit before it counts as a regression
+RETRIES = 2
+
+# Seed and level of the state the cases run on, and of the full match
+SEED = 7
+LEVEL = 5
+
+
+def chase_inputs(state):
+    # Scripted player: follow the ball's center
+    paddle, ball = state.player_paddle, state.ball
+    if ball.rect.centery < paddle.rect.centery - paddle.speed:
+        return game.INPUT_UP
+    if ball.rect.centery > paddle.rect.centery + paddle.speed:
+        return game.INPUT_DOWN
+    return 0
+
+
+def rally_state():
+    # A match a few hundred ticks in, with the ball in play
+    state = game.GameState(LEVEL, seed=SEED)
+    for _ in range(300):
+        game.step(state, chase_inputs(state))
+    return state
+
+
+# Each case builds its state and returns the callable to time
+
+def case_ball_move():
+    state = rally_state()
+    return lambda: state.ball.move(state.player_paddle, state.ai_paddle)
+
+
+def case_ball_collide():
+    state = rally_state()
+    ball, paddle = state.ball, state.ai_paddle
+    return lambda: ball.collide(paddle)
+
+
+def case_ball_time_of_impact():
+    state = rally_state()
+    ball, paddle = state.ball, state.ai_paddle
+    return lambda: ball.time_of_impact(paddle)
+
+
+def case_ai_move_predictive():
+    state = rally_state()
+    ball, paddle = state.ball, state.ai_paddle
+    return lambda: paddle.ai_move(ball, LEVEL)
+
+
+def case_ai_move_chase():
+    state = game.GameState(LEVEL, seed=SEED, predictive_ai=False)
+    ball, paddle = state.ball, state.ai_paddle
+    return lambda: paddle.ai_move(ball, LEVEL)
+
+
+def case_state_snapshot():
+    state = rally_state()
+    return lambda: state.restore(state.snapshot())
+
+
+def case_state_deepcopy():
+    # What snapshot() saves over
+    state = rally_state()
+    return lambda: copy.deepcopy(state)
+
+
+def case_hard_ai_search():
+    # The lookahead AI's whole search for one volley, with no time budget
+    state = game.GameState(LEVEL, seed=SEED, hard_ai=True)
+    while not (state.ball.speed_x > 0 and state.ball.x < game.WIDTH / 3):
+        game.step(state, chase_inputs(state))
+    planner = state.ai_paddle.planner
+    planner.budget = None
+
+    def search():
+        planner.plan(state.ball)
+        planner.search()
+    return search
+
+
+def case_ball_draw():
+    state = rally_state()
+    return lambda: state.ball.draw(0.5)
+
+
+def case_paddle_draw():
+    state = rally_state()
+    return lambda: state.player_paddle.draw(0.5)
+
+
+def case_court_draw():
+    court = game.Court()
+    return court.draw
+
+
+def case_hud():
+    state = rally_state()
+    return lambda: game.draw_hud(state)
+
+
+def case_frame():
+    state = rally_state()
+    court = game.Court()
+    renderer = game.DirtyRectRenderer(court)
+    return lambda: game.draw_frame(court, renderer, state, 0.5)
+
+
+def case_difficulty_screen():
+    return lambda: game.draw_difficulty_screen(LEVEL)
+
+
+def case_game_over_win():
+    return lambda: game.draw_game_over(game.MAX_SCORE, 12, LEVEL)
+
+
+def case_game_over_lose():
+    return lambda: game.draw_game_over(12, game.MAX_SCORE, LEVEL)
+
+
+def case_full_match():
+    # A whole 20-point match, simulated headless
+    def play():
+        state = game.GameState(LEVEL, seed=SEED)
+        while not state.is_over():
+            game.step(state, chase_inputs(state))
+        return state
+    return play
+
+
+def multi_ball_state(count):
+    # A multi-ball match a few seconds in, so the serves have spread out
+    state = game.GameState(LEVEL, seed=SEED, balls=count)
+    for _ in range(120):
+        multi_ball_tick(state)
+    return state
+
+
+def multi_ball_tick(state):
+    # One tick; scores are reset so the match never ends
+    game.step(state, chase_inputs(state))
+    if state.is_over():
+        state.player_paddle.reset_score()
+        state.ai_paddle.reset_score()
+
+
+def case_multi_ball_10():
+    state = multi_ball_state(10)
+    return lambda: multi_ball_tick(state)
+
+
+def case_multi_ball_100():
+    state = multi_ball_state(100)
+    return lambda: multi_ball_tick(state)
+
+
+def case_multi_ball_1000():
+    state = multi_ball_state(1000)
+    return lambda: multi_ball_tick(state)
+
+
+def case_multi_ball_frame():
+    state = multi_ball_state(100)
+    court = game.Court()
+    renderer = game.DirtyRectRenderer(court)
+    return lambda: game.draw_frame(court, renderer, state, 0.5)
+
+
+CASES = {name[len('case_'):]: function for name, function in globals().items() if name.startswith('case_')}
+
+
+def measure(name, repeat):
+    # (best time per call in seconds, spread): the spread is how much
+    # slower the median run was than the best, as a fraction
+    timer = timeit.Timer(CASES[name]())
+    number, _ = timer.autorange()
+    times = sorted(timer.repeat(repeat=repeat, number=number))
+    return times[0] / number, times[len(times) // 2] / times[0] - 1
+
+
+def load_baseline(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'pygame': pygame.version.ver,
+        'machine': platform.machine(),
+        'system': platform.platform(),
+    }
+
+
+def format_time(seconds):
+    if seconds >= 0.1:
+        return f"{seconds:.3f} s"
+    if seconds >= 1e-4:
+        return f"{seconds * 1e3:.3f} ms"
+    return f"{seconds * 1e6:.2f} us"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time Pickle Ball's hot paths and compare them with a baseline")
+    parser.add_argument('names', nargs='*', metavar='NAME', help=f"cases to run (default all): {', '.join(sorted(CASES))}")
+    parser.add_argument('--baseline', default=BASELINE_PATH, help="baseline file")
+    parser.add_argument('--save', action='store_true', help="save the results as the new baseline")
+    parser.add_argument('--threshold', type=float, default=THRESHOLD, help="allowed slowdown, e.g. 0.25 for 25%%")
+    parser.add_argument('--repeat', type=int, default=5, help="timing runs per case, best one counts")
+    args = parser.parse_args()
+
+    unknown = [name for name in args.names if name not in CASES]
+    if unknown:
+        parser.error(f"unknown case(s): {', '.join(unknown)}")
+
+    game.init()
+    names = args.names or list(CASES)
+    baseline = load_baseline(args.baseline)
+    baseline_results = baseline['results'] if baseline else {}
+    thresholds = baseline.get('thresholds', {}) if baseline else {}
+    baseline_spreads = baseline.get('spreads', {}) if baseline else {}
+
+    results = {}
+    spreads = {}
+    regressions = []
+    for name in names:
+        seconds, spreads[name] = measure(name, args.repeat)
+        line = None
+        if name in baseline_results:
+            limit = max(thresholds.get(name, args.threshold), SPREAD_FACTOR * baseline_spreads.get(name, 0))
+            runs = 1
+            while seconds / baseline_results[name] - 1 > limit and runs <= RETRIES:
+                seconds = min(seconds, measure(name, args.repeat)[0])
+                runs += 1
+            change = seconds / baseline_results[name] - 1
+            line = f"  baseline {format_time(baseline_results[name]):>12}  {change:+7.1%}"
+            if runs > 1:
+                line += f"  (best of {runs} measurements)"
+            if change > limit:
+                line += f"  REGRESSION (limit {limit:+.0%})"
+                regressions.append(name)
+        results[name] = seconds
+        print(f"{name:<22} {format_time(seconds):>12}{line or ''}")
+
+    if args.save:
+        saved = baseline or {'thresholds': {}}
+        saved['environment'] = environment()
+        saved['results'] = {**baseline_results, **results}
+        saved['spreads'] = {**baseline_spreads, **spreads}
+        with open(args.baseline, 'w') as f:
+            json.dump(saved, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"Saved baseline to {args.baseline}")
+    elif baseline is None:
+        print(f"No baseline at {args.baseline}; run with --save to create one")
+    elif baseline.get('environment') != environment():
+        print("Warning: baseline was saved on a different machine or library version")
+
+    if regressions:
+        print(f"FAILED: {len(regressions)} case(s) slower than baseline: {', '.join(regressions)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,194 @@
+# Rolling frame capture for Pickle Ball
+#
+# FrameCapture keeps the last few seconds of composed frames in a ring
+# buffer allocated up front. Each captured frame is one copy of the
+# screen's pixels straight from Surface.get_buffer() into the next slot,
+# with no conversion and no allocation, so capturing costs a fraction of a
+# millisecond per frame. Frames larger than the size given to allocate()
+# are scaled down into a frame surface first, so the ring stays the same
+# size however large the window gets. save_clip() hands the buffered frames to a
+# background thread that writes them to disk as one raw file (frames back
+# to back in the screen's own pixel format) plus a JSON index; capturing
+# pauses until it is done, so no frame being written is overwritten.
+#
+# Raw clips are turned into a PNG sequence offline with this script, so
+# the game never pays for image encoding.
+#
+# Usage: python capture.py CLIP.json [OUTDIR] [--every N]
+
+import os
+import sys
+import json
+import time
+import queue
+import argparse
+import threading
+
+import pygame
+
+CAPTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "captures")
+
+
+class FrameCapture:
+    def __init__(self, seconds, frame_rate, interval=2, directory=CAPTURE_DIR):
+        # Keeps `seconds` of frames, capturing every `interval`th frame of a
+        # loop running at `frame_rate`
+        self.seconds = seconds
+        self.interval = interval
+        self.capacity = max(1, round(seconds * frame_rate / interval))
+        self.directory = directory
+        self.frame_bytes = None
+        self.frame = None
+        self.ring = None
+        self.slots = None
+        self.times = [0.0] * self.capacity
+        self.format = None
+        # Frames seen, and frames stored; the newest is in slot
+        # (stored - 1) % capacity
+        self.seen = 0
+        self.stored = 0
+        self.started = time.perf_counter()
+
+        # Clips waiting for the writer thread, and set while one is written
+        self.jobs = queue.Queue()
+        self.writing = threading.Event()
+        self.writer = threading.Thread(target=self.write_clips, name="frame-capture-writer", daemon=True)
+        self.writer.start()
+        self.saved = []
+
+    def allocate(self, surface, max_size=None):
+        # Size the ring for frames of this surface, kept at no more than
+        # max_size; called whenever the surface is replaced, outside the
+        # game loop, so grab() never allocates
+        width, height = surface.get_size()
+        if max_size and (width > max_size[0] or height > max_size[1]):
+            width, height = max_size
+        frame = pygame.Surface((width, height), 0, surface)
+        layout = {
+            'width': width,
+            'height': height,
+            'pitch': frame.get_pitch(),
+            'bitsize': frame.get_bitsize(),
+            'masks': list(frame.get_masks()),
+        }
+        if layout == self.format:
+            return
+        size = frame.get_pitch() * height
+        self.frame = frame
+        self.frame_bytes = size
+        self.ring = bytearray(size * self.capacity)
+        view = memoryview(self.ring)
+        self.slots = [view[slot * size:(slot + 1) * size] for slot in range(self.capacity)]
+        self.format = layout
+        self.stored = 0
+
+    def grab(self, surface):
+        # Copy a composed frame into the ring, once the display is updated.
+        # A surface of the frame size with its own pixels is copied as it
+        # is; an area of the window is blitted into the frame surface first,
+        # and a larger screen scaled into it.
+        self.seen += 1
+        if self.ring is None or self.seen % self.interval or self.writing.is_set():
+            return
+        if surface.get_size() != self.frame.get_size():
+            pygame.transform.scale(surface, self.frame.get_size(), self.frame)
+            surface = self.frame
+        elif surface.get_parent() is not None:
+            self.frame.blit(surface, (0, 0))
+            surface = self.frame
+        slot = self.stored % self.capacity
+        pixels = surface.get_buffer()
+        self.slots[slot][:] = pixels
+        # The buffer keeps the surface locked until it is released
+        del pixels
+        self.times[slot] = time.perf_counter() - self.started
+        self.stored += 1
+
+    def save_clip(self):
+        # Queue the buffered frames, oldest first, for the writer thread.
+        # Returns the path the index will be written to, or None if there
+        # is nothing to save or a clip is still being written.
+        if not self.stored or self.writing.is_set():
+            return None
+        self.writing.set()
+        count = min(self.stored, self.capacity)
+        first = self.stored - count
+        order = [(first + index) % self.capacity for index in range(count)]
+        path = os.path.join(self.directory, time.strftime("clip-%Y%m%d-%H%M%S"))
+        # The job keeps this ring, in case allocate() replaces it meanwhile
+        self.jobs.put((path, order, self.slots, self.format, self.frame_bytes))
+        return path + '.json'
+
+    def write_clips(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                return
+            path, order, slots, layout, frame_bytes = job
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                with open(path + '.raw', 'wb') as f:
+                    for slot in order:
+                        f.write(slots[slot])
+                start = self.times[order[0]]
+                index = dict(layout)
+                index.update({
+                    'frame_bytes': frame_bytes,
+                    'frames': len(order),
+                    'frame_interval': self.interval,
+                    'times': [round(self.times[slot] - start, 4) for slot in order],
+                    'raw': os.path.basename(path + '.raw'),
+                })
+                with open(path + '.json', 'w') as f:
+                    json.dump(index, f)
+                self.saved.append(path + '.json')
+            except OSError as error:
+                print(f"Could not save clip {path}: {error}", file=sys.stderr)
+            finally:
+                # Capturing resumes, overwriting the frames just written
+                self.writing.clear()
+
+    def close(self):
+        # Finish any clip being written
+        self.jobs.put(None)
+        self.writer.join()
+
+
+def read_clip(index_path):
+    # (index, frame surfaces generator) for a saved clip
+    with open(index_path) as f:
+        index = json.load(f)
+    raw_path = os.path.join(os.path.dirname(os.path.abspath(index_path)), index['raw'])
+
+    def frames():
+        with open(raw_path, 'rb') as f:
+            for _ in range(index['frames']):
+                data = f.read(index['frame_bytes'])
+                if len(data) < index['frame_bytes']:
+                    return
+                surface = pygame.Surface((index['width'], index['height']), 0, index['bitsize'], index['masks'])
+                surface.get_buffer().write(data)
+                yield surface
+    return index, frames()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert a raw capture clip to a PNG sequence")
+    parser.add_argument('clip', help="clip index (.json)")
+    parser.add_argument('outdir', nargs='?', help="output directory (default: next to the clip)")
+    parser.add_argument('--every', type=int, default=1, help="write every Nth frame")
+    args = parser.parse_args()
+
+    index, frames = read_clip(args.clip)
+    outdir = args.outdir or os.path.splitext(args.clip)[0]
+    os.makedirs(outdir, exist_ok=True)
+    written = 0
+    for number, surface in enumerate(frames):
+        if number % args.every == 0:
+            pygame.image.save(surface, os.path.join(outdir, f"frame-{number:05d}.png"))
+            written += 1
+    print(f"{written} frames of {index['width']}x{index['height']} written to {outdir}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
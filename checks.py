@@ -0,0 +1,236 @@
+# Consistency checks for Pickle Ball's simulation
+#
+# Runs headless like benchmark.py. Each check plays seeded matches two ways
+# that must agree exactly and reports the first tick where they part:
+#
+#   batch_sim   BatchSimulator against the game classes (GameState with the
+#               chasing AI, the only opponent BatchSimulator models), with
+#               the classes drawing the simulator's random numbers
+#   replay      matches recorded with ReplayRecorder, read back from the
+#               session file and re-simulated, against the matches played
+#   snapshot    matches restored from GameState.snapshot() part way through
+#               and played on, against the same matches played straight
+#
+# Run it after changing the rules in pickle_ball.py, batch_sim.py or
+# replay.py; it exits with status 1 if any check fails.
+#
+# Usage: python checks.py [NAME ...]
+
+import os
+import sys
+import random
+import argparse
+import tempfile
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+import numpy as np
+import pickle_ball as game
+import replay
+from batch_sim import BatchSimulator
+
+# Seeds of the matches each check plays, and the longest match followed
+SEEDS = range(20)
+MAX_TICKS = 20000
+# Tick the snapshot check saves the match at, and the ticks played after it
+SNAPSHOT_TICK = 300
+REPLAYED_TICKS = 400
+
+
+class CheckFailed(Exception):
+    pass
+
+
+class BatchRandom:
+    # Stands in for a match's random.Random so the game classes draw what
+    # BatchSimulator draws for its one match: serves from the simulator's
+    # NumPy generator, and for the AI paddle the top 16 bits of the tick's
+    # xorshift32 draw, turned into the same ai_move odds and error term
+    def __init__(self, sim, seed):
+        self.serves = np.random.default_rng(seed)
+        # Skip the draw that seeded the xorshift streams
+        self.serves.integers(1, 2 ** 32, 1, dtype=np.uint32)
+        self.threshold = int(sim.chase_threshold[1, 0])
+        self.scale = int(sim.chase_scale[1, 0])
+        self.random_factor = 40 - int(sim.difficulty[1, 0]) * 3
+        self.draw = 0
+
+    def random(self):
+        return self.draw / 65536 if self.draw < self.threshold else 1.0
+
+    def randint(self, low, high):
+        return (self.draw * self.scale >> 16) - self.random_factor
+
+    def choice(self, seq):
+        if len(seq) == 2:
+            return seq[0] if self.serves.random() < 0.5 else seq[1]
+        return seq[int(self.serves.integers(0, len(seq)))]
+
+
+def check_batch_sim():
+    # Every tick of one-match BatchSimulators against GameState, with the
+    # same random player inputs, across all difficulty levels
+    ticks = 0
+    for seed in SEEDS:
+        level = 1 + seed % game.MAX_DIFFICULTY
+        sim = BatchSimulator(1, difficulty=level, seed=seed)
+        state = game.GameState(level, seed=seed, predictive_ai=False, hard_ai=False)
+        rng = state.ai_paddle.rng = state.ball.rng = BatchRandom(sim, seed)
+        state.ball.reset()
+        inputs = np.random.default_rng(1000 + seed).integers(0, 3, MAX_TICKS)
+        for tick, value in enumerate(inputs):
+            up, down = value == game.INPUT_UP, value == game.INPUT_DOWN
+            sim.step(np.array([up]), np.array([down]))
+            rng.draw = int(sim.rng_state[0]) >> 16
+            game.step(state, int(value))
+            ball = state.ball
+            expected = (
+                state.player_paddle.rect.y, state.ai_paddle.rect.y, ball.x, ball.y, ball.speed_x, ball.speed_y,
+                ball.z_position, state.player_paddle.score, state.ai_paddle.score,
+            )
+            got = tuple(float(value) for value in (
+                sim.player_y[0], sim.ai_y[0], sim.ball_x[0], sim.ball_y[0], sim.speed_x[0], sim.speed_y[0],
+                sim.z_position[0], sim.player_score[0], sim.ai_score[0],
+            ))
+            if got != expected:
+                raise CheckFailed(f"seed {seed} level {level}, tick {tick}: batch {got}, classes {expected}")
+            if sim.done[0]:
+                break
+        ticks += tick + 1
+    return f"{len(SEEDS)} matches, {ticks} ticks"
+
+
+def scripted_inputs(state, rng):
+    # Mostly follow the ball, sometimes at an analog speed, with some
+    # random moves so the input bytes vary
+    paddle, ball = state.player_paddle, state.ball
+    if rng.random() < 0.2:
+        inputs = rng.choice((0, game.INPUT_UP, game.INPUT_DOWN))
+    elif ball.rect.centery < paddle.rect.centery - paddle.speed:
+        inputs = game.INPUT_UP
+    elif ball.rect.centery > paddle.rect.centery + paddle.speed:
+        inputs = game.INPUT_DOWN
+    else:
+        inputs = 0
+    if rng.random() < 0.1:
+        inputs |= rng.randrange(1, game.INPUT_SPEED_STEPS) << game.INPUT_SPEED_SHIFT
+    return inputs
+
+
+def final_position(state):
+    return (
+        state.tick, state.player_paddle.score, state.ai_paddle.score,
+        state.player_paddle.rect.y, state.ai_paddle.rect.y,
+        tuple((ball.x, ball.y, ball.speed_x, ball.speed_y) for ball in state.balls),
+    )
+
+
+def check_replay():
+    # Record a session of matches like the game does, with chunks flushed
+    # often, then read each match back and re-simulate it. The ticks read
+    # must be the bytes recorded, and the re-simulated match must end
+    # exactly where the played one did.
+    # (predictive AI, hard AI, balls) of the matches in turn
+    options = [(True, False, 1), (False, False, 1), (True, False, 5), (True, True, 1)]
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'session.pbr')
+        recorder = replay.ReplayRecorder(path, flush_ticks=97)
+        played = []
+        for seed in SEEDS:
+            level = 1 + seed % game.MAX_DIFFICULTY
+            predictive_ai, hard_ai, balls = options[seed % len(options)]
+            state = game.GameState(level, seed=seed, predictive_ai=predictive_ai, balls=balls, hard_ai=hard_ai)
+            flags = (replay.FLAG_PREDICTIVE_AI if state.predictive_ai else 0) | (replay.FLAG_HARD_AI if state.hard_ai else 0)
+            recorder.start_match(state.seed, state.difficulty, flags, len(state.balls))
+            rng = random.Random(seed)
+            ticks = bytearray()
+            while not state.is_over() and state.tick < MAX_TICKS:
+                inputs = scripted_inputs(state, rng)
+                game.step(state, inputs)
+                recorder.record_tick(inputs, state.ai_paddle.decision)
+                ticks.append(replay.pack_tick(inputs, state.ai_paddle.decision))
+            recorder.end_match(state.player_paddle.score, state.ai_paddle.score)
+            played.append((bytes(ticks), final_position(state)))
+        recorder.close()
+
+        reader = replay.ReplayReader(path)
+        try:
+            matches = reader.matches()
+            if len(matches) != len(played):
+                raise CheckFailed(f"{len(played)} matches recorded, {len(matches)} read back")
+            for info, (ticks, position) in zip(matches, played):
+                _, read = reader.read_match(info.match_id)
+                if read != ticks:
+                    raise CheckFailed(f"match {info.match_id}: {len(ticks)} ticks recorded, {len(read)} read back differ")
+                if (info.player_score, info.ai_score, info.ticks) != position[1:3] + (len(ticks),):
+                    raise CheckFailed(f"match {info.match_id}: game over record {info} does not match the match played")
+                try:
+                    state = replay.skip_to_end(info, read)
+                except replay.ReplayError as error:
+                    raise CheckFailed(f"match {info.match_id}: {error}")
+                if final_position(state) != position:
+                    raise CheckFailed(f"match {info.match_id}: replay ends at {final_position(state)}, match ended at {position}")
+        finally:
+            reader.close()
+    return f"{len(played)} matches, {sum(len(ticks) for ticks, _ in played)} ticks"
+
+
+def check_snapshot():
+    # Snapshot at SNAPSHOT_TICK and play straight on, then restore and
+    # play the same inputs again: both runs must end in the same place
+    options = [(True, False, 1), (False, False, 1), (True, False, 5), (True, True, 1)]
+    for seed in SEEDS:
+        level = 1 + seed % game.MAX_DIFFICULTY
+        predictive_ai, hard_ai, balls = options[seed % len(options)]
+        state = game.GameState(level, seed=seed, predictive_ai=predictive_ai, balls=balls, hard_ai=hard_ai)
+        if hard_ai:
+            # Searching to the end each time, so the search is repeatable
+            state.ai_paddle.planner.budget = None
+        rng = random.Random(seed)
+        for _ in range(SNAPSHOT_TICK):
+            game.step(state, scripted_inputs(state, rng))
+        snapshot = state.snapshot()
+        rng_state = rng.getstate()
+
+        ends = []
+        for run in range(2):
+            if run:
+                state.restore(snapshot)
+                rng.setstate(rng_state)
+            for _ in range(REPLAYED_TICKS):
+                game.step(state, scripted_inputs(state, rng))
+            ends.append(final_position(state))
+        if ends[0] != ends[1]:
+            raise CheckFailed(f"seed {seed} level {level}: straight run ends at {ends[0]}, restored run at {ends[1]}")
+    return f"{len(SEEDS)} matches, {REPLAYED_TICKS} ticks after tick {SNAPSHOT_TICK}"
+
+
+CHECKS = {name[len('check_'):]: function for name, function in globals().items() if name.startswith('check_')}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that Pickle Ball's simulations agree tick for tick")
+    parser.add_argument('names', nargs='*', metavar='NAME', help=f"checks to run (default all): {', '.join(CHECKS)}")
+    args = parser.parse_args()
+
+    unknown = [name for name in args.names if name not in CHECKS]
+    if unknown:
+        parser.error(f"unknown check(s): {', '.join(unknown)}")
+
+    failures = []
+    for name in args.names or list(CHECKS):
+        try:
+            print(f"{name:<12} ok  {CHECKS[name]()}")
+        except CheckFailed as error:
+            print(f"{name:<12} FAILED  {error}")
+            failures.append(name)
+
+    if failures:
+        print(f"FAILED: {', '.join(failures)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,188 @@
+# Input pipeline for Pickle Ball
+#
+# InputPipeline folds keyboard and gamepad events into the controls held
+# right now: the arrow keys, a gamepad's hat, and its left stick, whose
+# tilt past a dead zone gives an analog paddle speed. Every event is
+# stamped with perf_counter() as it is taken off pygame's queue (pygame
+# does not pass on SDL's own event times), and the playing scene takes
+# the input events waiting on the queue with poll() right before sample()
+# turns the held controls into the input bits for the coming ticks, so
+# input arriving while the frame was being drawn or paced still makes it.
+#
+# Input bits: INPUT_UP and INPUT_DOWN, plus the analog speed in bits 4-6
+# as eighths of full speed (0 meaning full speed, as from the keys).
+#
+# Latency: sample() remembers when the first event behind a change of
+# input was read, and frame_shown(), called once the frame whose ticks
+# used it is on the display, turns that into an input-to-display sample.
+# latency_report() gives the rolling percentiles, which the game shows in
+# its F3 overlay and logs with --profile.
+#
+# Usage: python controls.py  (opens a window and prints the input bits as
+# they change, and the latency to the next frame)
+
+import sys
+import math
+import time
+import argparse
+from collections import deque
+
+import pygame
+
+INPUT_UP = 1
+INPUT_DOWN = 2
+INPUT_SPEED_SHIFT = 4
+INPUT_SPEED_STEPS = 8
+
+# Events poll() takes off the queue
+INPUT_EVENTS = (
+    pygame.KEYDOWN, pygame.KEYUP, pygame.JOYAXISMOTION, pygame.JOYHATMOTION,
+    pygame.JOYBUTTONDOWN, pygame.JOYDEVICEADDED, pygame.JOYDEVICEREMOVED, pygame.WINDOWFOCUSLOST,
+)
+# Gamepad stick axis that moves the paddle (left stick, vertical), and
+# the tilt below which it counts as centered
+STICK_AXIS = 1
+DEAD_ZONE = 0.2
+# Latency samples kept for the rolling percentiles
+LATENCY_WINDOW = 600
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+class InputPipeline:
+    def __init__(self, window=LATENCY_WINDOW):
+        self.up_key = False
+        self.down_key = False
+        # Open gamepads, and their hat (1 up, -1 down) and stick positions,
+        # by instance id
+        self.joysticks = {}
+        self.hats = {}
+        self.sticks = {}
+        # Input bits of the last sample
+        self.inputs = 0
+        # When the first event since the last sample was read, and when the
+        # input change not yet on screen was
+        self.changed_at = None
+        self.pending = None
+        self.latencies = deque(maxlen=window)
+
+    def handle(self, event):
+        # Fold one event into the held controls. Returns False for events
+        # that are not input.
+        kind = event.type
+        if kind == pygame.KEYDOWN or kind == pygame.KEYUP:
+            if event.key == pygame.K_UP:
+                self.up_key = kind == pygame.KEYDOWN
+            elif event.key == pygame.K_DOWN:
+                self.down_key = kind == pygame.KEYDOWN
+            else:
+                return False
+        elif kind == pygame.JOYAXISMOTION:
+            if event.axis != STICK_AXIS:
+                return False
+            self.sticks[event.instance_id] = event.value
+        elif kind == pygame.JOYHATMOTION:
+            self.hats[event.instance_id] = event.value[1]
+        elif kind == pygame.JOYDEVICEADDED:
+            joystick = pygame.joystick.Joystick(event.device_index)
+            self.joysticks[joystick.get_instance_id()] = joystick
+            return True
+        elif kind == pygame.JOYDEVICEREMOVED:
+            self.joysticks.pop(event.instance_id, None)
+            self.hats.pop(event.instance_id, None)
+            self.sticks.pop(event.instance_id, None)
+        elif kind == pygame.WINDOWFOCUSLOST:
+            # Keys released elsewhere never reach us
+            self.up_key = self.down_key = False
+        else:
+            return False
+        if self.changed_at is None:
+            self.changed_at = time.perf_counter()
+        return True
+
+    def poll(self):
+        # Take the input events waiting on pygame's queue, leaving the
+        # rest there. Returns those that are not paddle controls, such as
+        # other keys, for the caller to handle.
+        return [event for event in pygame.event.get(INPUT_EVENTS) if not self.handle(event)]
+
+    def sample(self):
+        # Input bits for the coming ticks. Keys and hats move at full
+        # speed and win over the stick.
+        up = self.up_key or any(hat > 0 for hat in self.hats.values())
+        down = self.down_key or any(hat < 0 for hat in self.hats.values())
+        inputs = (INPUT_UP if up else 0) | (INPUT_DOWN if down else 0)
+        if not inputs and self.sticks:
+            stick = max(self.sticks.values(), key=abs)
+            if abs(stick) > DEAD_ZONE:
+                inputs = INPUT_UP if stick < 0 else INPUT_DOWN
+                steps = math.ceil((abs(stick) - DEAD_ZONE) / (1 - DEAD_ZONE) * INPUT_SPEED_STEPS)
+                if steps < INPUT_SPEED_STEPS:
+                    inputs |= steps << INPUT_SPEED_SHIFT
+
+        if inputs != self.inputs:
+            self.pending = self.changed_at if self.changed_at is not None else time.perf_counter()
+        self.changed_at = None
+        self.inputs = inputs
+        return inputs
+
+    def frame_shown(self):
+        # The latest sample has been simulated and its frame displayed
+        if self.pending is not None:
+            self.latencies.append(time.perf_counter() - self.pending)
+            self.pending = None
+
+    def latency_report(self):
+        # Input-to-display latency in milliseconds over the last samples,
+        # or None before the first
+        if not self.latencies:
+            return None
+        values = sorted(self.latencies)
+        return {
+            'samples': len(values),
+            'last': round(self.latencies[-1] * 1000, 3),
+            'p50': round(percentile(values, 0.5) * 1000, 3),
+            'p95': round(percentile(values, 0.95) * 1000, 3),
+            'p99': round(percentile(values, 0.99) * 1000, 3),
+            'max': round(values[-1] * 1000, 3),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show the input bits the game reads from the keyboard and gamepads")
+    parser.add_argument('--frame-rate', type=int, default=60, help="frames per second of the test loop")
+    args = parser.parse_args()
+
+    pygame.init()
+    screen = pygame.display.set_mode((320, 120))
+    pygame.display.set_caption("Input test - ESC quits")
+    clock = pygame.time.Clock()
+    pipeline = InputPipeline()
+    previous = None
+    while True:
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE):
+                report = pipeline.latency_report()
+                if report:
+                    print(f"input to display over {report['samples']} changes: p50 {report['p50']} ms, p95 {report['p95']} ms, max {report['max']} ms")
+                pygame.quit()
+                return 0
+            if event.type == pygame.JOYDEVICEADDED:
+                print(f"gamepad connected: {pygame.joystick.Joystick(event.device_index).get_name()}")
+            pipeline.handle(event)
+        inputs = pipeline.sample()
+        screen.fill((200, 120, 0) if inputs else (0, 0, 0))
+        pygame.display.flip()
+        pipeline.frame_shown()
+        if inputs != previous:
+            latency = pipeline.latencies[-1] * 1000 if pipeline.latencies else 0.0
+            speed = inputs >> INPUT_SPEED_SHIFT or INPUT_SPEED_STEPS
+            print(f"up {bool(inputs & INPUT_UP)}, down {bool(inputs & INPUT_DOWN)}, speed {speed}/{INPUT_SPEED_STEPS}, shown after {latency:.1f} ms")
+            previous = inputs
+        clock.tick(args.frame_rate)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
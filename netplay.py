@@ -0,0 +1,675 @@
+# Two-player network matches for Pickle Ball
+#
+# The server owns the match: it steps a GameState at SIM_HZ on its own
+# clock, whatever the clients' frame rates, with the second player's input
+# moving the right paddle in place of the AI (step's opponent_inputs). Each
+# client connects over TCP for the control messages (welcome, start, game
+# over, as JSON lines) and exchanges the per-tick traffic over UDP:
+#
+#   INPUT     client -> server: u8 type, u32 token, u32 newest input
+#             sequence, u32 newest snapshot tick received, u8 count, then
+#             `count` input bytes ending at the newest one. Every input the
+#             server has not acknowledged yet is resent (up to
+#             MAX_RESENT_INPUTS), so a lost packet costs nothing.
+#   SNAPSHOT  server -> client: u8 type, u32 tick, u32 base tick, u32 last
+#             input applied for this client, u8 field mask, then the fields
+#             that differ from the base snapshot, the newest one the client
+#             acknowledged (base 0 sends every field).
+#
+# Clients apply their own input at once and keep it until the server
+# acknowledges it; on each snapshot the paddle is put where the server has
+# it and the unacknowledged inputs are replayed on top (reconciliation), so
+# the paddle feels instant at any latency. The ball and the other paddle
+# are drawn between the last two snapshots.
+#
+# LinkConditioner delays and drops UDP packets to try latency, jitter and
+# loss over localhost; `selftest` plays two scripted clients against a
+# server that way and prints bandwidth and input-to-update latency.
+#
+# Usage: python netplay.py server | client HOST | selftest [--latency MS] [--jitter MS] [--loss P]
+
+import os
+import sys
+import json
+import time
+import random
+import struct
+import asyncio
+import argparse
+from collections import deque
+
+# Keep pygame's banner out of reports written to stdout
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+import pygame
+import pickle_ball as game
+
+PORT = 5555
+
+INPUT, SNAPSHOT = 1, 2
+INPUT_HEADER = struct.Struct('<BIIIB')
+SNAPSHOT_HEADER = struct.Struct('<BIIIB')
+
+# Snapshot fields in mask bit order: left and right paddle tops, ball
+# position in 1/POSITION_SCALE pixels, the two scores and the ball's z level
+SNAPSHOT_FIELDS = [struct.Struct(code) for code in ('<h', '<h', '<h', '<h', '<B', '<B', '<B')]
+POSITION_SCALE = 16
+
+# Server ticks per snapshot
+SNAPSHOT_TICKS = 2
+# Snapshots kept on both ends as delta bases
+HISTORY_LENGTH = 120
+# Inputs carried by one INPUT packet, oldest dropped first
+MAX_RESENT_INPUTS = 32
+# Inputs the server queues at most. Past that it skips ahead rather than
+# apply input long after it was sent, and inputs numbered further ahead
+# of the server's tick than this are ignored, so a client cannot move its
+# paddle faster by sending more of them.
+MAX_INPUT_BACKLOG = 16
+# How often a client repeats its first packet until the match starts
+HELLO_INTERVAL = 0.1
+
+
+class NetError(Exception):
+    pass
+
+
+class LinkConditioner:
+    # Simulated network for the packets one end sends: each is delayed by
+    # latency +/- jitter milliseconds, and lost with probability `loss`.
+    # Jitter reorders packets, as a real network can.
+    def __init__(self, latency=0.0, jitter=0.0, loss=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.rng = random.Random(seed)
+        self.dropped = 0
+
+    def send(self, send, packet):
+        if self.loss and self.rng.random() < self.loss:
+            self.dropped += 1
+            return
+        delay = max(0.0, self.latency + self.rng.uniform(-self.jitter, self.jitter)) / 1000
+        if delay:
+            asyncio.get_running_loop().call_later(delay, send, packet)
+        else:
+            send(packet)
+
+
+class DatagramHandler(asyncio.DatagramProtocol):
+    def __init__(self, callback):
+        self.callback = callback
+
+    def datagram_received(self, data, address):
+        self.callback(data, address)
+
+
+def snapshot_values(state):
+    # The snapshot fields of a match, see SNAPSHOT_FIELDS
+    ball = state.ball
+    return (
+        state.player_paddle.rect.y,
+        state.ai_paddle.rect.y,
+        round(ball.x * POSITION_SCALE),
+        round(ball.y * POSITION_SCALE),
+        state.player_paddle.score,
+        state.ai_paddle.score,
+        min(max(int(round(ball.z_position)), 0), ball.max_z),
+    )
+
+
+def encode_snapshot(tick, base_tick, input_ack, values, base=None):
+    mask = 0
+    fields = []
+    for bit, (field, value) in enumerate(zip(SNAPSHOT_FIELDS, values)):
+        if base is None or base[bit] != value:
+            mask |= 1 << bit
+            fields.append(field.pack(value))
+    return SNAPSHOT_HEADER.pack(SNAPSHOT, tick, base_tick, input_ack, mask) + b''.join(fields)
+
+
+def decode_snapshot(packet, history):
+    # (tick, input ack, values), or None if the delta base is no longer in
+    # history
+    _, tick, base_tick, input_ack, mask = SNAPSHOT_HEADER.unpack_from(packet)
+    if base_tick:
+        base = history.get(base_tick)
+        if base is None:
+            return None
+    else:
+        base = (0,) * len(SNAPSHOT_FIELDS)
+    values = list(base)
+    offset = SNAPSHOT_HEADER.size
+    for bit, field in enumerate(SNAPSHOT_FIELDS):
+        if mask & 1 << bit:
+            values[bit], = field.unpack_from(packet, offset)
+            offset += field.size
+    return tick, input_ack, tuple(values)
+
+
+def remember(history, order, tick, values):
+    # Keep the newest HISTORY_LENGTH snapshots as delta bases
+    history[tick] = values
+    order.append(tick)
+    if len(order) > HISTORY_LENGTH:
+        del history[order.popleft()]
+
+
+def percentiles(values):
+    # p50/p95/p99 in milliseconds of latencies in seconds
+    if not values:
+        return None
+    values = sorted(values)
+    return {
+        name: round(values[min(len(values) - 1, int(fraction * len(values)))] * 1000, 1)
+        for name, fraction in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99))
+    }
+
+
+async def run_ticks(tick, running):
+    # Call tick() SIM_HZ times a second for as long as running() holds, on
+    # the event loop's clock. A loop that falls far behind starts afresh
+    # instead of running a burst of ticks.
+    loop = asyncio.get_running_loop()
+    next_time = loop.time()
+    while running():
+        tick()
+        next_time += game.SIM_DT
+        delay = next_time - loop.time()
+        if delay < -game.MAX_FRAME_TIME:
+            next_time = loop.time()
+            delay = 0
+        # Always yield, so packets are handled between ticks
+        await asyncio.sleep(max(delay, 0))
+
+
+class Player:
+    # A connected client as the server sees it
+    def __init__(self, index, token, writer):
+        self.index = index
+        self.token = token
+        self.writer = writer
+        self.address = None
+        # Inputs waiting for their tick, by sequence number
+        self.inputs = {}
+        self.next_input = 1
+        self.snapshot_ack = 0
+        self.ticks_without_input = 0
+        self.bytes_sent = self.bytes_received = 0
+        self.snapshots = 0
+
+
+class NetServer:
+    def __init__(self, host='0.0.0.0', port=PORT, conditioner=None, snapshot_ticks=SNAPSHOT_TICKS, max_ticks=None, seed=None):
+        self.host = host
+        self.port = port
+        self.conditioner = conditioner or LinkConditioner()
+        self.snapshot_ticks = snapshot_ticks
+        self.max_ticks = max_ticks
+        self.state = game.GameState(1, seed=seed, predictive_ai=False)
+        self.players = []
+        # Control connection handlers, see accept
+        self.handlers = []
+        self.history = {}
+        self.history_order = deque()
+        self.transport = None
+        self.listening = asyncio.Event()
+        self.ready = asyncio.Event()
+        self.disconnected = False
+        self.started = self.ended = None
+
+    async def run(self):
+        # Wait for two players, play one match and return its report
+        loop = asyncio.get_running_loop()
+        server = await asyncio.start_server(self.accept, self.host, self.port)
+        # UDP shares the TCP port number, which is also picked here when
+        # port 0 asks for a free one
+        self.port = server.sockets[0].getsockname()[1]
+        self.transport, _ = await loop.create_datagram_endpoint(lambda: DatagramHandler(self.datagram_received), local_addr=(self.host, self.port))
+        self.listening.set()
+        try:
+            await self.ready.wait()
+            self.broadcast({'type': 'start'})
+            self.started = time.perf_counter()
+            await run_ticks(self.tick, self.running)
+            self.ended = time.perf_counter()
+            if self.state.tick % self.snapshot_ticks:
+                # The final state, unless the last tick sent it already
+                self.send_snapshots()
+            report = self.report()
+            self.broadcast({'type': 'game_over', 'report': report})
+            for player in self.players:
+                await player.writer.drain()
+            return report
+        finally:
+            for player in self.players:
+                player.writer.close()
+            # Closing the connections ends their handlers
+            await asyncio.gather(*self.handlers, return_exceptions=True)
+            self.transport.close()
+            server.close()
+            await server.wait_closed()
+
+    def running(self):
+        state = self.state
+        if self.max_ticks is not None and state.tick >= self.max_ticks:
+            return False
+        return not state.is_over() and not self.disconnected
+
+    async def accept(self, reader, writer):
+        if len(self.players) == 2:
+            writer.write(b'{"type": "full"}\n')
+            writer.close()
+            return
+        player = Player(len(self.players), random.getrandbits(32), writer)
+        self.players.append(player)
+        self.handlers.append(asyncio.current_task())
+        self.send_message(player, {
+            'type': 'welcome',
+            'player': player.index,
+            'token': player.token,
+            'udp_port': self.port,
+            'tick_rate': game.SIM_HZ,
+            'snapshot_ticks': self.snapshot_ticks,
+        })
+        # A closed control connection means the player left
+        try:
+            while await reader.read(4096):
+                pass
+        except ConnectionError:
+            pass
+        self.disconnected = True
+
+    def send_message(self, player, message):
+        data = json.dumps(message).encode() + b'\n'
+        player.bytes_sent += len(data)
+        player.writer.write(data)
+
+    def broadcast(self, message):
+        for player in self.players:
+            self.send_message(player, message)
+
+    def datagram_received(self, packet, address):
+        if len(packet) < INPUT_HEADER.size:
+            return
+        packet_type, token, newest, snapshot_ack, count = INPUT_HEADER.unpack_from(packet)
+        player = next((player for player in self.players if player.token == token), None)
+        if packet_type != INPUT or player is None:
+            return
+        player.address = address
+        player.bytes_received += len(packet)
+        player.snapshot_ack = max(player.snapshot_ack, snapshot_ack)
+
+        # Queue the inputs not applied yet
+        first = newest - count + 1
+        last = self.state.tick + MAX_INPUT_BACKLOG
+        for offset, inputs in enumerate(packet[INPUT_HEADER.size:INPUT_HEADER.size + count]):
+            sequence = first + offset
+            if player.next_input <= sequence <= last:
+                player.inputs[sequence] = inputs
+        if player.inputs and newest - player.next_input >= MAX_INPUT_BACKLOG:
+            player.next_input = newest - MAX_INPUT_BACKLOG + 1
+            player.inputs = {sequence: inputs for sequence, inputs in player.inputs.items() if sequence >= player.next_input}
+
+        if all(player.address for player in self.players) and len(self.players) == 2:
+            self.ready.set()
+
+    def next_input(self, player):
+        # Each tick applies the player's next input in order; one that is
+        # late or lost holds the paddle still until it arrives
+        inputs = player.inputs.pop(player.next_input, None)
+        if inputs is None:
+            player.ticks_without_input += 1
+            return 0
+        player.next_input += 1
+        return inputs
+
+    def catch_up(self, player, paddle):
+        # After a late input the ones behind it queue up; one extra of them
+        # per tick is applied until the queue is down to the next input
+        if player.next_input + 1 in player.inputs and player.next_input in player.inputs:
+            game.move_by_inputs(paddle, self.next_input(player))
+
+    def tick(self):
+        state = self.state
+        self.catch_up(self.players[0], state.player_paddle)
+        self.catch_up(self.players[1], state.ai_paddle)
+        left, right = (self.next_input(player) for player in self.players)
+        game.step(state, left, opponent_inputs=right)
+        if self.state.tick % self.snapshot_ticks == 0:
+            self.send_snapshots()
+
+    def send_snapshots(self):
+        tick = self.state.tick
+        values = snapshot_values(self.state)
+        remember(self.history, self.history_order, tick, values)
+        for player in self.players:
+            if player.address is None:
+                continue
+            base = self.history.get(player.snapshot_ack)
+            base_tick = player.snapshot_ack if base is not None else 0
+            packet = encode_snapshot(tick, base_tick, player.next_input - 1, values, base)
+            player.bytes_sent += len(packet)
+            player.snapshots += 1
+            self.conditioner.send(lambda packet, address=player.address: self.send_packet(packet, address), packet)
+
+    def send_packet(self, packet, address):
+        # Packets held back by the conditioner may be due after the match
+        if not self.transport.is_closing():
+            self.transport.sendto(packet, address)
+
+    def report(self):
+        state = self.state
+        seconds = self.ended - self.started
+        return {
+            'ticks': state.tick,
+            'seconds': round(seconds, 2),
+            'finished': state.is_over(),
+            'scores': [state.player_paddle.score, state.ai_paddle.score],
+            'dropped_packets': self.conditioner.dropped,
+            'players': [
+                {
+                    'player': player.index,
+                    'bytes_sent': player.bytes_sent,
+                    'bytes_received': player.bytes_received,
+                    'kbit_per_second_sent': round(player.bytes_sent * 8 / 1000 / seconds, 2) if seconds else None,
+                    'kbit_per_second_received': round(player.bytes_received * 8 / 1000 / seconds, 2) if seconds else None,
+                    'snapshots': player.snapshots,
+                    'bytes_per_snapshot': round(player.bytes_sent / player.snapshots, 1) if player.snapshots else None,
+                    'ticks_without_input': player.ticks_without_input,
+                }
+                for player in self.players
+            ],
+        }
+
+
+def follow_ball(state, paddle):
+    # Scripted client: keep the paddle's centre on the ball's
+    ball_y = state.ball.rect.centery
+    if ball_y < paddle.rect.centery - paddle.speed:
+        return game.INPUT_UP
+    if ball_y > paddle.rect.centery + paddle.speed:
+        return game.INPUT_DOWN
+    return 0
+
+
+class NetClient:
+    def __init__(self, host, port=PORT, conditioner=None, display=False):
+        self.host = host
+        self.port = port
+        self.conditioner = conditioner or LinkConditioner()
+        # Without a display the paddle is scripted (follow_ball)
+        self.display = display
+        self.state = game.GameState(1, seed=0, predictive_ai=False)
+        self.index = self.token = None
+        self.paddle = self.other_paddle = None
+        self.transport = None
+        self.started = asyncio.Event()
+        self.over = asyncio.Event()
+        self.server_report = None
+
+        # Prediction: inputs not yet acknowledged as (sequence, inputs), and
+        # when each was sent, for the input-to-update latency
+        self.sequence = 0
+        self.pending = deque()
+        self.sent_times = {}
+        self.input_ack = 0
+        self.latencies = []
+        self.corrections = 0
+
+        self.history = {}
+        self.history_order = deque()
+        self.snapshot_tick = 0
+        self.snapshot_time = None
+        self.snapshot_interval = SNAPSHOT_TICKS * game.SIM_DT
+        self.snapshots = self.stale_snapshots = self.undecodable_snapshots = 0
+        self.bytes_sent = self.bytes_received = 0
+
+    async def run(self):
+        # Join a match, play it and return the client's report
+        loop = asyncio.get_running_loop()
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        welcome = await self.read_message(reader)
+        if welcome is None or welcome['type'] != 'welcome':
+            writer.close()
+            raise NetError(f"Server refused the connection: {welcome}")
+        self.index, self.token = welcome['player'], welcome['token']
+        self.snapshot_interval = welcome['snapshot_ticks'] * game.SIM_DT
+        # Player 0 has the left paddle, player 1 the right one
+        if self.index == 0:
+            self.paddle, self.other_paddle = self.state.player_paddle, self.state.ai_paddle
+        else:
+            self.paddle, self.other_paddle = self.state.ai_paddle, self.state.player_paddle
+
+        self.transport, _ = await loop.create_datagram_endpoint(lambda: DatagramHandler(self.datagram_received), remote_addr=(self.host, welcome['udp_port']))
+        control = asyncio.ensure_future(self.read_control(reader))
+        try:
+            # Until the server has heard from both players
+            while not self.started.is_set() and not self.over.is_set():
+                self.send_inputs()
+                try:
+                    await asyncio.wait_for(self.started.wait(), HELLO_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+
+            tasks = [run_ticks(self.tick, lambda: not self.over.is_set())]
+            if self.display:
+                tasks.append(self.draw_loop())
+            await asyncio.gather(*tasks)
+        finally:
+            control.cancel()
+            writer.close()
+            self.transport.close()
+        return self.report()
+
+    async def read_message(self, reader):
+        line = await reader.readline()
+        if not line:
+            return None
+        self.bytes_received += len(line)
+        return json.loads(line)
+
+    async def read_control(self, reader):
+        while True:
+            message = await self.read_message(reader)
+            if message is None or message['type'] == 'game_over':
+                self.server_report = message and message['report']
+                self.over.set()
+                return
+            if message['type'] == 'start':
+                self.started.set()
+
+    def send_inputs(self):
+        resent = list(self.pending)[-MAX_RESENT_INPUTS:]
+        packet = INPUT_HEADER.pack(INPUT, self.token, self.sequence, self.snapshot_tick, len(resent))
+        packet += bytes(inputs for _, inputs in resent)
+        self.bytes_sent += len(packet)
+        self.conditioner.send(self.send_packet, packet)
+
+    def send_packet(self, packet):
+        if not self.transport.is_closing():
+            self.transport.sendto(packet)
+
+    def tick(self):
+        # Sample and send this tick's input, and apply it straight away
+        if self.display:
+            inputs = game.controls.sample()
+        else:
+            inputs = follow_ball(self.state, self.paddle)
+        self.sequence += 1
+        self.pending.append((self.sequence, inputs))
+        self.sent_times[self.sequence] = time.perf_counter()
+        game.move_by_inputs(self.paddle, inputs)
+        self.send_inputs()
+
+    def datagram_received(self, packet, address):
+        if len(packet) < SNAPSHOT_HEADER.size or packet[0] != SNAPSHOT:
+            return
+        self.bytes_received += len(packet)
+        snapshot = decode_snapshot(packet, self.history)
+        if snapshot is None:
+            self.undecodable_snapshots += 1
+            return
+        tick, input_ack, values = snapshot
+        if tick <= self.snapshot_tick:
+            # Overtaken by a newer one on the way
+            self.stale_snapshots += 1
+            return
+        self.snapshots += 1
+        self.snapshot_tick = tick
+        remember(self.history, self.history_order, tick, values)
+
+        now = time.perf_counter()
+        for sequence in range(self.input_ack + 1, input_ack + 1):
+            sent = self.sent_times.pop(sequence, None)
+            if sent is not None:
+                self.latencies.append(now - sent)
+        self.input_ack = max(self.input_ack, input_ack)
+        while self.pending and self.pending[0][0] <= self.input_ack:
+            self.pending.popleft()
+        self.apply_snapshot(values)
+        self.snapshot_time = now
+
+    def apply_snapshot(self, values):
+        state = self.state
+        left_y, right_y, ball_x, ball_y, player_score, ai_score, ball_z = values
+        own_y, other_y = (left_y, right_y) if self.index == 0 else (right_y, left_y)
+
+        # Reconcile: start from the server's position and replay the inputs
+        # it has not applied yet
+        predicted_y = self.paddle.rect.y
+        self.paddle.rect.y = own_y
+        for _, inputs in self.pending:
+            game.move_by_inputs(self.paddle, inputs)
+        if self.paddle.rect.y != predicted_y:
+            self.corrections += 1
+
+        # The rest is drawn between this snapshot and the one before
+        self.other_paddle.save_position()
+        self.other_paddle.rect.y = other_y
+        ball = state.ball
+        ball.save_position()
+        ball.x, ball.y = ball_x / POSITION_SCALE, ball_y / POSITION_SCALE
+        ball.rect.topleft = (ball.x, ball.y)
+        ball.z_position = ball_z
+        if (player_score, ai_score) != (state.player_paddle.score, state.ai_paddle.score):
+            # A point was scored and the ball served, so it jumps
+            ball.save_position()
+            state.player_paddle.score, state.ai_paddle.score = player_score, ai_score
+
+    async def draw_loop(self):
+        court = game.Court()
+        renderer = game.DirtyRectRenderer(court)
+        while not self.over.is_set():
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE):
+                    self.over.set()
+                game.handle_display_event(event)
+                game.controls.handle(event)
+            alpha = 1.0
+            if self.snapshot_time is not None:
+                alpha = min((time.perf_counter() - self.snapshot_time) / self.snapshot_interval, 1.0)
+            # The predicted paddle is drawn where it is now
+            self.paddle.save_position()
+            game.draw_frame(court, renderer, self.state, alpha, local_player=self.index)
+            await asyncio.sleep(1 / game.FRAME_RATE)
+
+    def report(self):
+        return {
+            'player': self.index,
+            'ticks': self.sequence,
+            'snapshots': self.snapshots,
+            'stale_snapshots': self.stale_snapshots,
+            'undecodable_snapshots': self.undecodable_snapshots,
+            'corrections': self.corrections,
+            'bytes_sent': self.bytes_sent,
+            'bytes_received': self.bytes_received,
+            'input_to_update_ms': percentiles(self.latencies),
+            'dropped_packets': self.conditioner.dropped,
+        }
+
+
+def draw_result(client):
+    # Game over screen from this player's side. Players are numbered from
+    # the left paddle, and there is no AI and no next level to announce.
+    own, other = client.paddle.score, client.other_paddle.score
+    you, opponent = client.index + 1, 2 - client.index
+    game.draw_gradient('win' if own > other else 'lose')
+    if own > other:
+        game.show_message("YOU WIN!", 64, -50, game.GREEN)
+        game.show_message(f"Player {you} (you) beats Player {opponent} {own}-{other}", 36, 20)
+    elif own < other:
+        game.show_message("YOU LOSE", 64, -50, game.RED)
+        game.show_message(f"Player {opponent} beats Player {you} (you) {other}-{own}", 36, 20)
+    else:
+        game.show_message("DRAW", 64, -50, game.YELLOW)
+        game.show_message(f"Players {you} (you) and {opponent} tie {own}-{other}", 36, 20)
+    game.show_message("Press any key to quit", 30, 80)
+    if own != other:
+        game.draw_result_art(own > other)
+    game.present()
+
+
+def show_result(client):
+    # Result screen until a key is pressed, redrawn if the window changes
+    draw_result(client)
+    while True:
+        event = pygame.event.wait()
+        if game.handle_display_event(event):
+            draw_result(client)
+        elif event.type in (pygame.QUIT, pygame.KEYDOWN):
+            return
+
+
+async def selftest(args):
+    # A server and two scripted clients over localhost, each end sending
+    # through its own conditioned link
+    def link(seed):
+        return LinkConditioner(args.latency, args.jitter, args.loss, seed=seed)
+
+    server = NetServer('127.0.0.1', 0, link(0), args.snapshot_ticks, args.max_ticks, args.seed)
+    server_task = asyncio.ensure_future(server.run())
+    await server.listening.wait()
+    clients = [NetClient('127.0.0.1', server.port, link(index + 1)) for index in range(2)]
+    results = await asyncio.gather(server_task, *(client.run() for client in clients))
+    return {'server': results[0], 'clients': results[1:]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Play Pickle Ball against another player over the network")
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--latency', type=float, default=0.0, help="simulated one-way latency of sent packets in ms")
+    parser.add_argument('--jitter', type=float, default=0.0, help="simulated latency variation in ms, +/-")
+    parser.add_argument('--loss', type=float, default=0.0, help="simulated packet loss, e.g. 0.05 for 5%%")
+    commands = parser.add_subparsers(dest='command', required=True)
+    server_parser = commands.add_parser('server', help="host a match")
+    server_parser.add_argument('--host', default='0.0.0.0')
+    client_parser = commands.add_parser('client', help="join a match")
+    client_parser.add_argument('host')
+    test_parser = commands.add_parser('selftest', help="two scripted clients against a local server")
+    for command in (server_parser, test_parser):
+        command.add_argument('--snapshot-ticks', type=int, default=SNAPSHOT_TICKS, help="server ticks per snapshot")
+        command.add_argument('--max-ticks', type=int, default=None, help="end the match after this many ticks")
+        command.add_argument('--seed', type=int, default=None)
+    test_parser.set_defaults(max_ticks=game.SIM_HZ * 10)
+    args = parser.parse_args()
+    link = LinkConditioner(args.latency, args.jitter, args.loss)
+
+    if args.command == 'server':
+        server = NetServer(args.host, args.port, link, args.snapshot_ticks, args.max_ticks, args.seed)
+        print(f"Waiting for two players on port {args.port}", file=sys.stderr)
+        report = asyncio.run(server.run())
+    elif args.command == 'client':
+        game.init()
+        client = NetClient(args.host, args.port, link, display=True)
+        report = asyncio.run(client.run())
+        if client.server_report is not None:
+            show_result(client)
+        pygame.quit()
+    else:
+        report = asyncio.run(selftest(args))
+    json.dump(report, sys.stdout, indent=2)
+    sys.stdout.write('\n')
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,28 +1,36 @@
+import time
+
+# Process launch, for the cold start measurement
+LAUNCH_TIME = time.perf_counter()
+
 import pygame
 import sys
 import random
 import math
-import time
-import os
-
-# Initialize pygame
-pygame.init()
-
-# Try to initialize mixer for sound, but continue if it fails
+from array import array
+from collections import OrderedDict
+import replay
+from profiler import FrameProfiler
+from capture import FrameCapture
+from audio import AudioManager, NullAudio
+from stats import StatsRecorder
+from controls import InputPipeline, INPUT_UP, INPUT_DOWN, INPUT_SPEED_SHIFT, INPUT_SPEED_STEPS
+
+# NumPy is optional: it only speeds up sound synthesis
 try:
-    pygame.mixer.init()
-    sounds_enabled = True
-except:
-    print("Could not initialize sound system. Game will run without audio.")
-    sounds_enabled = False
+    import numpy
+except ImportError:
+    numpy = None
 
-# Constants
+# Constants. The simulation runs in this fixed logical space whatever the
+# size of the window; drawing scales it to the output (see px())
 WIDTH, HEIGHT = 800, 600
 PADDLE_WIDTH, PADDLE_HEIGHT = 15, 100
 BALL_SIZE = 15
 PADDLE_SPEED = 8
 BALL_SPEED = 5
 MAX_SCORE = 20
+MAX_DIFFICULTY = 10
 WHITE = (255, 255, 255)
 BLACK = (0, 0, 0)
 GREEN = (0, 255, 0)
@@ -31,67 +39,340 @@ RED = (255, 0, 0)
 YELLOW = (255, 255, 0)
 LIGHT_BLUE = (173, 216, 230)
 GRAY = (128, 128, 128)
-
-# Create the screen
-screen = pygame.display.set_mode((WIDTH, HEIGHT))
-pygame.display.set_caption("Pickle Ball - 3D Enhanced")
-
-# Clock for controlling game speed
-clock = pygame.time.Clock()
-
-# Create directory for sounds if it doesn't exist
-sounds_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sounds")
-os.makedirs(sounds_dir, exist_ok=True)
-
-# Generate sound files if they don't exist
-def generate_sound_files():
+TEXT_SHADOW_COLOR = (50, 50, 50)
+
+# Fixed simulation step: speeds are in pixels per tick, and the game loop
+# advances the simulation in whole ticks whatever the display frame rate
+SIM_HZ = 60
+SIM_DT = 1.0 / SIM_HZ
+# Longest frame the simulation catches up on, so a stall cannot snowball
+MAX_FRAME_TIME = 0.25
+# Render frame rate cap
+FRAME_RATE = 60
+# While a match waits for its next frame, input events are taken off the
+# queue this often (seconds), so they are timestamped close to arrival
+INPUT_POLL_INTERVAL = 0.001
+
+# AI opponent aims at the ball's predicted landing spot (Paddle.intercept)
+# instead of chasing its current height
+PREDICTIVE_AI = True
+
+# Hard AI tier (LookaheadAI): plays each return out ahead of time and aims
+# it away from the player. It may search for HARD_AI_BUDGET seconds per
+# tick, trying the points on its paddle face in HARD_AI_OFFSETS (-1 top
+# edge, 1 bottom edge), safest first so a search cut short has a sound
+# answer.
+HARD_AI = False
+HARD_AI_BUDGET = 0.001
+HARD_AI_OFFSETS = (0.0, -0.3, 0.3, -0.5, 0.5, -0.7, 0.7, -0.85, 0.85, -0.95, 0.95)
+
+# Balls in play per match; more than one is the multi-ball party and
+# stress mode, see MultiBall
+BALL_COUNT = 1
+# Slowest a ball may cross the court after bouncing off another ball
+MIN_BALL_SPEED_X = BALL_SPEED / 2
+
+# Player input bits for one simulation tick are INPUT_UP and INPUT_DOWN,
+# with an analog speed from a gamepad stick in the bits from
+# INPUT_SPEED_SHIFT up (see controls.py)
+
+# Record every match to a replay session file under replays/
+RECORD_REPLAYS = True
+# Keep match, rally and paddle hit statistics in stats.db
+RECORD_STATS = True
+
+# Render mode: only push the regions that changed to the display each frame
+# instead of redrawing and flipping the whole screen
+DIRTY_RECT_RENDERING = True
+
+# Output: a resizable window of WINDOW_SIZE to start with, or the whole
+# display in fullscreen (FULLSCREEN_KEY switches). A RENDER_DIVISOR of N
+# draws frames at 1/N of the output resolution and scales them up N times,
+# for hardware that cannot fill a large screen at the frame rate.
+WINDOW_SIZE = (WIDTH, HEIGHT)
+FULLSCREEN = False
+FULLSCREEN_KEY = pygame.K_F11
+RENDER_DIVISOR = 1
+
+# Cold start target from launch to the first complete menu frame
+STARTUP_TIME_TARGET = 1.0
+# Seconds from launch to the first frame, set once it is shown
+startup_time = None
+# Exit right after the first frame and report the cold start time
+measure_startup = False
+
+# Frame time profiler (see profiler.py), None while profiling is off so
+# the game loop's hooks cost next to nothing
+profiler = None
+# Shows or hides the frame time overlay, starting the profiler if needed
+PROFILER_KEY = pygame.K_F3
+
+# Rolling capture of the last seconds of play (see capture.py), None
+# unless started with --capture; set before init(), since fit_display()
+# sizes its ring
+capture = None
+# Saves the captured frames as a clip
+CAPTURE_KEY = pygame.K_F9
+
+# Match statistics (see stats.py), None unless the game was started with
+# RECORD_STATS on; headless simulations never record
+stats = None
+
+# The game's Session, with its replay recorder, set by main() so
+# quit_game() can close it
+session = None
+
+# Keyboard and gamepad input (see controls.py), read by the playing scene
+# right before it steps the simulation
+controls = InputPipeline()
+
+# Menu ball animation: seconds it runs and bounce phase speed in radians
+# per second
+INTRO_ANIMATION_TIME = 1.0
+INTRO_BOUNCE_SPEED = 6.0
+
+# Display, clock, sounds and gamepads are set up by init(), not on import,
+# so tools and test workers can import this module without opening a window.
+# Sounds go through `audio` (see audio.py), which drops them until
+# init_audio() sets up the mixer.
+screen = None
+clock = None
+audio = NullAudio()
+
+# The court fills `viewport`, the largest area of the window with its
+# aspect ratio, centered with black bars around it. `screen` is what is
+# drawn on: that area of the window itself, or with a RENDER_DIVISOR a
+# smaller surface that present() scales up into it, `output`. pixel_scale
+# is screen pixels per logical unit, and display_generation counts refits,
+# so cached frames know when they are out of date.
+viewport = None
+output = None
+window_size = None
+pixel_scale = 1.0
+display_generation = 0
+
+# Synthesized sounds, cached by name
+sound_cache = {}
+
+# Beeps as (frequency in Hz, seconds) notes and volume
+SOUND_SPECS = {
     # Paddle hit sound (simple beep)
-    if not os.path.exists(os.path.join(sounds_dir, "paddle_hit.wav")):
-        pygame.mixer.Sound(bytes(bytearray([0] * 10 + [127] * 100 + [0] * 10))).save(os.path.join(sounds_dir, "paddle_hit.wav"))
-
+    'paddle_hit': ([(440, 0.05)], 0.4),
     # Wall hit sound (lower beep)
-    if not os.path.exists(os.path.join(sounds_dir, "wall_hit.wav")):
-        pygame.mixer.Sound(bytes(bytearray([0] * 10 + [80] * 100 + [0] * 10))).save(os.path.join(sounds_dir, "wall_hit.wav"))
-
+    'wall_hit': ([(220, 0.04)], 0.3),
     # Score sound (higher beep)
-    if not os.path.exists(os.path.join(sounds_dir, "score.wav")):
-        pygame.mixer.Sound(bytes(bytearray([0] * 10 + [200] * 300 + [0] * 10))).save(os.path.join(sounds_dir, "score.wav"))
-
+    'score': ([(880, 0.15)], 0.5),
     # Win sound (victory tune)
-    if not os.path.exists(os.path.join(sounds_dir, "win.wav")):
-        pygame.mixer.Sound(bytes(bytearray([0] * 10 + [150] * 100 + [0] * 10 + [200] * 100 + [0] * 10 + [250] * 200 + [0] * 10))).save(os.path.join(sounds_dir, "win.wav"))
-
+    'win': ([(523, 0.1), (659, 0.1), (784, 0.2)], 0.7),
     # Lose sound (sad tune)
-    if not os.path.exists(os.path.join(sounds_dir, "lose.wav")):
-        pygame.mixer.Sound(bytes(bytearray([0] * 10 + [200] * 100 + [0] * 10 + [150] * 100 + [0] * 10 + [100] * 200 + [0] * 10))).save(os.path.join(sounds_dir, "lose.wav"))
-
-# Try to generate sound files
-try:
-    generate_sound_files()
-
-    # Load sounds
-    paddle_hit_sound = pygame.mixer.Sound(os.path.join(sounds_dir, "paddle_hit.wav"))
-    wall_hit_sound = pygame.mixer.Sound(os.path.join(sounds_dir, "wall_hit.wav"))
-    score_sound = pygame.mixer.Sound(os.path.join(sounds_dir, "score.wav"))
-    win_sound = pygame.mixer.Sound(os.path.join(sounds_dir, "win.wav"))
-    lose_sound = pygame.mixer.Sound(os.path.join(sounds_dir, "lose.wav"))
-
-    # Set volume
-    paddle_hit_sound.set_volume(0.4)
-    wall_hit_sound.set_volume(0.3)
-    score_sound.set_volume(0.5)
-    win_sound.set_volume(0.7)
-    lose_sound.set_volume(0.7)
-
-    sounds_enabled = True
-except:
-    print("Could not initialize sounds. Game will run without audio.")
-    sounds_enabled = False
+    'lose': ([(392, 0.1), (330, 0.1), (262, 0.2)], 0.7),
+}
+
+# Category of each sound, and the mixer channels reserved per category
+SOUND_CATEGORIES = {'paddle_hit': 'hits', 'wall_hit': 'hits', 'score': 'score', 'win': 'results', 'lose': 'results'}
+SOUND_CHANNELS = {'hits': 4, 'score': 1, 'results': 1}
+# Shortest time in seconds before the same sound may play again
+SOUND_MIN_INTERVAL = {'paddle_hit': 0.05, 'wall_hit': 0.08, 'score': 0.1}
+
+def init_display():
+    global clock
+    if screen is not None:
+        return screen
+    pygame.display.init()
+    pygame.font.init()
+
+    # Create the window
+    set_display_mode(FULLSCREEN)
+    pygame.display.set_caption("Pickle Ball - 3D Enhanced")
+
+    # Clock for controlling game speed
+    clock = pygame.time.Clock()
+    return screen
+
+def set_display_mode(fullscreen):
+    # Fullscreen at the desktop resolution, or a resizable window at the
+    # size it last had
+    if fullscreen:
+        pygame.display.set_mode((0, 0), pygame.FULLSCREEN)
+    else:
+        pygame.display.set_mode(WINDOW_SIZE, pygame.RESIZABLE)
+    fit_display()
+
+def toggle_fullscreen():
+    set_display_mode(not pygame.display.get_surface().get_flags() & pygame.FULLSCREEN)
+
+def fit_display():
+    # Lay the court out in the window at its current size and drop every
+    # asset pre-rendered for the old one
+    global screen, viewport, output, window_size, pixel_scale, display_generation, WINDOW_SIZE
+    window = pygame.display.get_surface()
+    window_size = window.get_size()
+    if not window.get_flags() & pygame.FULLSCREEN:
+        WINDOW_SIZE = window_size
+    pixel_scale = min(window_size[0] / WIDTH, window_size[1] / HEIGHT) / RENDER_DIVISOR
+    size = (max(1, px(WIDTH)), max(1, px(HEIGHT)))
+    viewport = pygame.Rect(0, 0, size[0] * RENDER_DIVISOR, size[1] * RENDER_DIVISOR)
+    viewport.center = (window_size[0] // 2, window_size[1] // 2)
+    window.fill(BLACK)
+    output = window.subsurface(viewport)
+    screen = output if RENDER_DIVISOR == 1 else pygame.Surface(size).convert()
+    if capture:
+        # Clips keep frames at no more than the logical resolution
+        capture.allocate(screen, (WIDTH, HEIGHT))
+    display_generation += 1
+    fonts.clear()
+    text_cache.clear()
+    gradients.clear()
+    ball_sprites.clear()
+
+def display_resized():
+    # The window changed size since it was last fitted. pygame resizes it
+    # while pumping events, before the VIDEORESIZE event is handled, and
+    # the screen must not be drawn on until it is fitted again.
+    return pygame.display.get_surface().get_size() != window_size
+
+def handle_display_event(event):
+    # Window resizes and the fullscreen key; returns True if the display
+    # changed and the scene must be drawn again
+    if event.type == pygame.VIDEORESIZE:
+        if not display_resized():
+            return False
+        fit_display()
+        return True
+    if event.type == pygame.KEYDOWN and event.key == FULLSCREEN_KEY:
+        toggle_fullscreen()
+        return True
+    return False
+
+def present(rects=None):
+    # Push the frame to the display: all of it, or just the given areas of
+    # the screen. A screen drawn below the output resolution has those
+    # areas scaled up into the window first; scaling by a whole factor
+    # repeats each pixel, so areas scaled apart match the frame scaled whole.
+    n = RENDER_DIVISOR
+    if screen is not output:
+        bounds = screen.get_rect()
+        for rect in [bounds] if rects is None else rects:
+            rect = rect.clip(bounds)
+            if rect:
+                target = pygame.Rect(rect.x * n, rect.y * n, rect.width * n, rect.height * n)
+                pygame.transform.scale(screen.subsurface(rect), target.size, output.subsurface(target))
+    if rects is None:
+        pygame.display.flip()
+    else:
+        left, top = viewport.topleft
+        pygame.display.update([pygame.Rect(left + rect.x * n, top + rect.y * n, rect.width * n, rect.height * n) for rect in rects])
+
+def px(value):
+    # Logical units to screen pixels; the small bias keeps float error in
+    # the scale from dropping a pixel off exact results like 600 * 0.4
+    return int(value * pixel_scale + 1e-9)
+
+def px_rect(x, y, width, height):
+    # Logical rectangle to screen pixels. The edges are scaled rather than
+    # the size, so rectangles that meet in logical space still meet.
+    left, top = px(x), px(y)
+    return pygame.Rect(left, top, px(x + width) - left, px(y + height) - top)
+
+def px_point(point):
+    return (px(point[0]), px(point[1]))
+
+def synthesize_samples(notes, rate):
+    # Square wave notes with a short fade at both ends to avoid clicks,
+    # as signed 16-bit samples
+    if numpy is not None:
+        parts = []
+        for frequency, duration in notes:
+            count = int(rate * duration)
+            period = rate / frequency
+            i = numpy.arange(count)
+            wave = numpy.where(i % period < period / 2, 12000, -12000)
+            fade = numpy.minimum(1.0, numpy.minimum(i, count - i) / (0.005 * rate))
+            parts.append(wave * fade)
+        return numpy.concatenate(parts).astype(numpy.int16)
+
+    samples = array('h')
+    for frequency, duration in notes:
+        count = int(rate * duration)
+        period = rate / frequency
+        for i in range(count):
+            fade = min(1.0, min(i, count - i) / (0.005 * rate))
+            samples.append(int((12000 if (i % period) < period / 2 else -12000) * fade))
+    return samples
+
+def synthesize_sound(name):
+    # Build a beep in memory for the mixer's format, cached per name
+    sound = sound_cache.get(name)
+    if sound is not None:
+        return sound
+    notes, volume = SOUND_SPECS[name]
+    rate, sample_format, channels = pygame.mixer.get_init()
+    if sample_format != -16:
+        raise ValueError(f"Unsupported mixer sample format {sample_format}")
+    samples = synthesize_samples(notes, rate)
+    if numpy is not None:
+        if channels > 1:
+            samples = numpy.repeat(samples[:, None], channels, axis=1)
+        sound = pygame.sndarray.make_sound(numpy.ascontiguousarray(samples))
+    else:
+        if channels > 1:
+            samples = array('h', (value for value in samples for _ in range(channels)))
+        sound = pygame.mixer.Sound(buffer=samples.tobytes())
+    sound.set_volume(volume)
+    sound_cache[name] = sound
+    return sound
+
+def init_audio():
+    global audio
+    if isinstance(audio, AudioManager):
+        return True
+
+    # Try to initialize mixer for sound, but continue if it fails
+    try:
+        pygame.mixer.init(size=-16)
+        sounds = {name: synthesize_sound(name) for name in SOUND_SPECS}
+        audio = AudioManager(sounds, SOUND_CATEGORIES, SOUND_CHANNELS, SOUND_MIN_INTERVAL)
+    except (pygame.error, ValueError):
+        print("Could not initialize sounds. Game will run without audio.")
+        return False
+    return True
+
+def init_input():
+    # Start the joystick subsystem, so gamepads plugged in before or during
+    # play arrive as JOYDEVICEADDED events for `controls`
+    try:
+        pygame.joystick.init()
+    except pygame.error:
+        print("Could not initialize gamepads. Game will use the keyboard only.")
+        return False
+    return True
+
+def init():
+    # Explicit, lazy setup of everything the windowed game needs
+    init_display()
+    init_audio()
+    init_input()
+
+def mark_first_frame():
+    # Record the cold start time once the first complete frame is shown
+    global startup_time
+    if startup_time is not None:
+        return
+    startup_time = time.perf_counter() - LAUNCH_TIME
+    if measure_startup:
+        print(f"Cold start: {startup_time * 1000:.0f} ms (target {STARTUP_TIME_TARGET * 1000:.0f} ms)")
+        quit_game(0 if startup_time <= STARTUP_TIME_TARGET else 1)
+    if startup_time > STARTUP_TIME_TARGET:
+        print(f"Cold start took {startup_time * 1000:.0f} ms, over the {STARTUP_TIME_TARGET * 1000:.0f} ms target")
 
 # Game objects
 class Paddle:
-    def __init__(self, x, y, width, height, color, speed, is_ai=False):
+    def __init__(self, x, y, width, height, color, speed, is_ai=False, rng=None, predictive=False):
         self.rect = pygame.Rect(x, y, width, height)
+        # Position at the start of the current tick, for interpolated drawing
+        self.previous = self.rect.topleft
+        # Random source for the AI, seeded per match for reproducible games
+        self.rng = rng if rng is not None else random.Random()
         self.color = color
         self.speed = speed
         self.score = 0
@@ -99,6 +380,15 @@ class Paddle:
         # 3D effect attributes
         self.shadow_depth = 8
         self.shadow_color = self.darken_color(color, 0.5)
+        # Last AI decision, see ai_move
+        self.decision = 0
+        # Predictive AI: target for the ball's current volley, see intercept
+        self.predictive = predictive
+        self.target_ball = None
+        self.target_volley = None
+        self.target_y = None
+        # Hard AI: the LookaheadAI choosing this paddle's returns, if any
+        self.planner = None
 
     def darken_color(self, color, factor):
         r, g, b = color
@@ -107,66 +397,154 @@ class Paddle:
     def reset_score(self):
         self.score = 0
 
-    def move(self, up=False, down=False):
+    def move(self, up=False, down=False, amount=1.0):
+        # amount is the fraction of full speed, from an analog stick
+        distance = self.speed if amount == 1.0 else round(self.speed * amount)
         if up and self.rect.top > 0:
-            self.rect.y -= self.speed
+            self.rect.y -= distance
         if down and self.rect.bottom < HEIGHT:
-            self.rect.y += self.speed
+            self.rect.y += distance
 
     def ai_move(self, ball, difficulty):
-        # AI logic to track the ball
-        if self.is_ai:
-            # Predict where the ball will be
+        # AI logic to track the ball. The direction chosen this tick is kept
+        # in self.decision as INPUT_UP/INPUT_DOWN bits (0 for none).
+        self.decision = 0
+        if self.is_ai and self.planner:
+            # Head for the return picked by the lookahead search
+            self.steer(self.planner.target_y(ball))
+        elif self.is_ai and self.predictive:
+            # Head for the landing spot worked out once per volley
+            self.steer(self.intercept(ball, difficulty))
+        elif self.is_ai:
+            # Chase the ball
             if ball.speed_x > 0:  # Only move if the ball is coming towards the AI
                 # Add some imperfection to the AI based on difficulty
-                if random.random() < difficulty / 10:
+                if self.rng.random() < difficulty / 10:
                     # Calculate target y position with some randomness
                     # Higher difficulties have less randomness
                     random_factor = int(40 - (difficulty * 3))
-                    target_y = ball.rect.y - (self.rect.height / 2) + random.randint(-random_factor, random_factor)
+                    target_y = ball.rect.y - (self.rect.height / 2) + self.rng.randint(-random_factor, random_factor)
 
                     # Move towards the target
                     if self.rect.y < target_y:
+                        self.decision = INPUT_DOWN
                         self.move(down=True)
                     elif self.rect.y > target_y:
+                        self.decision = INPUT_UP
                         self.move(up=True)
             else:
                 # When ball is moving away, move towards center with some randomness
                 center_y = HEIGHT / 2 - self.rect.height / 2
                 if abs(self.rect.y - center_y) > self.speed:
                     if self.rect.y > center_y:
+                        self.decision = INPUT_UP
                         self.move(up=True)
                     else:
+                        self.decision = INPUT_DOWN
                         self.move(down=True)
+        return self.decision
+
+    def steer(self, target_y):
+        # One tick towards a paddle top of target_y, stopping within half a
+        # step of it
+        if self.rect.y < target_y - self.speed / 2:
+            self.decision = INPUT_DOWN
+            self.move(down=True)
+        elif self.rect.y > target_y + self.speed / 2:
+            self.decision = INPUT_UP
+            self.move(up=True)
+
+    def intercept(self, ball, difficulty):
+        # Paddle top to aim for this volley: centered on where the ball will
+        # cross the paddle's face, or the middle of the court while the ball
+        # is heading away. It is solved only when Ball.collide or Ball.reset
+        # start a new volley, or the AI switches to another ball, with one
+        # aiming error per volley that shrinks as the difficulty goes up.
+        if ball is not self.target_ball or ball.volley != self.target_volley:
+            self.target_ball = ball
+            self.target_volley = ball.volley
+            on_right = self.rect.centerx > WIDTH // 2
+            if (ball.speed_x > 0) == on_right:
+                face_x = self.rect.left - ball.rect.width if on_right else self.rect.right
+                aim_error = 130 - difficulty * 7
+                self.target_y = (
+                    landing_y(ball, face_x) + ball.rect.height / 2 - self.rect.height / 2
+                    + self.rng.uniform(-aim_error, aim_error)
+                )
+            else:
+                self.target_y = HEIGHT / 2 - self.rect.height / 2
+        return self.target_y
+
+    def save_position(self):
+        self.previous = self.rect.topleft
+
+    def snapshot(self, balls=None):
+        # What the simulation changes, as a tuple for restore(). Far
+        # cheaper than copying the paddle with its Rect. Given the match's
+        # balls, the predictive AI's target for the volley is kept too, its
+        # ball as an index into them, so a restored match does not solve it
+        # again with new random draws.
+        snapshot = (self.rect.y, self.score, self.decision, self.previous)
+        if balls is None:
+            return snapshot
+        target = None if self.target_ball is None else balls.index(self.target_ball)
+        return snapshot + (target, self.target_volley, self.target_y)
+
+    def restore(self, snapshot, balls=None):
+        self.rect.y, self.score, self.decision, self.previous = snapshot[:4]
+        if balls is not None:
+            target, self.target_volley, self.target_y = snapshot[4:]
+            self.target_ball = None if target is None else balls[target]
+
+    def draw(self, alpha=1.0):
+        # Draw between the last two ticks; alpha is the fraction of a tick
+        # the game loop has accumulated past the latest one
+        x, y = interpolate(self.previous, self.rect.topleft, alpha, pixel_scale)
+        rect = pygame.Rect(x, y, px(self.rect.width), px(self.rect.height))
 
-    def draw(self):
         # Draw shadow (3D effect)
+        shadow_depth = px(self.shadow_depth)
         shadow_rect = pygame.Rect(
-            self.rect.x + self.shadow_depth,
-            self.rect.y + self.shadow_depth,
-            self.rect.width,
-            self.rect.height
+            rect.x + shadow_depth,
+            rect.y + shadow_depth,
+            rect.width,
+            rect.height
         )
-        pygame.draw.rect(screen, self.shadow_color, shadow_rect)
+        dirty = pygame.draw.rect(screen, self.shadow_color, shadow_rect)
 
         # Draw paddle
-        pygame.draw.rect(screen, self.color, self.rect)
+        dirty.union_ip(pygame.draw.rect(screen, self.color, rect))
 
         # Draw highlight (3D effect)
+        inset = max(1, px(2))
         highlight_rect = pygame.Rect(
-            self.rect.x + 2,
-            self.rect.y + 2,
-            self.rect.width - 4,
-            self.rect.height - 4
+            rect.x + inset,
+            rect.y + inset,
+            rect.width - 2 * inset,
+            rect.height - 2 * inset
         )
         pygame.draw.rect(screen, self.darken_color(self.color, 1.2), highlight_rect)
 
+        # Area touched on screen, for dirty rectangle updates
+        return dirty
+
 class Ball:
-    def __init__(self, x, y, size, color, speed):
+    # Slots keep a ball small, since multi-ball matches have thousands
+    __slots__ = (
+        'rect', 'rng', 'color', 'speed_x', 'speed_y', 'volley', 'x', 'y', 'previous', 'last_scorer',
+        'shadow_depth', 'shadow_color', 'highlight_color', 'z_position', 'z_speed', 'max_z',
+    )
+
+    def __init__(self, x, y, size, color, speed, rng=None):
         self.rect = pygame.Rect(x, y, size, size)
+        # Random source for serves, seeded per match for reproducible games
+        self.rng = rng if rng is not None else random.Random()
         self.color = color
         self.speed_x = speed
         self.speed_y = speed
+        # Counts serves and paddle hits, the points where the path changes
+        # other than at the walls
+        self.volley = 0
         self.reset()
         # 3D effect attributes
         self.shadow_depth = 5
@@ -198,7 +576,7 @@ class Ball:
             self.speed_x = BALL_SPEED  # Always move toward AI first
         else:
             # First serve of the game, randomly choose a side
-            if random.choice([True, False]):
+            if self.rng.choice([True, False]):
                 # Start from AI side
                 self.rect.x = WIDTH - 100 - BALL_SIZE // 2
                 self.rect.y = HEIGHT // 2 - BALL_SIZE // 2
@@ -210,104 +588,588 @@ class Ball:
                 self.speed_x = BALL_SPEED
 
         # Randomize y direction
-        self.speed_y = BALL_SPEED * random.choice([-0.7, -0.3, 0.3, 0.7])
+        self.speed_y = BALL_SPEED * self.rng.choice([-0.7, -0.3, 0.3, 0.7])
         self.z_position = 0
+        self.volley += 1
 
-    def move(self, player_paddle, ai_paddle):
-        self.rect.x += self.speed_x
-        self.rect.y += self.speed_y
-
-        # 3D effect - ball moves in z-axis
-        self.z_position += self.z_speed
-        if self.z_position > self.max_z or self.z_position < 0:
-            self.z_speed *= -1
-
-        # Bounce off top and bottom
-        if self.rect.top <= 0 or self.rect.bottom >= HEIGHT:
-            self.speed_y *= -1
-            if sounds_enabled:
-                wall_hit_sound.play()
-
-        # Score points and reset if ball goes out of bounds
-        if self.rect.left <= 0:
-            ai_paddle.score += 1
-            if sounds_enabled:
-                score_sound.play()
-            self.last_scorer = 'ai'
-            self.reset()
-            return True
-        elif self.rect.right >= WIDTH:
-            player_paddle.score += 1
-            if sounds_enabled:
-                score_sound.play()
-            self.last_scorer = 'player'
-            self.reset()
-            return True
-        return False
+        # Exact position; self.rect is this rounded to whole pixels
+        self.x, self.y = float(self.rect.x), float(self.rect.y)
+
+        # A serve jumps the ball, so it is not interpolated from its old spot
+        self.save_position()
+
+    def save_position(self):
+        self.previous = self.rect.topleft
+
+    def snapshot(self):
+        # What the simulation changes, as a tuple for restore(), like
+        # Paddle.snapshot
+        return (
+            self.x, self.y, self.speed_x, self.speed_y, self.volley, self.previous,
+            getattr(self, 'last_scorer', None), self.z_position, self.z_speed,
+        )
+
+    def restore(self, snapshot):
+        (
+            self.x, self.y, self.speed_x, self.speed_y, self.volley, self.previous,
+            self.last_scorer, self.z_position, self.z_speed,
+        ) = snapshot
+        self.rect.topleft = (self.x, self.y)
+
+    def move(self, player_paddle, ai_paddle, ticks=1):
+        # Sweep the ball along its path for `ticks` ticks. Each wall bounce,
+        # paddle hit and goal is handled at its exact time of impact, in
+        # order, so a fast ball cannot pass through a paddle. Paddles stay
+        # put for the whole span, so step() moves the ball one tick at a
+        # time; longer spans are for look-ahead. Returns True if a point was
+        # scored.
+        for _ in range(ticks):
+            # 3D effect - ball moves in z-axis
+            self.z_position += self.z_speed
+            if self.z_position > self.max_z or self.z_position < 0:
+                self.z_speed *= -1
+
+        point_scored = False
+        remaining = ticks
+        while remaining > 0:
+            # Only the paddle the ball is heading for can be hit
+            paddle = ai_paddle if self.speed_x > 0 else player_paddle
+            event_time, event = remaining, None
+
+            # Top and bottom walls
+            if self.speed_y < 0:
+                wall_time = (0 - self.y) / self.speed_y
+            elif self.speed_y > 0:
+                wall_time = (HEIGHT - self.rect.height - self.y) / self.speed_y
+            else:
+                wall_time = math.inf
+            if wall_time <= event_time:
+                event_time, event = wall_time, 'wall'
+
+            paddle_time = self.time_of_impact(paddle)
+            if paddle_time is not None and paddle_time < event_time:
+                event_time, event = paddle_time, 'paddle'
+
+            # Left and right edges
+            if self.speed_x < 0:
+                goal_time = (0 - self.x) / self.speed_x
+            else:
+                goal_time = (WIDTH - self.rect.width - self.x) / self.speed_x
+            if goal_time < event_time:
+                event_time, event = goal_time, 'goal'
+
+            self.x += self.speed_x * event_time
+            self.y += self.speed_y * event_time
+            remaining -= event_time
+            if event is None:
+                break
+
+            if event == 'wall':
+                # Bounce off top and bottom
+                self.y = 0 if self.speed_y < 0 else HEIGHT - self.rect.height
+                self.speed_y *= -1
+                audio.play('wall_hit')
+            elif event == 'paddle':
+                self.collide(paddle)
+            else:
+                # Score points and reset if ball goes out of bounds
+                if self.speed_x < 0:
+                    ai_paddle.score += 1
+                    self.last_scorer = 'ai'
+                else:
+                    player_paddle.score += 1
+                    self.last_scorer = 'player'
+                audio.play('score')
+                if stats:
+                    stats.point(self, self.last_scorer)
+                self.reset()
+                point_scored = True
+                if player_paddle.score >= MAX_SCORE or ai_paddle.score >= MAX_SCORE:
+                    return True
+                # The serve waits out the rest of the tick it was made in
+                remaining = math.floor(remaining)
+
+        self.rect.topleft = (self.x, self.y)
+        return point_scored
+
+    def time_of_impact(self, paddle):
+        # Ticks until the ball first overlaps the paddle on its current
+        # course (0 if it already does), or None if it misses. Swept AABB:
+        # the time ranges in which the two boxes overlap on each axis.
+        paddle_rect = paddle.rect
+        if self.speed_x > 0:
+            entry_x = (paddle_rect.left - self.rect.width - self.x) / self.speed_x
+            exit_x = (paddle_rect.right - self.x) / self.speed_x
+        else:
+            entry_x = (paddle_rect.right - self.x) / self.speed_x
+            exit_x = (paddle_rect.left - self.rect.width - self.x) / self.speed_x
+        if self.speed_y > 0:
+            entry_y = (paddle_rect.top - self.rect.height - self.y) / self.speed_y
+            exit_y = (paddle_rect.bottom - self.y) / self.speed_y
+        elif self.speed_y < 0:
+            entry_y = (paddle_rect.bottom - self.y) / self.speed_y
+            exit_y = (paddle_rect.top - self.rect.height - self.y) / self.speed_y
+        elif paddle_rect.top - self.rect.height < self.y < paddle_rect.bottom:
+            entry_y, exit_y = -math.inf, math.inf
+        else:
+            return None
+
+        entry_time = max(entry_x, entry_y)
+        exit_time = min(exit_x, exit_y)
+        if entry_time >= exit_time or exit_time <= 0:
+            return None
+        return max(entry_time, 0.0)
 
     def collide(self, paddle):
-        if self.rect.colliderect(paddle.rect):
-            # Play sound
-            if sounds_enabled:
-                paddle_hit_sound.play()
-
-            # Calculate bounce angle based on where the ball hits the paddle
-            relative_intersect_y = (paddle.rect.y + paddle.rect.height / 2) - (self.rect.y + self.rect.height / 2)
-            normalized_relative_intersect_y = relative_intersect_y / (paddle.rect.height / 2)
-            bounce_angle = normalized_relative_intersect_y * (math.pi / 4)  # Max 45 degrees
-
-            # Reverse x direction and adjust y based on bounce angle
-            if self.rect.x < WIDTH // 2:  # Left paddle
-                self.speed_x = abs(self.speed_x)
-                self.speed_y = -BALL_SPEED * math.sin(bounce_angle)
-            else:  # Right paddle
-                self.speed_x = -abs(self.speed_x)
-                self.speed_y = -BALL_SPEED * math.sin(bounce_angle)
-
-            # Slightly increase speed to make game progressively harder
-            self.speed_x *= 1.05
-            if abs(self.speed_x) > 15:
-                self.speed_x = 15 if self.speed_x > 0 else -15
-
-            # Change z-direction for 3D effect
-            self.z_speed *= -1
+        # Bounce off a paddle the ball has just touched
+        # Play sound
+        audio.play('paddle_hit')
+
+        # Calculate bounce angle based on where the ball hits the paddle
+        relative_intersect_y = (paddle.rect.y + paddle.rect.height / 2) - (self.y + self.rect.height / 2)
+        normalized_relative_intersect_y = relative_intersect_y / (paddle.rect.height / 2)
+        bounce_angle = normalized_relative_intersect_y * (math.pi / 4)  # Max 45 degrees
+
+        # Reverse x direction and adjust y based on bounce angle
+        if paddle.rect.centerx < WIDTH // 2:  # Left paddle
+            self.speed_x = abs(self.speed_x)
+            self.speed_y = -BALL_SPEED * math.sin(bounce_angle)
+        else:  # Right paddle
+            self.speed_x = -abs(self.speed_x)
+            self.speed_y = -BALL_SPEED * math.sin(bounce_angle)
+
+        # Slightly increase speed to make game progressively harder
+        self.speed_x *= 1.05
+        if abs(self.speed_x) > 15:
+            self.speed_x = 15 if self.speed_x > 0 else -15
+
+        # Change z-direction for 3D effect
+        self.z_speed *= -1
+        self.volley += 1
+        if stats:
+            stats.hit(self, paddle)
+
+    def draw(self, alpha=1.0):
+        # Blit the pre-rendered sprite for the current z level (3D effect),
+        # between the last two ticks like Paddle.draw
+        x, y = interpolate(self.previous, self.rect.topleft, alpha, pixel_scale)
+        level = min(max(int(round(self.z_position)), 0), self.max_z)
+        sprite, offset = ball_sprites.get(self)[level]
+        return screen.blit(sprite, (x - offset, y - offset))
+
+class BallSpriteAtlas:
+    # Pre-rendered ball sprites with shadow and highlight, one per z level,
+    # shared by every ball of the same colour and drawn at the screen's
+    # resolution. Rebuilt when the colours, BALL_SIZE, the z range or the
+    # pixel scale change.
+    def __init__(self):
+        self.atlases = {}
 
-    def draw(self):
+    def clear(self):
+        self.atlases.clear()
+
+    def get(self, ball):
+        key = (ball.color, ball.shadow_color, ball.highlight_color, ball.shadow_depth, ball.max_z, BALL_SIZE, pixel_scale)
+        sprites = self.atlases.get(key)
+        if sprites is None:
+            sprites = self.atlases[key] = [self.bake(ball, z) for z in range(ball.max_z + 1)]
+        return sprites
+
+    def bake(self, ball, z_position):
         # Calculate size based on z-position for 3D effect
-        size_factor = 1 + (self.z_position / 50)
-        current_size = int(BALL_SIZE * size_factor)
+        size_factor = 1 + (z_position / 50)
+        current_size = px(BALL_SIZE * size_factor)
 
-        # Adjust position to keep ball centered with new size
-        x_offset = (current_size - BALL_SIZE) // 2
-        y_offset = (current_size - BALL_SIZE) // 2
+        # Sprite offset that keeps the ball centered with its new size
+        offset = (current_size - px(BALL_SIZE)) // 2
+
+        shadow_depth = px(ball.shadow_depth)
+        sprite_size = current_size + shadow_depth
+        sprite = pygame.Surface((sprite_size, sprite_size), pygame.SRCALPHA)
 
         # Draw shadow (3D effect)
-        shadow_rect = pygame.Rect(
-            self.rect.x + self.shadow_depth - x_offset,
-            self.rect.y + self.shadow_depth - y_offset,
-            current_size,
-            current_size
-        )
-        pygame.draw.ellipse(screen, self.shadow_color, shadow_rect)
+        shadow_rect = pygame.Rect(shadow_depth, shadow_depth, current_size, current_size)
+        pygame.draw.ellipse(sprite, ball.shadow_color, shadow_rect)
 
         # Draw ball
-        ball_rect = pygame.Rect(
-            self.rect.x - x_offset,
-            self.rect.y - y_offset,
-            current_size,
-            current_size
-        )
-        pygame.draw.ellipse(screen, self.color, ball_rect)
+        pygame.draw.ellipse(sprite, ball.color, (0, 0, current_size, current_size))
 
         # Draw highlight (3D effect)
         highlight_size = int(current_size * 0.5)
         highlight_rect = pygame.Rect(
-            self.rect.x - x_offset + int(current_size * 0.25),
-            self.rect.y - y_offset + int(current_size * 0.25),
+            int(current_size * 0.25),
+            int(current_size * 0.25),
             highlight_size,
             highlight_size
         )
-        pygame.draw.ellipse(screen, self.highlight_color, highlight_rect)
+        pygame.draw.ellipse(sprite, ball.highlight_color, highlight_rect)
+        return sprite, offset
+
+ball_sprites = BallSpriteAtlas()
+
+class MultiBall(Ball):
+    # Ball of a multi-ball match. Serves come from a random spot on the
+    # server's side, up to a quarter court toward the net, so the balls do
+    # not start stacked on one spot; touching balls bounce off each other
+    # in collide_balls().
+    __slots__ = ()
+
+    def reset(self):
+        Ball.reset(self)
+        self.x += math.copysign(self.rng.uniform(0, WIDTH / 4), self.speed_x)
+        self.y = self.rng.uniform(0, HEIGHT - self.rect.height)
+        self.rect.topleft = (self.x, self.y)
+        self.save_position()
+
+class SpatialHash:
+    # Uniform grid broadphase for ball-to-ball collisions. Balls are
+    # bucketed by the cell of their top left corner; with cells at least a
+    # ball wide, balls that touch are always in the same or adjacent cells,
+    # so the pairs to test grow with the number of balls, not its square.
+    def __init__(self, cell_size):
+        self.cell_size = cell_size
+        self.cells = {}
+
+    def rebuild(self, balls):
+        cells = self.cells = {}
+        size = self.cell_size
+        for ball in balls:
+            key = (int(ball.x // size), int(ball.y // size))
+            cell = cells.get(key)
+            if cell is None:
+                cells[key] = [ball]
+            else:
+                cell.append(ball)
+
+    def pairs(self):
+        # Each candidate pair once: pairs within a cell, then with the
+        # neighbours to the right and below
+        cells = self.cells
+        for (cell_x, cell_y), cell in cells.items():
+            count = len(cell)
+            for i in range(count - 1):
+                first = cell[i]
+                for j in range(i + 1, count):
+                    yield first, cell[j]
+            for offset_x, offset_y in ((1, 0), (-1, 1), (0, 1), (1, 1)):
+                other = cells.get((cell_x + offset_x, cell_y + offset_y))
+                if other:
+                    for first in cell:
+                        for second in other:
+                            yield first, second
+
+def collide_balls(grid):
+    # Bounce touching balls off each other: an elastic collision of equal
+    # masses along the line between their centres, then push them apart so
+    # they do not stick together
+    limit = BALL_SIZE * BALL_SIZE
+    for first, second in grid.pairs():
+        dx = second.x - first.x
+        dy = second.y - first.y
+        distance_squared = dx * dx + dy * dy
+        if distance_squared >= limit or distance_squared == 0:
+            continue
+        distance = math.sqrt(distance_squared)
+        normal_x, normal_y = dx / distance, dy / distance
+
+        # Balls already moving apart keep their course
+        closing = (first.speed_x - second.speed_x) * normal_x + (first.speed_y - second.speed_y) * normal_y
+        if closing > 0:
+            first.speed_x -= closing * normal_x
+            first.speed_y -= closing * normal_y
+            second.speed_x += closing * normal_x
+            second.speed_y += closing * normal_y
+            for ball in (first, second):
+                # A ball must keep crossing the court
+                if abs(ball.speed_x) < MIN_BALL_SPEED_X:
+                    ball.speed_x = math.copysign(MIN_BALL_SPEED_X, ball.speed_x)
+                # The path changed, so the AI aims again
+                ball.volley += 1
+
+        push = (BALL_SIZE - distance) / 2
+        for ball, sign in ((first, -push), (second, push)):
+            ball.x = min(max(ball.x + normal_x * sign, 0), WIDTH - ball.rect.width)
+            ball.y = min(max(ball.y + normal_y * sign, 0), HEIGHT - ball.rect.height)
+            ball.rect.topleft = (ball.x, ball.y)
+
+def landing_y(ball, x):
+    # Ball top when its left edge reaches x on its current course, with the
+    # top and bottom wall bounces folded in: the path is a straight line in
+    # a court mirrored at every wall
+    travel = (x - ball.x) / ball.speed_x
+    span = HEIGHT - ball.rect.height
+    y = (ball.y + ball.speed_y * travel) % (2 * span)
+    return y if y <= span else 2 * span - y
+
+class LookaheadAI:
+    # The hard AI tier. Once per volley heading its way, it lists paddle
+    # tops that would meet the ball at each of HARD_AI_OFFSETS, then plays
+    # the volley out for each: the real ball and paddles are snapshotted,
+    # stepped with the paddle steering for that top until the ball comes
+    # off it (or gets past), and restored. Where the return would reach the
+    # player's side, against how far the player can move by then, scores
+    # it; Ball.collide's bounce rule does the aiming. Each tick searches
+    # until its time budget is spent and leaves the rest for the next, so
+    # a slow machine plays the best return found so far, and until one is
+    # found the paddle heads for the ball's landing spot like the
+    # predictive AI. The search never touches the match's random source,
+    # but how far it gets depends on the clock, so replays of hard matches
+    # keep the AI's recorded moves rather than searching again.
+    def __init__(self, paddle, opponent, budget=HARD_AI_BUDGET):
+        # budget is in seconds per tick; None searches every candidate at
+        # once, for reproducible headless runs
+        self.paddle = paddle
+        self.opponent = opponent
+        self.budget = budget
+        self.ball = None
+        self.volley = None
+        self.candidates = []
+        self.best_y = None
+        self.best_score = -math.inf
+        # Serves for balls scoring during a play-out, kept apart from the
+        # match's random source
+        self.scratch_rng = random.Random(0)
+        # Volleys searched, and ticks the budget ran out
+        self.searches = 0
+        self.cut_short = 0
+
+    def snapshot(self, balls):
+        # The search in progress, like Paddle.snapshot, for GameState
+        ball = None if self.ball is None else balls.index(self.ball)
+        return (
+            ball, self.volley, tuple(self.candidates), self.best_y, self.best_score,
+            self.scratch_rng.getstate(),
+        )
+
+    def restore(self, snapshot, balls):
+        ball, self.volley, candidates, self.best_y, self.best_score, rng_state = snapshot
+        self.ball = None if ball is None else balls[ball]
+        self.candidates = list(candidates)
+        self.scratch_rng.setstate(rng_state)
+
+    def target_y(self, ball):
+        # Paddle top to head for this tick
+        if ball is not self.ball or ball.volley != self.volley:
+            self.plan(ball)
+        if self.candidates:
+            self.search()
+        return self.best_y
+
+    def plan(self, ball):
+        self.ball = ball
+        self.volley = ball.volley
+        self.best_score = -math.inf
+        self.candidates = []
+        paddle = self.paddle
+        half = paddle.rect.height / 2
+        if ball.speed_x < 0:
+            self.best_y = HEIGHT / 2 - half
+            return
+        self.searches += 1
+        center_y = landing_y(ball, paddle.rect.left - ball.rect.width) + ball.rect.height / 2
+        for offset in HARD_AI_OFFSETS:
+            top = round(min(max(center_y - half - offset * half, 0), HEIGHT - paddle.rect.height))
+            if top not in self.candidates:
+                self.candidates.append(top)
+        self.best_y = self.candidates[0]
+
+    def search(self):
+        deadline = None if self.budget is None else time.perf_counter() + self.budget
+        while self.candidates:
+            if deadline is not None and time.perf_counter() >= deadline:
+                self.cut_short += 1
+                return
+            top = self.candidates.pop(0)
+            score = self.play_out(top)
+            if score > self.best_score:
+                self.best_score, self.best_y = score, top
+
+    def play_out(self, top):
+        # Score of the return made with the paddle heading for top, from a
+        # simulation of the rest of the volley on the real objects. Sounds
+        # and statistics are switched off while it runs.
+        global audio, stats
+        ball, paddle, opponent = self.ball, self.paddle, self.opponent
+        saved = ball.snapshot(), paddle.snapshot(), opponent.snapshot(), ball.rng
+        saved_audio, saved_stats = audio, stats
+        audio, stats = NullAudio(), None
+        ball.rng = self.scratch_rng
+        try:
+            return self.score_return(top)
+        finally:
+            audio, stats = saved_audio, saved_stats
+            ball.restore(saved[0])
+            paddle.restore(saved[1])
+            opponent.restore(saved[2])
+            ball.rng = saved[3]
+
+    def score_return(self, top):
+        ball, paddle, opponent = self.ball, self.paddle, self.opponent
+        ticks = 0
+        # While the ball cannot reach the paddle the ball's path does not
+        # depend on it, so that stretch is swept in one go, and the paddle
+        # only moves until it settles on top
+        far = int((paddle.rect.left - ball.rect.width - ball.x) / ball.speed_x) - 1
+        if far > 0:
+            for _ in range(far):
+                y = paddle.rect.y
+                paddle.steer(top)
+                if paddle.rect.y == y:
+                    break
+            ball.move(opponent, paddle, far)
+            ticks += far
+        while ball.volley == self.volley:
+            paddle.steer(top)
+            if ball.move(opponent, paddle):
+                # Got past the paddle
+                return -math.inf
+            ticks += 1
+            if ticks > SIM_HZ * 10:
+                return -math.inf
+
+        # Margin by which the return stays out of the player's reach when
+        # it crosses their paddle: positive is a winner
+        face_x = opponent.rect.right
+        ticks += (ball.x - face_x) / -ball.speed_x
+        ball_center = landing_y(ball, face_x) + ball.rect.height / 2
+        reach = opponent.speed * ticks + (opponent.rect.height + ball.rect.height) / 2
+        return abs(ball_center - opponent.rect.centery) - reach
+
+def interpolate(previous, current, alpha, scale=1.0):
+    # Position a fraction alpha of the way from previous to current, times
+    # scale to land on screen pixels
+    return (
+        round((previous[0] + (current[0] - previous[0]) * alpha) * scale),
+        round((previous[1] + (current[1] - previous[1]) * alpha) * scale)
+    )
+
+class GameState:
+    # Everything needed to advance one match. The match has its own seeded
+    # random source, so the same seed and inputs replay the same game.
+    def __init__(self, difficulty=1, seed=None, predictive_ai=None, balls=1, hard_ai=None):
+        self.seed = seed if seed is not None else random.randrange(2 ** 32)
+        self.rng = random.Random(self.seed)
+        self.difficulty = difficulty
+        self.predictive_ai = PREDICTIVE_AI if predictive_ai is None else predictive_ai
+        self.hard_ai = HARD_AI if hard_ai is None else hard_ai
+        self.tick = 0
+        self.player_paddle = Paddle(20, HEIGHT // 2 - PADDLE_HEIGHT // 2, PADDLE_WIDTH, PADDLE_HEIGHT, BLUE, PADDLE_SPEED, rng=self.rng)
+        self.ai_paddle = Paddle(WIDTH - 20 - PADDLE_WIDTH, HEIGHT // 2 - PADDLE_HEIGHT // 2, PADDLE_WIDTH, PADDLE_HEIGHT, RED, PADDLE_SPEED, is_ai=True, rng=self.rng, predictive=self.predictive_ai)
+        ball_class = Ball if balls == 1 else MultiBall
+        self.balls = [
+            ball_class(WIDTH // 2 - BALL_SIZE // 2, HEIGHT // 2 - BALL_SIZE // 2, BALL_SIZE, GREEN, BALL_SPEED, rng=self.rng)
+            for _ in range(balls)
+        ]
+        self.ball = self.balls[0]
+        # Multi-ball: broadphase for ball-to-ball collisions, and the ball
+        # the AI follows, picked in move_balls()
+        self.grid = SpatialHash(BALL_SIZE) if balls > 1 else None
+        self.tracked_ball = self.ball
+        if self.hard_ai:
+            self.ai_paddle.planner = LookaheadAI(self.ai_paddle, self.player_paddle)
+
+    def is_over(self):
+        return self.player_paddle.score >= MAX_SCORE or self.ai_paddle.score >= MAX_SCORE
+
+    def snapshot(self):
+        # The whole match as nested tuples, for restore(): a small
+        # fraction of the cost of copy.deepcopy of the objects and their
+        # Rects, most of it the random source's state
+        planner = self.ai_paddle.planner
+        return (
+            self.tick, self.rng.getstate(), self.balls.index(self.tracked_ball),
+            self.player_paddle.snapshot(self.balls), self.ai_paddle.snapshot(self.balls),
+            planner.snapshot(self.balls) if planner else None,
+            tuple(ball.snapshot() for ball in self.balls),
+        )
+
+    def restore(self, snapshot):
+        self.tick, rng_state, tracked, player, ai, planner, balls = snapshot
+        self.rng.setstate(rng_state)
+        self.tracked_ball = self.balls[tracked]
+        self.player_paddle.restore(player, self.balls)
+        self.ai_paddle.restore(ai, self.balls)
+        if planner:
+            self.ai_paddle.planner.restore(planner, self.balls)
+        for ball, ball_snapshot in zip(self.balls, balls):
+            ball.restore(ball_snapshot)
+
+def move_by_inputs(paddle, inputs):
+    # One tick of a paddle under input bits
+    steps = inputs >> INPUT_SPEED_SHIFT
+    paddle.move(up=bool(inputs & INPUT_UP), down=bool(inputs & INPUT_DOWN), amount=steps / INPUT_SPEED_STEPS if steps else 1.0)
+
+def step(state, inputs, dt=SIM_DT, opponent_inputs=None):
+    # Advance the match by dt seconds in whole SIM_DT ticks, holding the
+    # player input bits (INPUT_UP/INPUT_DOWN) for the whole span. With
+    # opponent_inputs, a second player moves the right paddle in place of
+    # the AI, as in networked matches (netplay.py). Nothing
+    # here draws or reads the clock, so the simulation can run faster than
+    # real time. Each tick moves the paddles and then the ball, so a coarse
+    # step plays exactly like as many single steps with the same input.
+    # Returns True if a point was scored.
+    point_scored = False
+    ticks = max(1, round(dt / SIM_DT))
+    player_paddle, ai_paddle = state.player_paddle, state.ai_paddle
+    while ticks > 0 and not state.is_over():
+        ticks -= 1
+        state.tick += 1
+        player_paddle.save_position()
+        ai_paddle.save_position()
+        for ball in state.balls:
+            ball.save_position()
+
+        # Player controls, then AI movement with current difficulty
+        move_by_inputs(player_paddle, inputs)
+        if profiler:
+            profiler.lap('player')
+        if opponent_inputs is None:
+            ai_paddle.ai_move(state.tracked_ball, state.difficulty)
+        else:
+            ai_paddle.decision = opponent_inputs
+            move_by_inputs(ai_paddle, opponent_inputs)
+        if profiler:
+            profiler.lap('ai')
+
+        # Move the ball, bouncing off walls and paddles on the way
+        if state.grid is None:
+            point_scored = state.ball.move(player_paddle, ai_paddle) or point_scored
+        else:
+            point_scored = move_balls(state) or point_scored
+        if profiler:
+            profiler.lap('ball')
+    return point_scored
+
+def move_balls(state):
+    # One tick of a multi-ball match. Each ball is swept against the walls,
+    # the paddle it is heading for and the goals as in a normal match, then
+    # touching balls bounce off each other through the grid. The same pass
+    # picks the ball for the AI to follow next tick: the one that will
+    # reach its paddle first, or any ball while none is coming.
+    player_paddle, ai_paddle = state.player_paddle, state.ai_paddle
+    face_x = ai_paddle.rect.left - BALL_SIZE
+    tracked, arrival = state.ball, math.inf
+    point_scored = False
+    for ball in state.balls:
+        if ball.move(player_paddle, ai_paddle):
+            point_scored = True
+            if state.is_over():
+                return True
+        if ball.speed_x > 0:
+            ticks = (face_x - ball.x) / ball.speed_x
+            if 0 <= ticks < arrival:
+                tracked, arrival = ball, ticks
+    state.tracked_ball = tracked
+
+    state.grid.rebuild(state.balls)
+    collide_balls(state.grid)
+    return point_scored
+
+def next_difficulty(difficulty, player_score):
+    # If player won, increase difficulty for next level
+    if player_score >= MAX_SCORE and difficulty < MAX_DIFFICULTY:
+        return difficulty + 1
+    return difficulty
 
 class Court:
     def __init__(self):
@@ -315,284 +1177,703 @@ class Court:
         self.line_color = WHITE
         self.shadow_color = GRAY
         self.shadow_depth = 15
-
-    def draw(self):
+        # Pre-rendered static court layer, baked on first draw at the
+        # screen's resolution
+        self.surface = None
+        self.generation = None
+
+    def bake(self, size):
+        # Render the static court once into an off-screen surface
+        self.surface = pygame.Surface(size).convert()
+        self.surface.fill(BLACK)
+        self.render(self.surface)
+        self.generation = display_generation
+
+    def render(self, target):
         # Draw court shadow (3D effect)
-        shadow_rect = pygame.Rect(
+        shadow_rect = px_rect(
             self.shadow_depth,
             self.shadow_depth,
             WIDTH - (2 * self.shadow_depth),
             HEIGHT - (2 * self.shadow_depth)
         )
-        pygame.draw.rect(screen, self.shadow_color, shadow_rect)
+        pygame.draw.rect(target, self.shadow_color, shadow_rect)
 
         # Draw court
-        court_rect = pygame.Rect(0, 0, WIDTH, HEIGHT)
-        pygame.draw.rect(screen, self.color, court_rect)
+        court_rect = px_rect(0, 0, WIDTH, HEIGHT)
+        pygame.draw.rect(target, self.color, court_rect)
 
         # Draw court lines
-        pygame.draw.rect(screen, self.line_color, court_rect, 5)
+        pygame.draw.rect(target, self.line_color, court_rect, max(1, px(5)))
 
         # Draw net with 3D effect
         net_shadow_x = WIDTH // 2 + 2
         for y in range(0, HEIGHT, 30):
             # Draw net shadow
-            pygame.draw.rect(screen, GRAY, (net_shadow_x, y + 5, 4, 15))
+            pygame.draw.rect(target, GRAY, px_rect(net_shadow_x, y + 5, 4, 15))
             # Draw net
-            pygame.draw.rect(screen, WHITE, (WIDTH // 2 - 2, y, 4, 15))
-
-def show_message(message, size=36, y_offset=0, color=WHITE, wait_time=0):
-    font = pygame.font.Font(None, size)
-    text = font.render(message, True, color)
-    text_rect = text.get_rect(center=(WIDTH // 2, HEIGHT // 2 + y_offset))
-
-    # Add shadow for 3D text effect
-    shadow_text = font.render(message, True, (50, 50, 50))
-    shadow_rect = shadow_text.get_rect(center=(WIDTH // 2 + 3, HEIGHT // 2 + y_offset + 3))
-    screen.blit(shadow_text, shadow_rect)
+            pygame.draw.rect(target, WHITE, px_rect(WIDTH // 2 - 2, y, 4, 15))
 
-    screen.blit(text, text_rect)
-    pygame.display.flip()
-    if wait_time > 0:
-        time.sleep(wait_time)
+    def is_stale(self):
+        # The cached layer must match the current screen size and layout
+        return (self.surface is None or self.surface.get_size() != screen.get_size()
+                or self.generation != display_generation)
 
-def show_difficulty_screen(difficulty):
+    def draw(self):
+        if self.is_stale():
+            self.bake(screen.get_size())
+        screen.blit(self.surface, (0, 0))
+
+    def restore(self, rects):
+        # Paint the court back over areas drawn on last frame
+        for rect in rects:
+            screen.blit(self.surface, rect, rect)
+
+class DirtyRectRenderer:
+    # Tracks what was drawn on the previous frame so only changed regions
+    # are restored from the court layer and pushed to the display
+    def __init__(self, court):
+        self.court = court
+        self.previous = []
+        self.hud_state = None
+        self.hud_rects = []
+        self.full_redraw = True
+
+    def invalidate(self):
+        # Force a full redraw and flip, e.g. after a level change or resize
+        self.full_redraw = True
+
+    def begin_frame(self):
+        if self.court.is_stale():
+            self.full_redraw = True
+        if self.full_redraw:
+            self.court.draw()
+        else:
+            # The HUD is cleared too so its anti-aliased text does not build up
+            self.court.restore(self.previous)
+            self.court.restore(self.hud_rects)
+
+    def end_frame(self, dirty, hud_rects, hud_state):
+        if self.full_redraw:
+            present()
+            self.full_redraw = False
+        else:
+            updates = self.previous + dirty
+            # HUD text is only pushed when the scores or level change
+            if hud_state != self.hud_state:
+                updates += self.hud_rects + hud_rects
+            present(updates)
+        self.previous = dirty
+        self.hud_rects = hud_rects
+        self.hud_state = hud_state
+
+# Shared fonts, created once per size
+fonts = {}
+
+def get_font(size):
+    font = fonts.get(size)
+    if font is None:
+        font = fonts[size] = pygame.font.Font(None, size)
+    return font
+
+class TextCache:
+    # Bounded LRU cache of rendered text surfaces, keyed by
+    # (text, size, color, shadow offset) in screen pixels
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self):
+        self.entries.clear()
+
+    def get(self, text, size, color, shadow_offset=0):
+        # Returns the text surface and its shadow (None without an offset)
+        key = (text, size, color, shadow_offset)
+        surfaces = self.entries.get(key)
+        if surfaces is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return surfaces
+
+        self.misses += 1
+        font = get_font(size)
+        shadow = font.render(text, True, TEXT_SHADOW_COLOR) if shadow_offset else None
+        surfaces = (font.render(text, True, color), shadow)
+        self.entries[key] = surfaces
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return surfaces
+
+    def draw(self, target, text, size, color, shadow_offset=0, **position):
+        # Blit text positioned like Surface.get_rect(**position), with its
+        # shadow offset down and right, and return the area touched. Size,
+        # offset and position are in logical units.
+        if shadow_offset:
+            shadow_offset = max(1, px(shadow_offset))
+        text_surface, shadow = self.get(text, max(1, px(size)), color, shadow_offset)
+        text_rect = text_surface.get_rect(**{name: px_point(point) for name, point in position.items()})
+        if shadow is None:
+            return target.blit(text_surface, text_rect)
+        dirty = target.blit(shadow, text_rect.move(shadow_offset, shadow_offset))
+        dirty.union_ip(target.blit(text_surface, text_rect))
+        return dirty
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'entries': len(self.entries),
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+text_cache = TextCache()
+
+def show_message(message, size=36, y_offset=0, color=WHITE):
+    # Text with a shadow for 3D text effect; the screen is flipped once the
+    # whole menu is drawn
+    return text_cache.draw(screen, message, size, color, 3, center=(WIDTH // 2, HEIGHT // 2 + y_offset))
+
+# Background gradients as (top colour, bottom colour)
+GRADIENTS = {
+    # Menu gradient (blue to black)
+    'menu': ((0, 0, 255), (0, 0, 0)),
+    # Victory gradient (blue to green)
+    'win': ((0, 0, 255), (0, 200, 0)),
+    # Defeat gradient (blue to red)
+    'lose': ((0, 0, 255), (200, 0, 0)),
+}
+
+class GradientCache:
+    # Full-screen vertical gradients, built once per (palette, size) and
+    # blitted by the menus instead of being drawn a scanline at a time
+    def __init__(self):
+        self.surfaces = {}
+
+    def clear(self):
+        self.surfaces.clear()
+
+    def get(self, palette, size):
+        key = (palette, size)
+        surface = self.surfaces.get(key)
+        if surface is None:
+            surface = self.surfaces[key] = self.build(GRADIENTS[palette], size)
+        return surface
+
+    def build(self, colors, size):
+        # A new surface matches the display's pixel format once it is open
+        (top, bottom), (width, height) = colors, size
+        surface = pygame.Surface(size)
+        if numpy is None:
+            for y in range(height):
+                t = y / height
+                color = [int(a * (1 - t) + b * t) for a, b in zip(top, bottom)]
+                pygame.draw.line(surface, color, (0, y), (width, y))
+            return surface
+
+        # One mapped colour per row, written to every column in one pass
+        t = (numpy.arange(height) / height)[:, None]
+        rows = (numpy.array(top) * (1 - t) + numpy.array(bottom) * t).astype(numpy.uint8)
+        pixels = pygame.surfarray.pixels2d(surface)
+        pixels[:] = pygame.surfarray.map_array(surface, rows[None, :, :])
+        # Release the pixel view, which keeps the surface locked
+        del pixels
+        return surface
+
+gradients = GradientCache()
+
+def draw_gradient(palette):
+    screen.blit(gradients.get(palette, screen.get_size()), (0, 0))
+
+def draw_difficulty_screen(difficulty):
     # Create gradient background
-    for y in range(HEIGHT):
-        color_value = int(255 * (1 - y / HEIGHT))
-        color = (0, 0, color_value)
-        pygame.draw.line(screen, color, (0, y), (WIDTH, y))
+    draw_gradient('menu')
 
     # Draw 3D title
-    font_large = pygame.font.Font(None, 72)
     title_text = "PICKLE BALL 3D"
 
     # Draw multiple layers for 3D effect
     for i in range(5, 0, -1):
-        title_shadow = font_large.render(title_text, True, (i*20, i*20, i*50))
-        title_rect = title_shadow.get_rect(center=(WIDTH // 2, 100 + i*2))
-        screen.blit(title_shadow, title_rect)
+        text_cache.draw(screen, title_text, 72, (i*20, i*20, i*50), center=(WIDTH // 2, 100 + i*2))
 
-    title = font_large.render(title_text, True, YELLOW)
-    title_rect = title.get_rect(center=(WIDTH // 2, 100))
-    screen.blit(title, title_rect)
+    text_cache.draw(screen, title_text, 72, YELLOW, center=(WIDTH // 2, 100))
 
     # Draw difficulty with 3D effect
     show_message(f"DIFFICULTY LEVEL: {difficulty}", 48, -50, YELLOW)
     show_message("First to score 20 points wins!", 36, 0)
     show_message("Use UP and DOWN arrow keys to move", 30, 50)
     show_message("Press SPACE to start", 30, 100)
+    present()
 
-    # Draw 3D ball animation
-    ball_pos = [WIDTH // 2, HEIGHT - 100]
+def draw_intro_ball(elapsed):
+    # Bouncing 3D ball under the menu text, elapsed seconds into the intro
+    # animation; returns the area to push to the display
+    ball_x = WIDTH // 2
     ball_size = 30
     ball_shadow = 8
 
-    # Animate the ball
-    for i in range(20):
-        # Clear previous ball
-        pygame.draw.rect(screen, BLACK, (ball_pos[0] - ball_size - 10, ball_pos[1] - ball_size - 10, ball_size * 2 + 20, ball_size * 2 + 20))
-
-        # Update position with bouncing effect
-        ball_pos[1] = HEIGHT - 100 + int(20 * math.sin(i * 0.3))
+    # Clear previous ball
+    area = px_rect(ball_x - ball_size - 10, HEIGHT - 100 - 20 - ball_size - 10, ball_size * 2 + 20, ball_size * 2 + 60)
+    screen.blit(gradients.get('menu', screen.get_size()), area, area)
 
-        # Draw ball shadow
-        pygame.draw.ellipse(screen, GRAY, (ball_pos[0] - ball_size + ball_shadow, ball_pos[1] - ball_size + ball_shadow, ball_size * 2, ball_size * 2))
+    # Update position with bouncing effect
+    ball_y = HEIGHT - 100 + int(20 * math.sin(elapsed * INTRO_BOUNCE_SPEED))
 
-        # Draw ball
-        pygame.draw.ellipse(screen, GREEN, (ball_pos[0] - ball_size, ball_pos[1] - ball_size, ball_size * 2, ball_size * 2))
-
-        # Draw highlight
-        pygame.draw.ellipse(screen, (200, 255, 200), (ball_pos[0] - ball_size//2, ball_pos[1] - ball_size//2, ball_size, ball_size))
+    # Draw ball shadow
+    pygame.draw.ellipse(screen, GRAY, px_rect(ball_x - ball_size + ball_shadow, ball_y - ball_size + ball_shadow, ball_size * 2, ball_size * 2))
 
-        pygame.display.flip()
-        pygame.time.delay(50)
+    # Draw ball
+    pygame.draw.ellipse(screen, GREEN, px_rect(ball_x - ball_size, ball_y - ball_size, ball_size * 2, ball_size * 2))
 
-    pygame.display.flip()
+    # Draw highlight
+    pygame.draw.ellipse(screen, (200, 255, 200), px_rect(ball_x - ball_size//2, ball_y - ball_size//2, ball_size, ball_size))
+    return area
 
-    waiting = True
-    while waiting:
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                sys.exit()
-            if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_SPACE:
-                    waiting = False
-                elif event.key == pygame.K_ESCAPE:
-                    pygame.quit()
-                    sys.exit()
-
-def show_game_over(player_score, ai_score, difficulty):
+def draw_game_over(player_score, ai_score, difficulty):
     # Create gradient background
-    for y in range(HEIGHT):
-        if player_score >= MAX_SCORE:
-            # Victory gradient (blue to green)
-            color_value_b = int(255 * (1 - y / HEIGHT))
-            color_value_g = int(200 * (y / HEIGHT))
-            color = (0, color_value_g, color_value_b)
-        else:
-            # Defeat gradient (blue to red)
-            color_value_b = int(255 * (1 - y / HEIGHT))
-            color_value_r = int(200 * (y / HEIGHT))
-            color = (color_value_r, 0, color_value_b)
-        pygame.draw.line(screen, color, (0, y), (WIDTH, y))
+    draw_gradient('win' if player_score >= MAX_SCORE else 'lose')
 
     if player_score >= MAX_SCORE:
-        if sounds_enabled:
-            win_sound.play()
         show_message("YOU WIN!", 64, -50, GREEN)
-        if difficulty < 10:
+        if difficulty < MAX_DIFFICULTY:
             show_message(f"Advancing to difficulty level {difficulty + 1}", 36, 20)
             show_message("Press SPACE to continue", 30, 80)
         else:
             show_message("Congratulations! You beat the highest difficulty!", 36, 20)
             show_message("Press SPACE to play again", 30, 80)
     else:
-        if sounds_enabled:
-            lose_sound.play()
         show_message("GAME OVER", 64, -50, RED)
         show_message(f"AI wins with {ai_score} points", 36, 20)
         show_message("Press SPACE to try again", 30, 80)
 
+    draw_result_art(player_score >= MAX_SCORE)
+    present()
+
+def draw_result_art(won):
     # Draw 3D trophy or sad face
-    if player_score >= MAX_SCORE:
+    if won:
         # Draw trophy
-        pygame.draw.polygon(screen, YELLOW, [
+        pygame.draw.polygon(screen, YELLOW, [px_point(point) for point in [
             (WIDTH//2 - 40, HEIGHT - 150),
             (WIDTH//2 + 40, HEIGHT - 150),
             (WIDTH//2 + 30, HEIGHT - 100),
             (WIDTH//2 - 30, HEIGHT - 100)
-        ])
-        pygame.draw.rect(screen, YELLOW, (WIDTH//2 - 10, HEIGHT - 100, 20, 50))
-        pygame.draw.rect(screen, YELLOW, (WIDTH//2 - 50, HEIGHT - 50, 100, 10))
+        ]])
+        pygame.draw.rect(screen, YELLOW, px_rect(WIDTH//2 - 10, HEIGHT - 100, 20, 50))
+        pygame.draw.rect(screen, YELLOW, px_rect(WIDTH//2 - 50, HEIGHT - 50, 100, 10))
     else:
         # Draw sad face
-        pygame.draw.circle(screen, RED, (WIDTH//2, HEIGHT - 120), 40)
-        pygame.draw.circle(screen, BLACK, (WIDTH//2 - 15, HEIGHT - 130), 5)
-        pygame.draw.circle(screen, BLACK, (WIDTH//2 + 15, HEIGHT - 130), 5)
-        pygame.draw.arc(screen, BLACK, (WIDTH//2 - 20, HEIGHT - 110, 40, 30), math.pi, 2*math.pi, 3)
-
-    pygame.display.flip()
-
-    waiting = True
-    while waiting:
-        for event in pygame.event.get():
+        pygame.draw.circle(screen, RED, px_point((WIDTH//2, HEIGHT - 120)), px(40))
+        pygame.draw.circle(screen, BLACK, px_point((WIDTH//2 - 15, HEIGHT - 130)), px(5))
+        pygame.draw.circle(screen, BLACK, px_point((WIDTH//2 + 15, HEIGHT - 130)), px(5))
+        pygame.draw.arc(screen, BLACK, px_rect(WIDTH//2 - 20, HEIGHT - 110, 40, 30), math.pi, 2*math.pi, max(1, px(3)))
+
+def draw_frame(court, renderer, state, alpha=1.0, local_player=None):
+    # Draw the court, paddles, balls and HUD for a match and update the
+    # display. local_player is set for networked matches, see draw_hud.
+    player_paddle, ai_paddle = state.player_paddle, state.ai_paddle
+    if display_resized():
+        fit_display()
+    if DIRTY_RECT_RENDERING:
+        renderer.begin_frame()
+    else:
+        screen.fill(BLACK)
+
+        # Draw the court with 3D effect
+        court.draw()
+    if profiler:
+        profiler.lap('court')
+
+    # Draw paddles and balls
+    dirty = [player_paddle.draw(alpha), ai_paddle.draw(alpha)]
+    dirty += [ball.draw(alpha) for ball in state.balls]
+    if profiler:
+        profiler.lap('entities')
+
+    hud_rects = draw_hud(state, local_player)
+    hud_state = (player_paddle.score, ai_paddle.score, state.difficulty)
+    if profiler:
+        profiler.lap('hud')
+        if profiler.overlay:
+            hud_rects += draw_profiler_overlay()
+            hud_state += (profiler.revision,)
+            profiler.lap('overlay')
+
+    # Update the display
+    if DIRTY_RECT_RENDERING:
+        renderer.end_frame(dirty, hud_rects, hud_state)
+    else:
+        present()
+    if profiler:
+        profiler.lap('display')
+
+    # Keep the composed frame for highlight clips
+    if capture:
+        capture.grab(screen)
+        if profiler:
+            profiler.lap('capture')
+
+def draw_hud(state, local_player=None):
+    # Scores, labels and level; returns the areas covered by HUD text, for
+    # dirty rectangle updates. In a networked match local_player is this
+    # player's number from the left paddle (0 or 1): the labels name the
+    # players, and there is no level.
+    player_paddle, ai_paddle = state.player_paddle, state.ai_paddle
+    hud_rects = []
+
+    # Draw scores with shadow for 3D effect
+    left = text_cache.draw(screen, str(player_paddle.score), 48, WHITE, 2, topleft=(WIDTH // 4, 20))
+    right = text_cache.draw(screen, str(ai_paddle.score), 48, WHITE, 2, topleft=(3 * WIDTH // 4, 20))
+    hud_rects += [left, right]
+
+    if local_player is None:
+        # Draw player labels with 3D effect
+        hud_rects.append(text_cache.draw(screen, "YOU", 36, BLUE, 2, topleft=(WIDTH // 4 - 20, 50)))
+        hud_rects.append(text_cache.draw(screen, "AI", 36, RED, 2, topleft=(3 * WIDTH // 4 - 10, 50)))
+
+        # Level indicator in center
+        hud_rects.append(text_cache.draw(screen, f"LEVEL {state.difficulty}", 36, YELLOW, 2, midtop=(WIDTH // 2, 50)))
+    else:
+        # Labels centered under the scores, with this player as YOU
+        for number, (score, color) in enumerate([(left, BLUE), (right, RED)]):
+            label = "YOU" if number == local_player else f"PLAYER {number + 1}"
+            center = round(score.centerx / pixel_scale)
+            hud_rects.append(text_cache.draw(screen, label, 36, color, 2, midtop=(center, 50)))
+    return hud_rects
+
+def draw_profiler_overlay():
+    # Rolling frame time percentiles per phase in the bottom left corner
+    summary = profiler.summary
+    if summary is None:
+        return []
+    frame = summary['frame']
+    lines = [f"frame p50/p95/p99 {frame['p50']:.2f}/{frame['p95']:.2f}/{frame['p99']:.2f} ms, {summary['fps']} fps, {summary['dropped']} dropped"]
+    for phase, timing in summary['phases'].items():
+        lines.append(f"{phase} {timing['p50']:.2f}/{timing['p95']:.2f}/{timing['p99']:.2f}")
+    latency = summary.get('input_latency')
+    if latency:
+        lines.append(f"input to display {latency['p50']:.2f}/{latency['p95']:.2f}/{latency['p99']:.2f} ms")
+    top = HEIGHT - 30 - 18 * len(lines)
+    return [
+        text_cache.draw(screen, line, 20, WHITE, 1, topleft=(20, top + 18 * i))
+        for i, line in enumerate(lines)
+    ]
+
+def start_profiler(log_path=None):
+    # Frame profiler whose summaries include the input latency
+    global profiler
+    profiler = FrameProfiler(1.0 / FRAME_RATE, log_path=log_path, reports={'input_latency': controls.latency_report})
+
+def toggle_profiler_overlay():
+    # Profiling starts on first use, so builds can ship with it off
+    if profiler is None:
+        start_profiler()
+    profiler.overlay = not profiler.overlay
+
+class Session:
+    # What lasts across matches: the court layer, the renderer and the
+    # replay recorder
+    def __init__(self):
+        self.court = Court()
+        self.renderer = DirtyRectRenderer(self.court)
+        self.recorder = replay.ReplayRecorder() if RECORD_REPLAYS else None
+
+class Scene:
+    # One screen of the game, driven by run_scenes(). handle() and update()
+    # return the scene to continue with: self, or the next scene.
+    def enter(self):
+        pass
+
+    def handle(self, event):
+        return self
+
+    def update(self):
+        return self
+
+    def redraw(self):
+        # Draw the scene again after the display changed size
+        pass
+
+    def wait_time(self):
+        # Milliseconds the loop may sleep waiting for input before the next
+        # update(): None sleeps until input arrives, 0 does not wait
+        return None
+
+class MenuScene(Scene):
+    # Difficulty screen with a short time-based ball animation, then idle
+    # until SPACE starts the match
+    def __init__(self, session, difficulty):
+        self.session = session
+        self.difficulty = difficulty
+        self.started = None
+        self.animating = True
+
+    def enter(self):
+        draw_difficulty_screen(self.difficulty)
+        mark_first_frame()
+        self.started = time.perf_counter()
+
+    def handle(self, event):
+        if event.type == pygame.KEYDOWN:
+            if event.key == pygame.K_SPACE:
+                return PlayingScene(self.session, self.difficulty)
+            elif event.key == pygame.K_ESCAPE:
+                quit_game()
+        elif event.type == pygame.JOYBUTTONDOWN:
+            return PlayingScene(self.session, self.difficulty)
+        return self
+
+    def update(self):
+        if self.animating:
+            elapsed = time.perf_counter() - self.started
+            if elapsed >= INTRO_ANIMATION_TIME:
+                elapsed = INTRO_ANIMATION_TIME
+                self.animating = False
+            present([draw_intro_ball(elapsed)])
+        return self
+
+    def redraw(self):
+        draw_difficulty_screen(self.difficulty)
+        if not self.animating:
+            present([draw_intro_ball(INTRO_ANIMATION_TIME)])
+
+    def wait_time(self):
+        return 1000 // FRAME_RATE if self.animating else None
+
+class PlayingScene(Scene):
+    # A match: the simulation runs in fixed ticks and rendering
+    # interpolates between the last two of them, paced by the clock
+    def __init__(self, session, difficulty):
+        self.session = session
+        self.state = GameState(difficulty, balls=BALL_COUNT)
+        self.accumulator = 0.0
+        self.previous_time = None
+        self.frame_end = None
+
+    def enter(self):
+        session, state = self.session, self.state
+        if session.recorder:
+            flags = (replay.FLAG_PREDICTIVE_AI if state.predictive_ai else 0) | (replay.FLAG_HARD_AI if state.hard_ai else 0)
+            session.recorder.start_match(state.seed, state.difficulty, flags, len(state.balls))
+        if stats:
+            stats.start_match(state.difficulty, len(state.balls), state.seed)
+
+        # The menu covered the court, so the first frame is a full redraw
+        session.renderer.invalidate()
+        self.previous_time = self.frame_end = time.perf_counter()
+
+    def handle(self, event):
+        if event.type == pygame.KEYDOWN:
+            if event.key == PROFILER_KEY:
+                toggle_profiler_overlay()
+            elif event.key == CAPTURE_KEY:
+                save_capture()
+        return self
+
+    def poll(self):
+        # Input events that came in since run_scenes() took the queue
+        for event in controls.poll():
+            if handle_display_event(event):
+                self.redraw()
+            else:
+                self.handle(event)
+
+    def update(self):
+        session, state = self.session, self.state
+
+        # Newest input, read as late as possible: input events that came in
+        # since run_scenes() took the queue, then the held controls
+        self.poll()
+        inputs = controls.sample()
+        if profiler:
+            profiler.lap('events')
+
+        # Run as many ticks as the time since the last frame covers
+        now = time.perf_counter()
+        self.accumulator += min(now - self.previous_time, MAX_FRAME_TIME)
+        self.previous_time = now
+        ticks = 0
+        while self.accumulator >= SIM_DT and not state.is_over():
+            step(state, inputs)
+            ticks += 1
+            if session.recorder:
+                session.recorder.record_tick(inputs, state.ai_paddle.decision)
+                if profiler:
+                    profiler.lap('replay')
+            self.accumulator -= SIM_DT
+        alpha = min(self.accumulator / SIM_DT, 1.0)
+
+        # Check for game over
+        over = state.is_over()
+        if over:
+            alpha = 1.0
+
+        # Draw everything
+        draw_frame(session.court, session.renderer, state, alpha)
+        if ticks:
+            controls.frame_shown()
+
+        # Cap the frame rate
+        self.pace()
+        if profiler:
+            profiler.lap('wait')
+            profiler.end_frame()
+
+        if over:
+            if session.recorder:
+                session.recorder.end_match(state.player_paddle.score, state.ai_paddle.score)
+            if stats:
+                stats.end_match(state.player_paddle.score, state.ai_paddle.score, state.tick)
+            return GameOverScene(session, state)
+        return self
+
+    def pace(self):
+        # Sleep out the rest of the frame like clock.tick(FRAME_RATE), but
+        # in INPUT_POLL_INTERVAL slices, taking input events as they come
+        deadline = self.frame_end + 1 / FRAME_RATE
+        while True:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            time.sleep(min(remaining, INPUT_POLL_INTERVAL))
+            self.poll()
+        self.frame_end = time.perf_counter()
+
+    def redraw(self):
+        self.session.renderer.invalidate()
+
+    def wait_time(self):
+        return 0
+
+class GameOverScene(Scene):
+    # Result screen, idle until SPACE moves on to the next match
+    def __init__(self, session, state):
+        self.session = session
+        self.state = state
+
+    def enter(self):
+        player_score, ai_score = self.state.player_paddle.score, self.state.ai_paddle.score
+        audio.play('win' if player_score >= MAX_SCORE else 'lose')
+        draw_game_over(player_score, ai_score, self.state.difficulty)
+
+    def redraw(self):
+        draw_game_over(self.state.player_paddle.score, self.state.ai_paddle.score, self.state.difficulty)
+
+    def handle(self, event):
+        if event.type == pygame.KEYDOWN:
+            if event.key == pygame.K_SPACE:
+                return self.next_match()
+            elif event.key == pygame.K_ESCAPE:
+                quit_game()
+        elif event.type == pygame.JOYBUTTONDOWN:
+            return self.next_match()
+        return self
+
+    def next_match(self):
+        # If player won, the next match is a level up
+        return MenuScene(self.session, next_difficulty(self.state.difficulty, self.state.player_paddle.score))
+
+def save_capture():
+    # Write the last seconds of play as a clip in the background
+    if capture:
+        path = capture.save_clip()
+        if path:
+            print(f"Saving the last {capture.seconds:g} seconds to {path}")
+
+def quit_game(status=0):
+    # Close what writes in the background, then exit with status
+    if profiler:
+        profiler.close()
+    if capture:
+        capture.close()
+    if stats:
+        stats.close()
+    if session and session.recorder:
+        # Ticks of a match quit half way are kept, without a GAME_OVER
+        session.recorder.close()
+    pygame.quit()
+    sys.exit(status)
+
+def run_scenes(scene):
+    # The one game loop. Idle scenes sleep in pygame.event.wait until input
+    # or their next animation frame is due, so a menu left on screen uses
+    # next to no CPU; the playing scene paces itself with the clock.
+    scene.enter()
+    while True:
+        # Handle events
+        timeout = scene.wait_time()
+        if timeout is None:
+            events = [pygame.event.wait()]
+        elif timeout > 0:
+            events = [pygame.event.wait(timeout)]
+        else:
+            events = []
+        if profiler:
+            # Frames are timed from here, so the time an idle scene spent
+            # waiting is not charged to the match frame that follows it
+            profiler.begin_frame()
+        events += pygame.event.get()
+        for event in events:
             if event.type == pygame.QUIT:
-                pygame.quit()
-                sys.exit()
-            if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_SPACE:
-                    waiting = False
-                elif event.key == pygame.K_ESCAPE:
-                    pygame.quit()
-                    sys.exit()
+                quit_game()
+            if handle_display_event(event):
+                scene.redraw()
+                continue
+            controls.handle(event)
+            next_scene = scene.handle(event)
+            if next_scene is not scene:
+                scene = next_scene
+                scene.enter()
+
+        next_scene = scene.update()
+        if next_scene is not scene:
+            scene = next_scene
+            scene.enter()
+
+        # Play the sounds asked for this frame
+        audio.update()
 
 def main():
-    difficulty = 1  # Start at difficulty level 1
-    court = Court()
-
-    while True:
-        # Create game objects
-        player_paddle = Paddle(20, HEIGHT // 2 - PADDLE_HEIGHT // 2, PADDLE_WIDTH, PADDLE_HEIGHT, BLUE, PADDLE_SPEED)
-        ai_paddle = Paddle(WIDTH - 20 - PADDLE_WIDTH, HEIGHT // 2 - PADDLE_HEIGHT // 2, PADDLE_WIDTH, PADDLE_HEIGHT, RED, PADDLE_SPEED, is_ai=True)
-        ball = Ball(WIDTH // 2 - BALL_SIZE // 2, HEIGHT // 2 - BALL_SIZE // 2, BALL_SIZE, GREEN, BALL_SPEED)
-
-        # Show difficulty screen
-        show_difficulty_screen(difficulty)
-
-        # Font for score display
-        font = pygame.font.Font(None, 36)
-
-        # Main game loop
-        running = True
-        while running:
-            # Handle events
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    pygame.quit()
-                    sys.exit()
-
-            # Get keyboard state
-            keys = pygame.key.get_pressed()
-
-            # Player controls (Arrow Up, Arrow Down)
-            player_paddle.move(up=keys[pygame.K_UP], down=keys[pygame.K_DOWN])
-
-            # AI movement with current difficulty
-            ai_paddle.ai_move(ball, difficulty)
-
-            # Move the ball
-            point_scored = ball.move(player_paddle, ai_paddle)
-
-            # Check for collisions
-            ball.collide(player_paddle)
-            ball.collide(ai_paddle)
-
-            # Check for game over
-            if player_paddle.score >= MAX_SCORE or ai_paddle.score >= MAX_SCORE:
-                running = False
-
-            # Draw everything
-            screen.fill(BLACK)
-
-            # Draw the court with 3D effect
-            court.draw()
-
-            # Draw paddles and ball
-            player_paddle.draw()
-            ai_paddle.draw()
-            ball.draw()
-
-            # Draw scores with shadow for 3D effect
-            score_font = pygame.font.Font(None, 48)
-
-            # Player score
-            player_score_shadow = score_font.render(str(player_paddle.score), True, (50, 50, 50))
-            player_score_text = score_font.render(str(player_paddle.score), True, WHITE)
-            screen.blit(player_score_shadow, (WIDTH // 4 + 2, 22))
-            screen.blit(player_score_text, (WIDTH // 4, 20))
-
-            # AI score
-            ai_score_shadow = score_font.render(str(ai_paddle.score), True, (50, 50, 50))
-            ai_score_text = score_font.render(str(ai_paddle.score), True, WHITE)
-            screen.blit(ai_score_shadow, (3 * WIDTH // 4 + 2, 22))
-            screen.blit(ai_score_text, (3 * WIDTH // 4, 20))
-
-            # Draw player labels with 3D effect
-            label_font = pygame.font.Font(None, 36)
-
-            # Player label
-            player_label_shadow = label_font.render("YOU", True, (50, 50, 50))
-            player_label = label_font.render("YOU", True, BLUE)
-            screen.blit(player_label_shadow, (WIDTH // 4 - 18, 52))
-            screen.blit(player_label, (WIDTH // 4 - 20, 50))
-
-            # AI label
-            ai_label_shadow = label_font.render("AI", True, (50, 50, 50))
-            ai_label = label_font.render("AI", True, RED)
-            screen.blit(ai_label_shadow, (3 * WIDTH // 4 - 8, 52))
-            screen.blit(ai_label, (3 * WIDTH // 4 - 10, 50))
-
-            # Level indicator in center
-            level_shadow = label_font.render(f"LEVEL {difficulty}", True, (50, 50, 50))
-            level_text = label_font.render(f"LEVEL {difficulty}", True, YELLOW)
-            screen.blit(level_shadow, (WIDTH // 2 - level_text.get_width() // 2 + 2, 52))
-            screen.blit(level_text, (WIDTH // 2 - level_text.get_width() // 2, 50))
-
-            # Update the display
-            pygame.display.flip()
-
-            # Cap the frame rate
-            clock.tick(60)
-
-        # Game over, show results
-        show_game_over(player_paddle.score, ai_paddle.score, difficulty)
-
-        # If player won, increase difficulty for next level
-        if player_paddle.score >= MAX_SCORE:
-            if difficulty < 10:
-                difficulty += 1
+    global session
+    init()
+    session = Session()
+    # Start at difficulty level 1
+    run_scenes(MenuScene(session, 1))
 
 if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Pickle Ball - 3D Enhanced")
+    parser.add_argument('--startup-time', action='store_true', help="report the cold start time and exit")
+    parser.add_argument('--profile', nargs='?', const='profile.jsonl', metavar='PATH', help="profile frame times, appending a JSON summary per second to PATH")
+    parser.add_argument('--capture', nargs='?', type=float, const=5.0, metavar='SECONDS', help="keep the last SECONDS of play (default 5) for F9 to save as a clip")
+    parser.add_argument('--balls', type=int, default=BALL_COUNT, metavar='N', help="balls in play at once (multi-ball mode)")
+    parser.add_argument('--hard', action='store_true', help="play the hard AI, which aims its returns away from you")
+    parser.add_argument('--player', help="name to record match statistics under (default: your login name)")
+    parser.add_argument('--fullscreen', action='store_true', help="start fullscreen at the display's resolution (F11 switches)")
+    parser.add_argument('--window', default=f"{WIDTH}x{HEIGHT}", metavar='WxH', help="starting window size, e.g. 1280x720 (the window can be resized)")
+    parser.add_argument('--render-divisor', type=int, default=RENDER_DIVISOR, metavar='N', help="draw at 1/N of the output resolution and scale up, e.g. 2 on slow hardware")
+    args = parser.parse_args()
+    if not 1 <= args.balls <= replay.MAX_BALLS:
+        parser.error(f"--balls must be between 1 and {replay.MAX_BALLS}")
+    if args.render_divisor < 1:
+        parser.error("--render-divisor must be 1 or more")
+    try:
+        WINDOW_SIZE = tuple(int(side) for side in args.window.lower().split('x'))
+    except ValueError:
+        WINDOW_SIZE = ()
+    if len(WINDOW_SIZE) != 2 or min(WINDOW_SIZE) < 1:
+        parser.error("--window must be WIDTHxHEIGHT, e.g. 1280x720")
+    FULLSCREEN = args.fullscreen
+    RENDER_DIVISOR = args.render_divisor
+    measure_startup = args.startup_time
+    BALL_COUNT = args.balls
+    HARD_AI = args.hard
+    if args.profile:
+        start_profiler(args.profile)
+    if args.capture:
+        capture = FrameCapture(args.capture, FRAME_RATE)
+    if RECORD_STATS:
+        stats = StatsRecorder(player=args.player)
     main()
\ No newline at end of file
@@ -0,0 +1,104 @@
+# Frame-time profiler for the Pickle Ball game loop
+#
+# The loop calls lap(phase) as each phase finishes; the time since the
+# previous lap is charged to that phase, so one perf_counter() call per
+# phase boundary accounts for the whole frame. Phases that run once per
+# simulation tick (player, ai, ball, replay) add up over the frame. Each
+# finished frame goes into a rolling window per phase, from which the
+# p50/p95/p99 summary is worked out every `log_interval` frames and
+# optionally appended to a JSON lines file.
+#
+# The game keeps pickle_ball.profiler set to None unless profiling is on,
+# and guards every lap with `if profiler:`, so a disabled profiler costs
+# one global lookup per phase.
+
+import json
+import time
+from collections import deque
+
+# Frame phases in loop order
+PHASES = ('events', 'player', 'ai', 'ball', 'replay', 'court', 'entities', 'hud', 'overlay', 'display', 'capture', 'wait')
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+class FrameProfiler:
+    def __init__(self, budget, window=600, log_path=None, log_interval=60, reports=None):
+        # budget is the frame time target in seconds; a frame that takes n
+        # budgets counts n - 1 dropped frames. reports maps names to
+        # functions whose results go into each summary under that name.
+        self.budget = budget
+        self.reports = reports or {}
+        self.samples = {name: deque(maxlen=window) for name in PHASES + ('frame',)}
+        self.current = dict.fromkeys(PHASES, 0.0)
+        self.frames = 0
+        self.dropped = 0
+        self.started = time.perf_counter()
+        self.frame_start = self.last = self.started
+        self.log_interval = log_interval
+        self.log = open(log_path, 'a', buffering=1) if log_path else None
+
+        # Latest summary, and a counter bumped whenever it changes so the
+        # overlay is only pushed to the display when its text does
+        self.summary = None
+        self.revision = 0
+        self.overlay = False
+
+    def begin_frame(self):
+        self.frame_start = self.last = time.perf_counter()
+
+    def lap(self, phase):
+        now = time.perf_counter()
+        self.current[phase] += now - self.last
+        self.last = now
+
+    def end_frame(self):
+        frame_time = self.last - self.frame_start
+        current = self.current
+        samples = self.samples
+        for phase in PHASES:
+            samples[phase].append(current[phase])
+            current[phase] = 0.0
+        samples['frame'].append(frame_time)
+
+        self.frames += 1
+        missed = int(frame_time / self.budget + 0.5) - 1
+        if missed > 0:
+            self.dropped += missed
+
+        if self.frames % self.log_interval == 0:
+            self.summary = self.summarize()
+            self.revision += 1
+            if self.log:
+                self.log.write(json.dumps(self.summary) + '\n')
+
+    def summarize(self):
+        # Rolling percentiles in milliseconds for the frame and each phase
+        timings = {}
+        for name, values in self.samples.items():
+            if values:
+                values = sorted(values)
+                timings[name] = {
+                    'p50': round(percentile(values, 0.5) * 1000, 3),
+                    'p95': round(percentile(values, 0.95) * 1000, 3),
+                    'p99': round(percentile(values, 0.99) * 1000, 3),
+                }
+        frame_times = self.samples['frame']
+        summary = {
+            'time': round(time.perf_counter() - self.started, 3),
+            'frames': self.frames,
+            'dropped': self.dropped,
+            'fps': round(len(frame_times) / sum(frame_times), 1) if frame_times and sum(frame_times) else None,
+            'frame': timings.pop('frame', None),
+            'phases': timings,
+        }
+        for name, report in self.reports.items():
+            summary[name] = report()
+        return summary
+
+    def close(self):
+        if self.log:
+            self.log.close()
+            self.log = None
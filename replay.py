@@ -0,0 +1,356 @@
+# Compact binary match replays for Pickle Ball
+#
+# Every match is re-simulated from its seed, difficulty and per-tick input,
+# so a replay costs about one byte per tick instead of video. A session file
+# is an append-only stream of chunks after a short header:
+#
+#   header      b'PBRP', u16 version
+#   chunk       u8 type, u32 match id, u32 payload length, payload
+#   MATCH_START u64 seed, u8 difficulty, u8 flags, u16 balls, f64 unix time
+#   TICKS       one byte per tick: bits 0-1 player INPUT_UP/INPUT_DOWN,
+#               bits 2-3 the AI paddle's decision from Paddle.ai_move,
+#               bits 4-6 the player's analog speed (0 for full speed)
+#   GAME_OVER   u16 player score, u16 AI score, u32 ticks, f64 unix time
+#
+# A sidecar index (<session>.idx) holds one fixed-size record per
+# MATCH_START and GAME_OVER chunk (u8 type, u32 match id, u64 offset), so
+# a long session can be listed and seeked without decoding the ticks.
+#
+# Usage: python replay.py SESSION [MATCH] [--speed X] [--skip] [--capture [SECONDS]]
+
+import os
+import sys
+import time
+import struct
+import argparse
+import itertools
+from array import array
+from collections import namedtuple
+
+MAGIC = b'PBRP'
+# Bumped whenever the simulation rules change, since replays re-simulate
+# (2: swept ball collisions, 3: match flags, 4: multi-ball)
+VERSION = 4
+HEADER = struct.Struct('<4sH')
+CHUNK = struct.Struct('<BII')
+MATCH_START_DATA = struct.Struct('<QBBHd')
+GAME_OVER_DATA = struct.Struct('<HHId')
+INDEX_RECORD = struct.Struct('<BxxxIQ')
+
+MATCH_START, TICKS, GAME_OVER = 1, 2, 3
+
+# MATCH_START flags: game options that change the simulation. The hard
+# AI's search depends on the clock, so its matches replay the AI's
+# recorded moves instead of re-running it.
+FLAG_PREDICTIVE_AI = 1
+FLAG_HARD_AI = 2
+
+# Most balls a recorded match can have
+MAX_BALLS = 0xFFFF
+
+# Ticks buffered in memory before they are appended as one chunk
+FLUSH_TICKS = 600
+
+REPLAY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "replays")
+
+MatchInfo = namedtuple('MatchInfo', 'match_id seed difficulty flags balls started offset player_score ai_score ticks ended')
+
+
+class ReplayError(Exception):
+    pass
+
+
+def create_session(directory=REPLAY_DIR):
+    # Create a new session file named after the current time, with a
+    # number added if another game started one in the same second, and
+    # return its path and the file open for appending
+    os.makedirs(directory, exist_ok=True)
+    base = os.path.join(directory, time.strftime("session-%Y%m%d-%H%M%S"))
+    for number in itertools.count(1):
+        path = base + ('.pbr' if number == 1 else f'-{number}.pbr')
+        try:
+            return path, open(path, 'xb')
+        except FileExistsError:
+            pass
+
+
+def pack_tick(inputs, ai_decision):
+    return inputs | ai_decision << 2
+
+
+def unpack_tick(value):
+    # Player input bits and AI decision bits
+    return value & 0x73, value >> 2 & 3
+
+
+class ReplayRecorder:
+    # Records to the session file at path, or without one to a new session
+    # in REPLAY_DIR. Nothing is created on disk until the first match
+    # starts, so a game quit from the menu leaves no empty session behind.
+    def __init__(self, path=None, flush_ticks=FLUSH_TICKS):
+        self.path = path
+        self.flush_ticks = flush_ticks
+        self.file = None
+        self.index_file = None
+        self.next_match_id = 0
+
+        self.match_id = None
+        self.ticks = array('B')
+        self.tick_count = 0
+
+    def open(self):
+        if self.path is None:
+            self.path, self.file = create_session()
+        else:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self.file = open(self.path, 'ab')
+        if self.file.tell() == 0:
+            self.file.write(HEADER.pack(MAGIC, VERSION))
+
+        # Continue the match numbering of an existing session
+        self.index_file = open(self.path + '.idx', 'ab')
+        self.next_match_id = sum(1 for record in read_index(self.path + '.idx') if record[0] == MATCH_START)
+
+    def write_chunk(self, chunk_type, payload, indexed=False):
+        offset = self.file.tell()
+        self.file.write(CHUNK.pack(chunk_type, self.match_id, len(payload)))
+        self.file.write(payload)
+        if indexed:
+            self.index_file.write(INDEX_RECORD.pack(chunk_type, self.match_id, offset))
+
+    def start_match(self, seed, difficulty, flags=0, balls=1):
+        # A match that never reached game over is left without a GAME_OVER
+        if self.file is None:
+            self.open()
+        self.flush_ticks_chunk()
+        self.match_id = self.next_match_id
+        self.next_match_id += 1
+        self.tick_count = 0
+        self.write_chunk(MATCH_START, MATCH_START_DATA.pack(seed, difficulty, flags, balls, time.time()), indexed=True)
+        return self.match_id
+
+    def record_tick(self, inputs, ai_decision):
+        self.ticks.append(pack_tick(inputs, ai_decision))
+        self.tick_count += 1
+        if len(self.ticks) >= self.flush_ticks:
+            self.flush_ticks_chunk()
+
+    def flush_ticks_chunk(self):
+        if self.ticks:
+            self.write_chunk(TICKS, self.ticks.tobytes())
+            self.ticks = array('B')
+
+    def end_match(self, player_score, ai_score):
+        if self.match_id is None:
+            return
+        self.flush_ticks_chunk()
+        self.write_chunk(GAME_OVER, GAME_OVER_DATA.pack(player_score, ai_score, self.tick_count, time.time()), indexed=True)
+        self.match_id = None
+
+        # A finished match is always on disk, even if the game crashes later
+        self.file.flush()
+        self.index_file.flush()
+
+    def close(self):
+        if self.file is None:
+            return
+        self.flush_ticks_chunk()
+        self.file.close()
+        self.index_file.close()
+
+
+def read_index(index_path):
+    # All (type, match id, offset) records of an index file
+    try:
+        with open(index_path, 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return []
+    usable = len(data) - len(data) % INDEX_RECORD.size
+    return list(INDEX_RECORD.iter_unpack(data[:usable]))
+
+
+class ReplayReader:
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        magic, version = HEADER.unpack(self.file.read(HEADER.size))
+        if magic != MAGIC:
+            raise ReplayError(f"{path} is not a replay file")
+        if version != VERSION:
+            raise ReplayError(f"Unsupported replay version {version}")
+
+    def close(self):
+        self.file.close()
+
+    def read_chunk_at(self, offset):
+        self.file.seek(offset)
+        header = self.file.read(CHUNK.size)
+        if len(header) < CHUNK.size:
+            return None
+        chunk_type, match_id, length = CHUNK.unpack(header)
+        payload = self.file.read(length)
+        if len(payload) < length:
+            return None
+        return chunk_type, match_id, payload, offset + CHUNK.size + length
+
+    def scan(self):
+        # Walk chunk headers without decoding tick payloads, for files
+        # whose index is missing
+        records = []
+        offset = HEADER.size
+        while True:
+            self.file.seek(offset)
+            header = self.file.read(CHUNK.size)
+            if len(header) < CHUNK.size:
+                break
+            chunk_type, match_id, length = CHUNK.unpack(header)
+            if chunk_type != TICKS:
+                records.append((chunk_type, match_id, offset))
+            offset += CHUNK.size + length
+        return records
+
+    def matches(self):
+        # MatchInfo for every match in the session, from the index
+        records = read_index(self.path + '.idx') or self.scan()
+        matches = {}
+        for chunk_type, match_id, offset in records:
+            chunk = self.read_chunk_at(offset)
+            if chunk is None:
+                continue
+            payload = chunk[2]
+            if chunk_type == MATCH_START:
+                seed, difficulty, flags, balls, started = MATCH_START_DATA.unpack(payload)
+                matches[match_id] = MatchInfo(match_id, seed, difficulty, flags, balls, started, offset, None, None, None, None)
+            elif chunk_type == GAME_OVER and match_id in matches:
+                player_score, ai_score, ticks, ended = GAME_OVER_DATA.unpack(payload)
+                matches[match_id] = matches[match_id]._replace(player_score=player_score, ai_score=ai_score, ticks=ticks, ended=ended)
+        return [matches[match_id] for match_id in sorted(matches)]
+
+    def read_match(self, match_id):
+        # MatchInfo and the packed tick bytes of one match
+        for info in self.matches():
+            if info.match_id == match_id:
+                break
+        else:
+            raise ReplayError(f"No match {match_id} in {self.path}")
+
+        ticks = bytearray()
+        offset = info.offset
+        while True:
+            chunk = self.read_chunk_at(offset)
+            if chunk is None:
+                break
+            chunk_type, chunk_match, payload, offset = chunk
+            if chunk_match != match_id:
+                # Matches are recorded one after another, never interleaved
+                if chunk_type == MATCH_START:
+                    break
+                continue
+            if chunk_type == TICKS:
+                ticks += payload
+            elif chunk_type == GAME_OVER:
+                break
+        return info, bytes(ticks)
+
+
+def new_state(info, game):
+    # Fresh GameState set up like the recorded match
+    return game.GameState(
+        info.difficulty, seed=info.seed, predictive_ai=bool(info.flags & FLAG_PREDICTIVE_AI),
+        balls=info.balls, hard_ai=bool(info.flags & FLAG_HARD_AI),
+    )
+
+
+def replay_ticks(state, ticks, game, verify=True):
+    # Re-simulate packed ticks on a fresh GameState, yielding after each
+    # one. With verify, the AI's decisions must match the recording.
+    for tick, value in enumerate(ticks):
+        inputs, ai_decision = unpack_tick(value)
+        game.step(state, inputs, opponent_inputs=ai_decision if state.hard_ai else None)
+        if verify and state.ai_paddle.decision != ai_decision:
+            raise ReplayError(f"Replay diverged at tick {tick}")
+        yield state
+
+
+def skip_to_end(info, ticks, verify=True):
+    # Headless playback: re-simulate the whole match with no drawing
+    import pickle_ball as game
+    state = new_state(info, game)
+    for state in replay_ticks(state, ticks, game, verify):
+        pass
+    return state
+
+
+def play(info, ticks, speed=1.0):
+    # Watch a match in the game window at speed times real time
+    import pygame
+    import pickle_ball as game
+    game.init_display()
+    state = new_state(info, game)
+    court = game.Court()
+    renderer = game.DirtyRectRenderer(court)
+    playback = replay_ticks(state, ticks, game)
+
+    accumulator = 0.0
+    previous_time = time.perf_counter()
+    finished = False
+    while not finished:
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE):
+                return state
+            if event.type == pygame.KEYDOWN and event.key == game.CAPTURE_KEY:
+                game.save_capture()
+            game.handle_display_event(event)
+
+        now = time.perf_counter()
+        accumulator += min(now - previous_time, game.MAX_FRAME_TIME) * speed
+        previous_time = now
+        while accumulator >= game.SIM_DT:
+            if next(playback, None) is None:
+                finished = True
+                break
+            accumulator -= game.SIM_DT
+
+        game.draw_frame(court, renderer, state, 1.0 if finished else min(accumulator / game.SIM_DT, 1.0))
+        game.clock.tick(game.FRAME_RATE)
+    return state
+
+
+def main():
+    parser = argparse.ArgumentParser(description="List or play back recorded Pickle Ball matches")
+    parser.add_argument('session', help="replay session file")
+    parser.add_argument('match', nargs='?', type=int, help="match to play back")
+    parser.add_argument('--speed', type=float, default=1.0, help="playback speed multiplier")
+    parser.add_argument('--skip', action='store_true', help="re-simulate to the end without drawing")
+    parser.add_argument('--capture', nargs='?', type=float, const=5.0, metavar='SECONDS', help="keep the last SECONDS of playback (default 5) for F9 to save as a clip")
+    args = parser.parse_args()
+
+    reader = ReplayReader(args.session)
+    if args.match is None:
+        for info in reader.matches():
+            result = "unfinished" if info.ticks is None else f"{info.player_score}-{info.ai_score} in {info.ticks} ticks"
+            balls = f", {info.balls} balls" if info.balls > 1 else ""
+            hard = ", hard AI" if info.flags & FLAG_HARD_AI else ""
+            print(f"match {info.match_id}: level {info.difficulty}{balls}{hard}, {time.ctime(info.started)}, {result}")
+        return
+
+    info, ticks = reader.read_match(args.match)
+    if args.skip:
+        start = time.perf_counter()
+        state = skip_to_end(info, ticks)
+        elapsed = time.perf_counter() - start
+        print(f"match {info.match_id}: {state.player_paddle.score}-{state.ai_paddle.score} after {state.tick} ticks ({elapsed:.2f}s)")
+    else:
+        import pickle_ball as game
+        if args.capture:
+            game.capture = game.FrameCapture(args.capture, game.FRAME_RATE)
+        try:
+            play(info, ticks, args.speed)
+        finally:
+            if game.capture:
+                game.capture.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
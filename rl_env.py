@@ -0,0 +1,221 @@
+# Reinforcement learning environments for Pickle Ball
+#
+# Gym-style reset(seed) / step(action) wrappers around the game rules, for
+# training paddle controllers stronger than the chaser in Paddle.ai_move.
+# The agent plays the left (player) paddle against the game's AI; its
+# action each step is 0 (stay), 1 (up) or 2 (down), the same bits as
+# INPUT_UP/INPUT_DOWN. A point won scores +1 reward, a point lost -1, and
+# an episode is one match to MAX_SCORE.
+#
+# PickleBallEnv runs one match on the game classes (GameState and step),
+# so it can render pixel observations. VectorEnv steps many matches per
+# call on batch_sim.BatchSimulator, which follows the same rules tick for
+# tick with NumPy arrays; finished matches restart straight away. Both play
+# against the chasing AI one tick at a time, so a policy trained on one
+# faces the same opponent on the other; PickleBallEnv(predictive_ai=True)
+# swaps in the predicting AI, which BatchSimulator does not have.
+#
+# Observations are float32 state vectors of OBSERVATION_SIZE values: ball
+# x and y, ball x and y speed, player paddle top and AI paddle top, scaled
+# to about -1..1. With pixels=True, PickleBallEnv also returns the frame as
+# a (WIDTH, HEIGHT, 3) uint8 array indexed [x, y], a zero-copy view of the
+# render surface from pygame.surfarray.pixels3d. A view keeps its surface
+# locked, which blits refuse, so frames alternate between two surfaces:
+# an observation may be held while the next step runs, but must be copied
+# to keep it any longer.
+#
+# Usage: python rl_env.py [--envs 4096] [--steps 1000]
+
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+# Keep pygame's banner out of reports written to stdout
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+import pygame
+import pickle_ball as game
+from batch_sim import BatchSimulator, MAX_BALL_SPEED
+
+ACTIONS = 3
+OBSERVATION_SIZE = 6
+OBSERVATION_SCALE = np.array([
+    1 / game.WIDTH, 1 / game.HEIGHT,
+    1 / MAX_BALL_SPEED, 1 / MAX_BALL_SPEED,
+    1 / game.HEIGHT, 1 / game.HEIGHT,
+], dtype=np.float32)
+
+
+class PickleBallEnv:
+    def __init__(self, difficulty=5, predictive_ai=False, frame_skip=1, max_ticks=None, pixels=False):
+        # frame_skip ticks pass per step with the action held; max_ticks
+        # ends an episode early (info['truncated'])
+        self.difficulty = difficulty
+        self.predictive_ai = predictive_ai
+        self.frame_skip = frame_skip
+        self.max_ticks = max_ticks
+        self.pixels = pixels
+        self.state = None
+        self.court = None
+        # Render surfaces and the views handed out of them, see render
+        self.surfaces = None
+        self.views = [None, None]
+        self.current = 0
+
+    def reset(self, seed=None):
+        self.state = game.GameState(self.difficulty, seed=seed, predictive_ai=self.predictive_ai, hard_ai=False)
+        return self.observe()
+
+    def step(self, action):
+        # (observation, reward, done, info)
+        state = self.state
+        player_score, ai_score = state.player_paddle.score, state.ai_paddle.score
+        for _ in range(self.frame_skip):
+            if state.is_over():
+                break
+            game.step(state, action)
+        reward = (state.player_paddle.score - player_score) - (state.ai_paddle.score - ai_score)
+        truncated = self.max_ticks is not None and state.tick >= self.max_ticks and not state.is_over()
+        info = {
+            'player_score': state.player_paddle.score,
+            'ai_score': state.ai_paddle.score,
+            'tick': state.tick,
+            'truncated': truncated,
+        }
+        return self.observe(), reward, state.is_over() or truncated, info
+
+    def observe(self):
+        state = self.state
+        ball = state.ball
+        vector = np.array([
+            ball.x, ball.y, ball.speed_x, ball.speed_y,
+            state.player_paddle.rect.y, state.ai_paddle.rect.y,
+        ], dtype=np.float32)
+        vector *= OBSERVATION_SCALE
+        if self.pixels:
+            return {'state': vector, 'pixels': self.render()}
+        return vector
+
+    def render(self):
+        # Draw the court, paddles and balls off-screen (no HUD, no display
+        # update) and return a view of the pixels
+        if game.screen is None:
+            # Training runs have no window to show
+            os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+            game.init_display()
+        display = game.screen
+        if self.surfaces is None:
+            self.court = game.Court()
+            self.surfaces = [display.copy(), display.copy()]
+
+        # Draw on the surface the previous observation is not using
+        self.current ^= 1
+        surface = self.surfaces[self.current]
+        self.views[self.current] = None
+        game.screen = surface
+        try:
+            self.court.draw()
+            state = self.state
+            state.player_paddle.draw()
+            state.ai_paddle.draw()
+            for ball in state.balls:
+                ball.draw()
+        finally:
+            game.screen = display
+        view = self.views[self.current] = pygame.surfarray.pixels3d(surface)
+        return view
+
+    def close(self):
+        self.views = [None, None]
+        self.surfaces = None
+
+
+class VectorEnv:
+    def __init__(self, count, difficulty=5, frame_skip=1, max_ticks=None):
+        self.count = count
+        self.difficulty = difficulty
+        self.frame_skip = frame_skip
+        self.max_ticks = max_ticks
+        self.sim = None
+        self.ticks = None
+
+    def reset(self, seed=None):
+        self.sim = BatchSimulator(self.count, self.difficulty, seed=seed)
+        self.ticks = np.zeros(self.count, dtype=np.int64)
+        return self.observe()
+
+    def step(self, actions):
+        # (observations, rewards, dones, info) for an array of actions, one
+        # per environment. Environments that are done have already been
+        # restarted, so their observation is the first of the next match.
+        sim = self.sim
+        actions = np.asarray(actions)
+        up = (actions & game.INPUT_UP) != 0
+        down = (actions & game.INPUT_DOWN) != 0
+        player_score, ai_score = sim.player_score.copy(), sim.ai_score.copy()
+        for _ in range(self.frame_skip):
+            sim.step(up, down)
+        rewards = ((sim.player_score - player_score) - (sim.ai_score - ai_score)).astype(np.float32)
+        self.ticks += self.frame_skip
+
+        dones = sim.done.copy()
+        truncated = np.zeros(self.count, dtype=bool)
+        if self.max_ticks is not None:
+            truncated = (self.ticks >= self.max_ticks) & ~dones
+            dones |= truncated
+        info = {'player_score': sim.player_score.copy(), 'ai_score': sim.ai_score.copy(), 'truncated': truncated}
+
+        finished = np.flatnonzero(dones)
+        if len(finished):
+            sim.restart(finished)
+            self.ticks[finished] = 0
+        return self.observe(), rewards, dones, info
+
+    def observe(self):
+        sim = self.sim
+        vectors = np.empty((self.count, OBSERVATION_SIZE), dtype=np.float32)
+        vectors[:, 0] = sim.ball_x
+        vectors[:, 1] = sim.ball_y
+        vectors[:, 2] = sim.speed_x
+        vectors[:, 3] = sim.speed_y
+        vectors[:, 4] = sim.player_y
+        vectors[:, 5] = sim.ai_y
+        vectors *= OBSERVATION_SCALE
+        return vectors
+
+
+def chase_action(observation):
+    # Scripted policy for the benchmark: keep the paddle level with the ball
+    ball_y = observation[..., 1] * game.HEIGHT + game.BALL_SIZE / 2
+    paddle_y = observation[..., 4] * game.HEIGHT + game.PADDLE_HEIGHT / 2
+    return np.where(ball_y < paddle_y - game.PADDLE_SPEED, 1, np.where(ball_y > paddle_y + game.PADDLE_SPEED, 2, 0))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the environment step rates")
+    parser.add_argument('--envs', type=int, default=4096, help="environments in the vectorized run")
+    parser.add_argument('--steps', type=int, default=1000, help="steps per run")
+    parser.add_argument('--pixels', action='store_true', help="also time the single environment with pixel observations")
+    args = parser.parse_args()
+
+    runs = [('single', PickleBallEnv(), 1, args.steps)]
+    if args.pixels:
+        runs.append(('single, pixels', PickleBallEnv(pixels=True), 1, args.steps // 10))
+    runs.append((f"vector x{args.envs}", VectorEnv(args.envs), args.envs, args.steps))
+
+    for name, env, count, steps in runs:
+        observation = env.reset(seed=0)
+        start = time.perf_counter()
+        for _ in range(steps):
+            vector = observation['state'] if isinstance(observation, dict) else observation
+            observation, _, done, _ = env.step(chase_action(vector) if count > 1 else int(chase_action(vector)))
+            if count == 1 and done:
+                observation = env.reset()
+        elapsed = time.perf_counter() - start
+        rate = steps * count / elapsed
+        print(f"{name:<16} {rate:>14,.0f} steps/s {rate * 3600 / 1e6:>10,.0f}M steps/hour")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
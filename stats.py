@@ -0,0 +1,250 @@
+# Match statistics store for Pickle Ball
+#
+# Every match played is kept in a SQLite database (stats.db) in WAL mode:
+# one row per match with its level and final score, one per rally with its
+# length and the ball's top speed, and one per paddle hit with where on the
+# paddle the ball struck. The game only ever puts rows on a queue; a
+# background writer thread takes them off in batches and writes each batch
+# in one transaction, so the game loop never waits on the disk. The
+# database and the thread are only started with the first match, so a game
+# quit from the menu or a --startup-time run leaves no files behind.
+#
+# Rows are linked to their match on the writer thread, which handles them
+# in order: rallies and hits belong to the last match started.
+#
+# Win rates per level and the leaderboards read level_totals, one row per
+# player and level kept up to date by a trigger as each match finishes, so
+# they cost the same over millions of matches as over ten. The longest
+# rallies come straight from the rallies_by_hits index.
+#
+# Usage: python stats.py [DATABASE] [--level N] [--top N]
+
+import os
+import sys
+import time
+import queue
+import sqlite3
+import getpass
+import argparse
+import threading
+
+STATS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "stats.db")
+# Most rows written in one transaction, and the longest a row waits on the
+# queue for others to share its transaction
+BATCH_ROWS = 1000
+BATCH_WAIT = 0.5
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS matches (
+    id INTEGER PRIMARY KEY,
+    played_at REAL NOT NULL,
+    player TEXT NOT NULL,
+    difficulty INTEGER NOT NULL,
+    balls INTEGER NOT NULL,
+    seed INTEGER NOT NULL,
+    -- NULL until the match is finished
+    player_score INTEGER,
+    ai_score INTEGER,
+    won INTEGER,
+    ticks INTEGER
+);
+
+-- Finished matches and wins of each player at each level
+CREATE TABLE IF NOT EXISTS level_totals (
+    difficulty INTEGER NOT NULL,
+    player TEXT NOT NULL,
+    matches INTEGER NOT NULL,
+    wins INTEGER NOT NULL,
+    PRIMARY KEY (difficulty, player)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS level_totals_by_wins ON level_totals (difficulty, wins);
+
+CREATE TRIGGER IF NOT EXISTS count_finished_match
+AFTER UPDATE OF won ON matches WHEN old.won IS NULL AND new.won IS NOT NULL
+BEGIN
+    INSERT INTO level_totals VALUES (new.difficulty, new.player, 1, new.won)
+    ON CONFLICT (difficulty, player) DO UPDATE SET matches = matches + 1, wins = wins + excluded.wins;
+END;
+
+-- winner and side are 0 for the player, 1 for the AI
+CREATE TABLE IF NOT EXISTS rallies (
+    match_id INTEGER NOT NULL REFERENCES matches (id),
+    number INTEGER NOT NULL,
+    winner INTEGER NOT NULL,
+    hits INTEGER NOT NULL,
+    peak_speed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS rallies_by_hits ON rallies (hits);
+
+-- offset is where the ball's center met the paddle: -1 at its top edge,
+-- 1 at its bottom edge, a little beyond for balls clipping a corner
+CREATE TABLE IF NOT EXISTS hits (
+    match_id INTEGER NOT NULL REFERENCES matches (id),
+    side INTEGER NOT NULL,
+    offset REAL NOT NULL,
+    speed REAL NOT NULL
+);
+"""
+
+
+def connect(path):
+    connection = sqlite3.connect(path)
+    connection.execute("PRAGMA journal_mode=WAL")
+    # In WAL mode a commit is safe against crashes of the process without
+    # waiting for an fsync
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.executescript(SCHEMA)
+    return connection
+
+
+class StatsRecorder:
+    def __init__(self, path=STATS_PATH, player=None):
+        self.path = path
+        self.player = player or getpass.getuser()
+        # Paddle hits and top speed of each ball's rally in progress
+        self.rallies = {}
+        self.rally_count = 0
+
+        self.rows = queue.Queue()
+        self.writer = None
+        self.written = 0
+
+    def open(self):
+        self.writer = threading.Thread(target=self.write_rows, name="stats-writer", daemon=True)
+        self.writer.start()
+
+    def start_match(self, difficulty, balls, seed):
+        if self.writer is None:
+            self.open()
+        self.rallies.clear()
+        self.rally_count = 0
+        self.rows.put(('match', (time.time(), self.player, difficulty, balls, seed)))
+
+    def hit(self, ball, paddle):
+        # A paddle has just sent the ball back
+        ball_center = ball.y + ball.rect.height / 2
+        offset = (ball_center - paddle.rect.centery) / (paddle.rect.height / 2)
+        speed = abs(ball.speed_x)
+        side = 0 if ball.speed_x > 0 else 1
+        self.rows.put(('hit', (side, offset, speed)))
+        rally = self.rallies.get(ball)
+        if rally is None:
+            self.rallies[ball] = [1, speed]
+        else:
+            rally[0] += 1
+            rally[1] = max(rally[1], speed)
+
+    def point(self, ball, winner):
+        # The ball went out, winner is 'player' or 'ai'
+        hits, peak_speed = self.rallies.pop(ball, (0, 0.0))
+        peak_speed = max(peak_speed, abs(ball.speed_x))
+        self.rally_count += 1
+        self.rows.put(('rally', (self.rally_count, 0 if winner == 'player' else 1, hits, peak_speed)))
+
+    def end_match(self, player_score, ai_score, ticks):
+        self.rows.put(('end', (player_score, ai_score, int(player_score > ai_score), ticks)))
+
+    def write_rows(self):
+        connection = connect(self.path)
+        match_id = None
+        running = True
+        while running:
+            batch = [self.rows.get()]
+            deadline = time.perf_counter() + BATCH_WAIT
+            while batch[-1] is not None and len(batch) < BATCH_ROWS:
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self.rows.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            if batch[-1] is None:
+                batch.pop()
+                running = False
+
+            try:
+                with connection:
+                    for kind, values in batch:
+                        if kind == 'match':
+                            match_id = connection.execute(
+                                "INSERT INTO matches (played_at, player, difficulty, balls, seed) VALUES (?, ?, ?, ?, ?)",
+                                values).lastrowid
+                        elif match_id is None:
+                            continue
+                        elif kind == 'hit':
+                            connection.execute("INSERT INTO hits VALUES (?, ?, ?, ?)", (match_id,) + values)
+                        elif kind == 'rally':
+                            connection.execute("INSERT INTO rallies VALUES (?, ?, ?, ?, ?)", (match_id,) + values)
+                        else:
+                            connection.execute(
+                                "UPDATE matches SET player_score = ?, ai_score = ?, won = ?, ticks = ? WHERE id = ?",
+                                values + (match_id,))
+                self.written += len(batch)
+            except sqlite3.Error as error:
+                print(f"Could not save match statistics to {self.path}: {error}", file=sys.stderr)
+        connection.close()
+
+    def close(self):
+        # Write everything still queued
+        if self.writer is None:
+            return
+        self.rows.put(None)
+        self.writer.join()
+
+
+def win_rates(connection):
+    # (difficulty, matches, wins) of every level played, finished matches
+    # only
+    return connection.execute(
+        "SELECT difficulty, SUM(matches), SUM(wins) FROM level_totals "
+        "GROUP BY difficulty ORDER BY difficulty").fetchall()
+
+
+def leaderboard(connection, difficulty, limit=10):
+    # (player, matches, wins) at one level, most wins first
+    return connection.execute(
+        "SELECT player, matches, wins FROM level_totals WHERE difficulty = ? "
+        "ORDER BY wins DESC LIMIT ?", (difficulty, limit)).fetchall()
+
+
+def longest_rallies(connection, limit=10):
+    # (hits, peak speed, player, difficulty, played at) of the longest
+    # rallies ever played
+    return connection.execute(
+        "SELECT rallies.hits, rallies.peak_speed, matches.player, matches.difficulty, matches.played_at "
+        "FROM rallies JOIN matches ON matches.id = rallies.match_id "
+        "ORDER BY rallies.hits DESC LIMIT ?", (limit,)).fetchall()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show win rates and leaderboards from recorded matches")
+    parser.add_argument('database', nargs='?', default=STATS_PATH, help="statistics database (default: stats.db)")
+    parser.add_argument('--level', type=int, help="show the leaderboard of this level only")
+    parser.add_argument('--top', type=int, default=10, help="entries per leaderboard")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.database):
+        print(f"No statistics recorded yet ({args.database} not found)")
+        return 1
+    connection = connect(args.database)
+    rates = win_rates(connection)
+    print("Level  Matches   Wins  Win rate")
+    for difficulty, matches, wins in rates:
+        print(f"{difficulty:>5} {matches:>8} {wins:>6} {wins / matches:>9.0%}")
+
+    levels = [args.level] if args.level is not None else [difficulty for difficulty, _, _ in rates]
+    for difficulty in levels:
+        print(f"\nLevel {difficulty} leaderboard")
+        for rank, (player, matches, wins) in enumerate(leaderboard(connection, difficulty, args.top), 1):
+            print(f"{rank:>3}. {player:<20} {wins:>6} wins of {matches}")
+
+    print("\nLongest rallies")
+    for hits, peak_speed, player, difficulty, played_at in longest_rallies(connection, args.top):
+        when = time.strftime("%Y-%m-%d %H:%M", time.localtime(played_at))
+        print(f"{hits:>5} hits  top speed {peak_speed:>5.1f}  {player} at level {difficulty}, {when}")
+    connection.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,219 @@
+# Headless tournament runner for difficulty calibration
+#
+# Plays many matches per difficulty level between the game's AI and a
+# scripted player, spread over all cores with a process pool. The scripted
+# player aims like the predictive AI (Paddle.intercept) at a fixed skill, so
+# the only thing that changes between levels is the opponent. Every match
+# gets a seed derived from --seed, the level and its number, so a run can be
+# reproduced exactly.
+#
+# Per level it reports the player's and AI's win rates, rally lengths
+# (paddle hits per point), points per minute of game time and the game time
+# to MAX_SCORE. --campaigns also follows the level progression of main()
+# from level 1 and reports how many matches each level took (JSON only;
+# the CSV format has one row per level).
+#
+# Usage: python tournament.py [--matches N] [--levels 1-10] [--format json|csv]
+
+import os
+import sys
+import csv
+import json
+import time
+import random
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+# Keep pygame's banner out of reports written to stdout
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+import pickle_ball as game
+
+# Ten minutes of game time; longer matches are reported as unfinished
+MAX_TICKS = game.SIM_HZ * 60 * 10
+
+CSV_FIELDS = [
+    'level', 'matches', 'player_win_rate', 'ai_win_rate', 'unfinished',
+    'rally_mean', 'rally_p50', 'rally_p90', 'points_per_minute',
+    'match_seconds_mean', 'match_seconds_p50', 'match_seconds_p90',
+]
+
+
+def match_seed(base_seed, level, index):
+    # Stable across runs and platforms, unlike hash()
+    return random.Random(f"{base_seed}:{level}:{index}").getrandbits(32)
+
+
+def scripted_inputs(state, skill):
+    # Player input bits that move the player paddle toward its target for
+    # the current volley, aiming like the predictive AI at level `skill`
+    paddle = state.player_paddle
+    target_y = paddle.intercept(state.ball, skill)
+    if paddle.rect.y < target_y - paddle.speed / 2:
+        return game.INPUT_DOWN
+    if paddle.rect.y > target_y + paddle.speed / 2:
+        return game.INPUT_UP
+    return 0
+
+
+def play_match(job):
+    # One headless match: (level, seed, player skill, max ticks, ticks the
+    # player holds each input) in, summary dict out
+    level, seed, skill, max_ticks, step_ticks = job
+    state = game.GameState(level, seed=seed, predictive_ai=True)
+    ball = state.ball
+    dt = step_ticks * game.SIM_DT
+    rallies = []
+    volley = ball.volley
+    while not state.is_over() and state.tick < max_ticks:
+        if game.step(state, scripted_inputs(state, skill), dt):
+            # Ball.volley counts the paddle hits plus the serve that followed
+            rallies.append(ball.volley - volley - 1)
+            volley = ball.volley
+    return {
+        'level': level,
+        'seed': seed,
+        'player_score': state.player_paddle.score,
+        'ai_score': state.ai_paddle.score,
+        'ticks': state.tick,
+        'finished': state.is_over(),
+        'rallies': rallies,
+    }
+
+
+def play_campaign(job):
+    # Follow main()'s progression from level 1: a win moves up a level, a
+    # loss replays it. Returns the matches played at each level.
+    seed, skill, max_matches, max_ticks, step_ticks = job
+    difficulty = 1
+    played = {}
+    for index in range(max_matches):
+        result = play_match((difficulty, match_seed(seed, difficulty, index), skill, max_ticks, step_ticks))
+        played[difficulty] = played.get(difficulty, 0) + 1
+        if result['player_score'] >= game.MAX_SCORE and difficulty == game.MAX_DIFFICULTY:
+            break
+        difficulty = game.next_difficulty(difficulty, result['player_score'])
+    return played
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def mean(values):
+    return sum(values) / len(values) if values else None
+
+
+def summarize(level, results):
+    # Per-level report row from the match summaries of one level
+    finished = [result for result in results if result['finished']]
+    rallies = [rally for result in results for rally in result['rallies']]
+    points = sum(result['player_score'] + result['ai_score'] for result in results)
+    minutes = sum(result['ticks'] for result in results) / game.SIM_HZ / 60
+    seconds = [result['ticks'] / game.SIM_HZ for result in finished]
+    return {
+        'level': level,
+        'matches': len(results),
+        'player_win_rate': sum(result['player_score'] >= game.MAX_SCORE for result in results) / len(results),
+        'ai_win_rate': sum(result['ai_score'] >= game.MAX_SCORE for result in results) / len(results),
+        'unfinished': len(results) - len(finished),
+        'rally_mean': mean(rallies),
+        'rally_p50': percentile(rallies, 0.5),
+        'rally_p90': percentile(rallies, 0.9),
+        'points_per_minute': points / minutes if minutes else None,
+        'match_seconds_mean': mean(seconds),
+        'match_seconds_p50': percentile(seconds, 0.5),
+        'match_seconds_p90': percentile(seconds, 0.9),
+    }
+
+
+def run_tournament(levels, matches, seed=0, skill=5, max_ticks=MAX_TICKS, step_ticks=1, workers=None, campaigns=0, max_matches=100, timings=None):
+    # timings, if given, gets the wall time in seconds of the level matches
+    # ('levels') and of the campaigns ('campaigns'), kept out of the report
+    # so that stays the same from run to run
+    jobs = [(level, match_seed(seed, level, index), skill, max_ticks, step_ticks) for level in levels for index in range(matches)]
+    timings = {} if timings is None else timings
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # Big chunks keep the per-match pickling overhead small
+        start = time.perf_counter()
+        chunksize = max(1, len(jobs) // ((workers or os.cpu_count() or 1) * 8))
+        by_level = {level: [] for level in levels}
+        for result in executor.map(play_match, jobs, chunksize=chunksize):
+            by_level[result['level']].append(result)
+        timings['levels'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        campaign_jobs = [(match_seed(seed, 0, index), skill, max_matches, max_ticks, step_ticks) for index in range(campaigns)]
+        campaign_results = list(executor.map(play_campaign, campaign_jobs))
+        timings['campaigns'] = time.perf_counter() - start
+
+    report = {
+        'seed': seed,
+        'player_skill': skill,
+        'step_ticks': step_ticks,
+        'levels': [summarize(level, by_level[level]) for level in levels],
+    }
+    if campaigns:
+        # Mean matches played at each level per campaign
+        report['campaign_matches_per_level'] = {
+            level: sum(played.get(level, 0) for played in campaign_results) / campaigns
+            for level in range(1, game.MAX_DIFFICULTY + 1)
+        }
+    return report
+
+
+def parse_levels(text):
+    # "1-10", "3" or "1,4,7"
+    levels = []
+    for part in text.split(','):
+        low, _, high = part.partition('-')
+        levels.extend(range(int(low), int(high or low) + 1))
+    return levels
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run headless AI vs scripted player matches per difficulty level")
+    parser.add_argument('--matches', type=int, default=200, help="matches per level")
+    parser.add_argument('--levels', type=parse_levels, default=list(range(1, game.MAX_DIFFICULTY + 1)), help="levels to play, e.g. 1-10 or 2,5,8")
+    parser.add_argument('--seed', type=int, default=0, help="base seed for the match seeds")
+    parser.add_argument('--player-skill', type=int, default=5, help="aiming skill of the scripted player, 1-10")
+    parser.add_argument('--max-ticks', type=int, default=MAX_TICKS, help="ticks before a match counts as unfinished")
+    parser.add_argument('--step-ticks', type=int, default=1, help="ticks the scripted player holds each input for (the simulation still runs tick by tick)")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument('--campaigns', type=int, default=0, help="also play this many level 1-10 campaigns")
+    parser.add_argument('--campaign-matches', type=int, default=100, help="matches before a campaign gives up")
+    parser.add_argument('--format', choices=['json', 'csv'], default='json', help="csv has the per-level rows only, so it cannot take --campaigns")
+    parser.add_argument('--output', help="write the report here instead of stdout")
+    args = parser.parse_args()
+    if args.campaigns and args.format == 'csv':
+        parser.error("--campaigns results only fit the json format")
+
+    timings = {}
+    report = run_tournament(
+        args.levels, args.matches, args.seed, args.player_skill, args.max_ticks,
+        args.step_ticks, args.workers, args.campaigns, args.campaign_matches, timings,
+    )
+    total = args.matches * len(args.levels)
+    elapsed = timings['levels']
+    print(f"{total} matches in {elapsed:.1f}s ({total / elapsed:.1f} matches/s)", file=sys.stderr)
+    if args.campaigns:
+        print(f"{args.campaigns} campaigns in {timings['campaigns']:.1f}s", file=sys.stderr)
+
+    output = open(args.output, 'w', newline='') if args.output else sys.stdout
+    try:
+        if args.format == 'json':
+            json.dump(report, output, indent=2)
+            output.write('\n')
+        else:
+            writer = csv.DictWriter(output, fieldnames=CSV_FIELDS)
+            writer.writeheader()
+            writer.writerows(report['levels'])
+    finally:
+        if args.output:
+            output.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())